@@ -0,0 +1,148 @@
+import logging
+import threading
+import time
+
+DEFAULT_ALERT_CONFIG = {
+    # Seconds without detections before a label can alert again
+    "debounce": 2.0,
+    # Seconds during which new alerts of a session merge into one action
+    "coalesce": 0.5,
+    # Actions per second allowed per session, and burst size
+    "rate": 0.2,
+    "burst": 3,
+}
+
+
+class TokenBucket(object):
+    """
+    Token bucket rate limiter
+    """
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._tokens = self.burst
+        self._last = time.monotonic()
+
+    def take(self, now=None):
+        now = time.monotonic() if now is None else now
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+
+class SessionAlerts(object):
+    """
+    Class used to store the alert state and counters of a session
+    """
+    def __init__(self, config):
+        self.config = config
+        self.bucket = TokenBucket(config["rate"], config["burst"])
+        self.last_seen = {}
+        self.window = None
+        self.window_timer = None
+        self.received = 0
+        self.debounced = 0
+        self.coalesced = 0
+        self.rate_limited = 0
+        self.executed = 0
+
+
+class AlertScheduler(object):
+    """
+    Sits between the alert signals and the actions they trigger
+
+    For every (session, label) a detection only starts a new alert after
+    the label has been quiet for the debounce window, so a person standing
+    in frame raises one alert instead of one per emission. New alerts of a
+    session that start within the coalesce window are merged into a single
+    action, and actions are rate limited by a token bucket per session.
+    """
+    def __init__(self, action, config=None):
+        """
+        Parameters
+        ----------
+        action : callable
+            Called as action(session, events) with the list of
+            (label, event) tuples merged into the alert
+        config : dict
+            Per session overrides of DEFAULT_ALERT_CONFIG
+        """
+        self._action = action
+        self._config = config or {}
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def submit(self, session, label, event, timestamp=None):
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        with self._lock:
+            state = self._session(session)
+            state.received += 1
+            last_seen = state.last_seen.get(label)
+            state.last_seen[label] = timestamp
+            if last_seen is not None and timestamp - last_seen < state.config["debounce"]:
+                state.debounced += 1
+                return
+            if state.window is not None:
+                state.window.append((label, event))
+                state.coalesced += 1
+                return
+            state.window = [(label, event)]
+            if state.config["coalesce"] > 0:
+                state.window_timer = threading.Timer(state.config["coalesce"], self._flush, (session,))
+                state.window_timer.daemon = True
+                state.window_timer.start()
+                return
+        self._flush(session)
+
+    def flush(self):
+        """
+        Runs the pending coalesced alerts of every session right away
+        """
+        with self._lock:
+            sessions = [s for s, state in self._sessions.items() if state.window is not None]
+        for session in sessions:
+            self._flush(session)
+
+    def stats(self):
+        with self._lock:
+            return {
+                session: {
+                    "received": state.received,
+                    "debounced": state.debounced,
+                    "coalesced": state.coalesced,
+                    "rate_limited": state.rate_limited,
+                    "suppressed": state.debounced + state.coalesced + state.rate_limited,
+                    "executed": state.executed,
+                }
+                for session, state in self._sessions.items()
+            }
+
+    def _session(self, session):
+        state = self._sessions.get(session)
+        if state is None:
+            config = dict(DEFAULT_ALERT_CONFIG)
+            config.update(self._config.get(session, {}))
+            state = self._sessions[session] = SessionAlerts(config)
+        return state
+
+    def _flush(self, session):
+        with self._lock:
+            state = self._sessions[session]
+            events, state.window = state.window, None
+            if state.window_timer:
+                state.window_timer.cancel()
+                state.window_timer = None
+            if not events:
+                return
+            if not state.bucket.take():
+                state.rate_limited += 1
+                logging.info("Alert of session {} rate limited".format(session))
+                return
+            state.executed += 1
+        try:
+            self._action(session, events)
+        except Exception:
+            logging.exception("Alert action of session {} failed".format(session))
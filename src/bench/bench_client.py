@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Client-side benchmark suite against the fake gstd
+
+Runs the gstd clients and the alert path against a local FakeGstd, so no
+gstd or target hardware is needed:
+  * command throughput and p50/p99 latency of gstc.client, sequential
+    and through unordered batches, of pygstd.GSTD and of AsyncClient
+  * large responses, from 1 KiB to 10 MiB
+  * introspection reads with and without the client cache, with a
+    pipeline created and deleted every hundred reads
+  * resilience, with injected error codes and dropped connections
+  * alert throughput, from gstd signals through the SignalDispatcher to
+    the AlertScheduler actions
+
+Before the benchmarks, every client runs a few commands once and the
+run stops with a non-zero exit status if any of them fails; --smoke
+runs only these checks.
+
+Results are written as JSON. Given a baseline file from a previous run,
+every metric is compared and the regressions beyond the threshold are
+reported, with a non-zero exit status.
+
+Run from the src directory:
+    python3 -m bench.bench_client [--output results.json] [--baseline old.json] [--smoke]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import sys
+import time
+
+from gst import gstc
+from gst import pygstd
+from gst.dispatcher import SignalDispatcher
+from gst.fakegstd import FakeGstd
+import alerts
+
+PIPE = "bench"
+PIPE_DESC = "videotestsrc is-live=true ! queue name=queue ! inferencealert name=alert ! fakesink"
+KiB = 1024
+MiB = 1024 * KiB
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def summary(latencies, elapsed):
+    return {
+        "calls": len(latencies),
+        "ops_per_s": len(latencies) / elapsed if elapsed else None,
+        "p50_ms": percentile(latencies, 50) * 1e3,
+        "p99_ms": percentile(latencies, 99) * 1e3,
+    }
+
+
+def timed_calls(call, calls):
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(calls):
+        t0 = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - t0)
+    return summary(latencies, time.perf_counter() - start)
+
+
+def make_client(server, pool_size=4):
+    client = gstc.client('127.0.0.1', server.port, pool_size=pool_size)
+    client.pipeline_create(PIPE, PIPE_DESC)
+    return client
+
+
+def bench_sync(calls, latency):
+    with FakeGstd(latency=latency) as server:
+        client = make_client(server)
+        result = timed_calls(lambda: client.pipeline_play(PIPE), calls)
+        client.close()
+    return result
+
+
+def bench_batch(calls, latency, pool_size):
+    with FakeGstd(latency=latency) as server:
+        client = make_client(server, pool_size)
+        commands = [['read', '/pipelines/%s/state' % PIPE]] * calls
+        start = time.perf_counter()
+        results = client.execute_many(commands, ordered=False)
+        elapsed = time.perf_counter() - start
+        client.close()
+    return {
+        "calls": calls,
+        "pool_size": pool_size,
+        "ops_per_s": calls / elapsed,
+        "errors": sum(1 for r in results if r['code'] != 0),
+    }
+
+
+def bench_pygstd(calls, latency):
+    with FakeGstd(latency=latency) as server:
+        client = pygstd.GSTD('127.0.0.1', server.port)
+        client.pipeline_create(PIPE, PIPE_DESC)
+        result = timed_calls(lambda: client.pipeline_play(PIPE), calls)
+        client.pipeline_delete(PIPE)
+        client.pipes = []
+    return result
+
+
+def bench_async(calls, latency, concurrency):
+    async def run(port):
+        async with gstc.AsyncClient('127.0.0.1', port, pool_size=concurrency) as client:
+            await client.pipeline_create(PIPE, PIPE_DESC)
+            latencies = []
+
+            async def worker(count):
+                for _ in range(count):
+                    t0 = time.perf_counter()
+                    await client.pipeline_play(PIPE)
+                    latencies.append(time.perf_counter() - t0)
+
+            start = time.perf_counter()
+            await asyncio.gather(*[worker(calls // concurrency) for _ in range(concurrency)])
+            result = summary(latencies, time.perf_counter() - start)
+            await client.pipeline_delete(PIPE)
+        return result
+
+    with FakeGstd(latency=latency) as server:
+        result = asyncio.run(run(server.port))
+    result["concurrency"] = concurrency
+    return result
+
+
+def bench_large(sizes, calls):
+    results = {}
+    for size in sizes:
+        with FakeGstd(response_size={'read': size}) as server:
+            client = make_client(server)
+            result = timed_calls(lambda: client.read('/pipelines/%s/state' % PIPE), calls)
+            client.close()
+        result["mb_per_s"] = size * result["ops_per_s"] / MiB
+        results["%dKiB" % (size // KiB)] = result
+    return results
+
+
+def bench_introspection(calls, latency, churn=100):
+    results = {}
+    for name, cache_ttl in (("uncached", None), ("cached", 5.0)):
+        with FakeGstd(latency=latency) as server:
+            client = gstc.client('127.0.0.1', server.port, cache_ttl=cache_ttl)
+            client.pipeline_create(PIPE, PIPE_DESC)
+            reads = [
+                lambda: client.list_pipelines(),
+                lambda: client.list_elements(PIPE),
+                lambda: client.list_properties(PIPE, 'queue'),
+                lambda: client.read('/pipelines/%s/elements/queue/properties/max-size-buffers' % PIPE),
+            ]
+            count = [0]
+
+            def call():
+                count[0] += 1
+                # Dashboards see pipelines come and go
+                if count[0] % churn == 0:
+                    client.pipeline_create('churn', PIPE_DESC)
+                    client.pipeline_delete('churn')
+                reads[count[0] % len(reads)]()
+            results[name] = timed_calls(call, calls)
+            if client.cache:
+                results[name]["hit_ratio"] = client.cache_stats()["hit_ratio"]
+            client.close()
+    return results
+
+
+def bench_resilience(calls, failure_rate, disconnect_rate):
+    # Commands fail on their own, pipeline_create must succeed
+    with FakeGstd(failure_rate={'pipeline_play': failure_rate},
+                  disconnect_rate={'pipeline_play': disconnect_rate}, seed=1) as server:
+        client = make_client(server)
+        codes = []
+        result = timed_calls(lambda: codes.append(client.pipeline_play(PIPE)), calls)
+        stats = client.pool_stats()
+        client.close()
+        result.update({
+            "failure_rate": failure_rate,
+            "disconnect_rate": disconnect_rate,
+            "errors": sum(1 for code in codes if code != 0),
+            "reconnects": stats["reconnects"],
+            "injected_failures": server.failures,
+            "injected_disconnects": server.disconnects,
+        })
+    return result
+
+
+def bench_alerts(duration, interval):
+    # Debounce, coalescing and rate limiting off: every signal is an action
+    config = {"debounce": 0.0, "coalesce": 0.0, "rate": 1e9, "burst": 1e9}
+    scheduler = alerts.AlertScheduler(lambda session, events: None, {"bench": config})
+    with FakeGstd(signal_interval=interval) as server:
+        client = make_client(server)
+        dispatcher = SignalDispatcher('127.0.0.1', server.port, queue_size=1024)
+        dispatcher.watch(PIPE, "alert", "alert",
+                         lambda key, ret: scheduler.submit("bench", "person", ret, ret["timestamp"]))
+        dispatcher.start()
+        time.sleep(duration)
+        dispatcher.stop()
+        emitted = server.emitted
+        client.close()
+    stats = scheduler.stats().get("bench", {})
+    watch = dispatcher.stats()
+    return {
+        "signals_emitted": emitted,
+        "signals_per_s": emitted / duration,
+        "actions_executed": stats.get("executed", 0),
+        "actions_per_s": stats.get("executed", 0) / duration,
+        "dispatcher": watch,
+    }
+
+
+def smoke():
+    """
+    Runs a few commands with every client, returns the failures
+    """
+    failures = []
+
+    def check(name, call, expected=0):
+        try:
+            result = call()
+        except Exception as e:
+            result = e
+        if result != expected:
+            failures.append("%s returned %r, expected %r" % (name, result, expected))
+
+    async def async_commands(port):
+        async with gstc.AsyncClient('127.0.0.1', port) as client:
+            return [await client.pipeline_create(PIPE, PIPE_DESC), await client.pipeline_play(PIPE),
+                    await client.list_pipelines(), await client.pipeline_delete(PIPE)]
+
+    with FakeGstd() as server:
+        for cache_ttl in (None, 5.0):
+            client = gstc.client('127.0.0.1', server.port, cache_ttl=cache_ttl)
+            check("client.pipeline_create", lambda: client.pipeline_create(PIPE, PIPE_DESC))
+            check("client.list_pipelines", lambda: client.list_pipelines(), [{"name": PIPE}])
+            check("client.pipeline_delete", lambda: client.pipeline_delete(PIPE))
+            client.close()
+        check("AsyncClient", lambda: asyncio.run(async_commands(server.port)), [0, 0, [{"name": PIPE}], 0])
+        gstd = pygstd.GSTD('127.0.0.1', server.port)
+        check("pygstd.pipeline_create", lambda: gstd.pipeline_create("pygstd", PIPE_DESC), [0, "Success"])
+        check("pygstd.pipeline_delete", lambda: gstd.pipeline_delete("pygstd"), [0, "Success"])
+        gstd.pipes = []
+    return failures
+
+
+def run(args):
+    calls = args.calls
+    results = {
+        "sync": bench_sync(calls, 0.0),
+        "sync_1ms": bench_sync(calls // 10, 0.001),
+        "batch_1ms": bench_batch(calls, 0.001, 8),
+        "pygstd": bench_pygstd(calls, 0.0),
+        "async": bench_async(calls, 0.0, 8),
+        "async_1ms": bench_async(calls, 0.001, 8),
+        "large_responses": bench_large([KiB, 64 * KiB, MiB, 10 * MiB], max(calls // 100, 5)),
+        "introspection_1ms": bench_introspection(calls // 10, 0.001),
+        "resilience": bench_resilience(calls, 0.05, 0.01),
+        "alerts": bench_alerts(args.alert_duration, 0.0),
+    }
+    return {
+        "meta": {
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "calls": calls,
+        },
+        "results": results,
+    }
+
+
+def flatten(results, prefix=''):
+    flat = {}
+    for key, value in results.items():
+        name = prefix + key
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(baseline, current, threshold):
+    """
+    Returns the metrics that got worse than the baseline by more than
+    threshold (a fraction). Rates are better higher, times lower, any
+    other metric is informative only.
+    """
+    old, new = flatten(baseline["results"]), flatten(current["results"])
+    regressions = []
+    for name in sorted(set(old) & set(new)):
+        if not old[name]:
+            continue
+        change = (new[name] - old[name]) / old[name]
+        if name.endswith('_per_s'):
+            worse = -change
+        elif name.endswith('_ms'):
+            worse = change
+        else:
+            continue
+        if worse > threshold:
+            regressions.append({"metric": name, "baseline": old[name], "current": new[name],
+                                "change": change})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--calls', type=int, default=2000)
+    parser.add_argument('--alert-duration', type=float, default=3.0)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='JSON results of a previous run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative change reported as a regression')
+    parser.add_argument('--smoke', action='store_true', help='only check that every client works')
+    args = parser.parse_args()
+
+    # The clients log every injected failure
+    logging.getLogger('GSTD').disabled = True
+    failures = smoke()
+    for failure in failures:
+        print("FAILED " + failure)
+    if failures:
+        sys.exit(1)
+    if args.smoke:
+        return
+    current = run(args)
+    if args.output:
+        with open(args.output, 'w') as results_file:
+            json.dump(current, results_file, indent=2)
+    print(json.dumps(current["results"], indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(baseline, current, args.threshold)
+        for regression in regressions:
+            print("REGRESSION {metric}: {baseline:.4g} -> {current:.4g} ({change:+.1%})".format(**regression))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
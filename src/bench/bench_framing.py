@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark of the gstd response framing
+
+Streams NUL terminated responses from 1 KB to 10 MB through a socket
+pair and measures how fast they are split by gst.framing compared to
+the previous concatenate-and-rescan loop (without its 8 KB cap, which
+would truncate everything above that).
+
+Run from the src directory:
+    python3 -m bench.bench_framing [--repeat N] [--read-size BYTES]
+"""
+import argparse
+import socket
+import threading
+import time
+
+from gst.framing import ResponseFramer, default_read_size, terminator
+
+SIZES = [1 << 10, 16 << 10, 256 << 10, 1 << 20, 10 << 20]
+
+
+def legacy_recv(sock, read_size):
+    buf = b''
+    while True:
+        newbuf = sock.recv(read_size)
+        if not newbuf:
+            return None
+        if terminator in newbuf:
+            return buf + newbuf[:newbuf.find(terminator)]
+        buf += newbuf
+
+
+def stream(size, repeat, read_size, receive):
+    payload = b'a' * size + terminator
+    reader, writer = socket.socketpair()
+    sender = threading.Thread(target=lambda: [writer.sendall(payload) for _ in range(repeat)])
+    start = time.perf_counter()
+    sender.start()
+    for _ in range(repeat):
+        msg = receive(reader)
+        assert len(msg) == size
+    elapsed = time.perf_counter() - start
+    sender.join()
+    reader.close()
+    writer.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--read-size', type=int, default=default_read_size)
+    parser.add_argument('--skip-legacy', action='store_true')
+    args = parser.parse_args()
+
+    print('%10s %14s %14s' % ('size', 'framer MB/s', 'legacy MB/s'))
+    for size in SIZES:
+        framer = ResponseFramer(args.read_size)
+        elapsed = stream(size, args.repeat, args.read_size, framer.recv)
+        framer_rate = size * args.repeat / elapsed / 1e6
+        legacy_rate = float('nan')
+        if not args.skip_legacy:
+            # the legacy loop receives 1 KiB chunks and must not share leftovers
+            elapsed = stream(size, 1, 1024, lambda s: legacy_recv(s, 1024))
+            legacy_rate = size / elapsed / 1e6
+        print('%10d %14.1f %14.1f' % (size, framer_rate, legacy_rate))
+
+
+if __name__ == '__main__':
+    main()
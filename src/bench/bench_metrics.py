@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Overhead benchmark of the gstd client instrumentation
+
+Measures the cost of a ClientMetrics begin()/end() pair on its own, and
+the per call latency of gstc.client against a local echo server with
+the metrics enabled and disabled.
+
+Run from the src directory:
+    python3 -m bench.bench_metrics [--calls N]
+"""
+import argparse
+import json
+import socket
+import threading
+import time
+
+from gst import gstc
+from gst.metrics import ClientMetrics
+
+
+def echo_server():
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(8)
+
+    def handle(conn):
+        while True:
+            data = conn.recv(65536)
+            if not data:
+                break
+            conn.sendall(b'{"code": 0, "description": "Success", "response": null}\x00')
+        conn.close()
+
+    def accept():
+        while True:
+            conn, _ = server.accept()
+            threading.Thread(target=handle, args=(conn,), daemon=True).start()
+
+    threading.Thread(target=accept, daemon=True).start()
+    return server.getsockname()[1]
+
+
+def bench_observe(calls):
+    metrics = ClientMetrics()
+    start = time.perf_counter()
+    for _ in range(calls):
+        metrics.end('pipeline_play', metrics.begin(), 24, 60)
+    return (time.perf_counter() - start) / calls
+
+
+def bench_client(port, calls, metrics):
+    client = gstc.client('127.0.0.1', port, metrics=metrics)
+    client.pipeline_play('p0')
+    start = time.perf_counter()
+    for _ in range(calls):
+        client.pipeline_play('p0')
+    elapsed = (time.perf_counter() - start) / calls
+    client.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--calls', type=int, default=20000)
+    args = parser.parse_args()
+
+    port = echo_server()
+    off = bench_client(port, args.calls, False)
+    on = bench_client(port, args.calls, True)
+    print(json.dumps({
+        'observe_us': bench_observe(args.calls * 10) * 1e6,
+        'call_without_metrics_us': off * 1e6,
+        'call_with_metrics_us': on * 1e6,
+        'overhead_us': (on - off) * 1e6,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
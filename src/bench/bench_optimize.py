@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+FPS and CPU comparison of the conversion collapsing
+
+Runs bench.bench_profile twice, with the pipelines as the fragments build
+them and with the redundant conversions collapsed, each in its own
+process so the interpipe nodes of one run never meet the other. Reports
+the conversions removed per frame and the change in FPS and CPU.
+
+Run from the src directory, see bench.bench_profile for the requirements:
+    python3 -m bench.bench_optimize [--sessions N] [--duration SECONDS]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+
+def profile(args, optimize):
+    with tempfile.TemporaryDirectory() as directory:
+        output = os.path.join(directory, "result.json")
+        command = [sys.executable, "-m", "bench.bench_profile", "--sessions", str(args.sessions),
+                   "--delay", str(args.delay), "--duration", str(args.duration), "--output", output]
+        if optimize:
+            command.append("--optimize")
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        with open(output) as result_file:
+            return json.load(result_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=1)
+    parser.add_argument('--delay', type=float, default=0.03)
+    parser.add_argument('--duration', type=float, default=10.0)
+    args = parser.parse_args()
+
+    original = profile(args, False)
+    optimized = profile(args, True)
+    print(json.dumps({
+        "conversions_removed": optimized["conversions_removed"],
+        "fps": {name: {"original": fps, "optimized": optimized["fps"][name]}
+                for name, fps in original["fps"].items()},
+        "cpu_percent": {"original": original["cpu_percent"], "optimized": optimized["cpu_percent"]},
+        "cpu_saved_percent": original["cpu_percent"] - optimized["cpu_percent"],
+        "failed": original["failed"] or optimized["failed"],
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+CPU-only end-to-end benchmark of the demo topology
+
+Builds the session and shared inference pipelines of main.py with the
+software platform profile (videotestsrc, vp8enc/vp8dec, videoconvert,
+jpegenc, fakesink and an identity stand-in for the net) and runs them in
+process under MediaEngine, interpipes included. The first session gets
+the inference output, as the scheduler does for the session it serves.
+
+With --optimize the redundant conversions are collapsed first, see
+bench.bench_optimize for the comparison.
+
+Reports the end-to-end FPS at every session output and the inference
+output, the latency of each branch (matched by buffer timestamp between
+a pad probe at its head and one at its tail) and the process CPU usage.
+
+Run from the src directory with GStreamer, gst-interpipe and the VP8
+plugins installed:
+    python3 -m bench.bench_profile [--sessions N] [--delay SECONDS] [--duration SECONDS] [--optimize]
+"""
+import argparse
+import collections
+import json
+import os
+import threading
+import time
+
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst, GLib
+
+from gst import description
+from gst.pygst import MediaEngine
+from bench.bench_sessions import make_sessions
+import inference
+import main as demo
+
+
+class BranchProbe(object):
+    """
+    Measures the time buffers take from the head to the tail element of
+    a branch. Buffers dropped in between are forgotten after max_pending.
+    """
+    def __init__(self, head, tail, max_pending=256):
+        self.latencies = []
+        self._pending = collections.OrderedDict()
+        self._max_pending = max_pending
+        self._lock = threading.Lock()
+        head.get_static_pad("sink").add_probe(Gst.PadProbeType.BUFFER, self._on_head)
+        tail.get_static_pad("src").add_probe(Gst.PadProbeType.BUFFER, self._on_tail)
+
+    def reset(self):
+        with self._lock:
+            self.latencies = []
+
+    def _on_head(self, pad, info):
+        pts = info.get_buffer().pts
+        if pts != Gst.CLOCK_TIME_NONE:
+            with self._lock:
+                self._pending[pts] = time.perf_counter()
+                while len(self._pending) > self._max_pending:
+                    self._pending.popitem(last=False)
+        return Gst.PadProbeReturn.OK
+
+    def _on_tail(self, pad, info):
+        now = time.perf_counter()
+        with self._lock:
+            # Payloaders split a frame, only its first packet counts
+            start = self._pending.pop(info.get_buffer().pts, None)
+            if start is not None:
+                self.latencies.append(now - start)
+        return Gst.PadProbeReturn.OK
+
+    def summary(self):
+        with self._lock:
+            latencies = sorted(self.latencies)
+        if not latencies:
+            return None
+        return {
+            "frames": len(latencies),
+            "p50_ms": latencies[len(latencies) // 2] * 1e3,
+            "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1e3,
+        }
+
+
+def counters(engine, sessions):
+    frames = {test_name: engine.get_element(demo.session_names(test_name)["live"], "encode_rate").get_property("out")
+              for test_name in sessions}
+    frames[inference.INFERENCE_PIPE] = engine.get_element(
+        inference.INFERENCE_PIPE, inference.INFERENCE_FPS).get_property("frames-rendered")
+    return frames
+
+
+def run(count, delay, duration, warmup, config, optimize=False):
+    with open(config) as json_file:
+        template = next(iter(json.load(json_file).values()))
+    params = make_sessions(template, count)
+    sessions = list(params)
+
+    fragments = demo.profile_fragments("software", delay)
+    pipes = [demo.build_inference(sessions, fragments)]
+    pipes += [demo.build_test(test_name, params, fragments)[0] for test_name in sessions]
+    report = description.OptimizeReport()
+    if optimize:
+        pipes = [(name, description.optimize(desc, report)) for name, desc in pipes]
+
+    Gst.init(None)
+    loop = GLib.MainLoop()
+    engine = MediaEngine("profile", loop)
+    for name, desc in pipes:
+        engine.create_pipe(name, desc)
+
+    served = demo.session_names(sessions[0])
+    engine.get_element(served["live"], served["output"]).set_property("listen-to", inference.INFERENCE_OUTPUT)
+    probes = {
+        "decode": BranchProbe(engine.get_element(served["live"], "depay"),
+                              engine.get_element(served["live"], served["decodesink"])),
+        "net": BranchProbe(engine.get_element(inference.INFERENCE_PIPE, "net_queue"),
+                           engine.get_element(inference.INFERENCE_PIPE, "net")),
+        "bypass": BranchProbe(engine.get_element(inference.INFERENCE_PIPE, "bypass_queue"),
+                              engine.get_element(inference.INFERENCE_PIPE, "overlay_rate")),
+        "encode": BranchProbe(engine.get_element(served["live"], "encode_queue"),
+                              engine.get_element(served["live"], "pay")),
+    }
+
+    thread = threading.Thread(target=loop.run, daemon=True)
+    thread.start()
+    for name, _ in pipes:
+        engine.play_pipe(name)
+
+    time.sleep(warmup)
+    for probe in probes.values():
+        probe.reset()
+    start_frames = counters(engine, sessions)
+    start_cpu, start = time.process_time(), time.perf_counter()
+    time.sleep(duration)
+    cpu, elapsed = time.process_time() - start_cpu, time.perf_counter() - start
+    end_frames = counters(engine, sessions)
+    supervision = engine.stats()
+
+    for name, _ in pipes:
+        engine.stop_pipe(name)
+    loop.quit()
+    thread.join()
+
+    return {
+        "sessions": count,
+        "inference_delay_s": delay,
+        "failed": any(pipe["faults"] for pipe in supervision.values()),
+        "faults": {name: pipe["last_error"] for name, pipe in supervision.items() if pipe["faults"]},
+        "optimized": optimize,
+        "conversions_removed": report.as_dict(),
+        "fps": {name: (end_frames[name] - start_frames[name]) / elapsed for name in end_frames},
+        "latency": {name: probe.summary() for name, probe in probes.items()},
+        "cpu_cores": cpu / elapsed,
+        "cpu_percent": 100.0 * cpu / elapsed / os.cpu_count(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=1)
+    parser.add_argument('--delay', type=float, default=0.03,
+                        help='seconds the inference stand-in holds every frame')
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--warmup', type=float, default=2.0)
+    parser.add_argument('--config', default='./pipe_config.json')
+    parser.add_argument('--optimize', action='store_true',
+                        help='collapse the redundant conversions before running')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    result = run(args.sessions, args.delay, args.duration, args.warmup, args.config, args.optimize)
+    if args.output:
+        with open(args.output, 'w') as results_file:
+            json.dump(result, results_file, indent=2)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
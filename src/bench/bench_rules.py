@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Synthetic-detection benchmark of the alert rule engine
+
+Random rules over the tinyyolov2 labels, with confidence thresholds,
+counts, dwell times and, for some, a random polygon zone picked from a
+small set, are evaluated over batches of random detections from many
+cameras, the way the engine polls the detection ring. For every rule
+count, camera count and batch size, reports the time per batch and per
+detection, and the most expensive rules with their hits and fires.
+
+Run from the src directory:
+    python3 -m bench.bench_rules [--rules 10 100 500] [--cameras 1 16 64] [--batch 1000]
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+import rules
+from detections import DETECTION_DTYPE
+
+WIDTH, HEIGHT = 752, 480
+
+with open("tinyyolov2_labels.txt") as labels_file:
+    LABELS = labels_file.read().strip().split(";")
+
+
+def make_zone(rng, points=6):
+    # Star shaped polygon around a random center
+    center = rng.uniform([100, 100], [WIDTH - 100, HEIGHT - 100])
+    angles = np.sort(rng.uniform(0, 2 * np.pi, points))
+    radii = rng.uniform(40, 200, points)
+    return (center + np.stack([np.cos(angles), np.sin(angles)], axis=1) * radii[:, None]).tolist()
+
+
+def make_rules(count, zones, rng):
+    zone_set = [make_zone(rng) for _ in range(zones)]
+    return [rules.Rule(
+        "rule%d" % r,
+        rng.choice(LABELS, rng.integers(1, 4), replace=False).tolist(),
+        min_confidence=float(rng.uniform(0.2, 0.8)),
+        zone=zone_set[rng.integers(zones)] if zones and rng.uniform() < 0.5 else None,
+        min_count=int(rng.integers(1, 4)),
+        dwell=float(rng.choice([0.0, 1.0, 5.0])),
+    ) for r in range(count)]
+
+
+def make_batch(cameras, size, start, fps, rng):
+    # Frames of every camera in time order, a few detections each
+    batch = np.zeros(size, dtype=DETECTION_DTYPE)
+    frame = np.sort(rng.integers(0, max(size // 4, 1), size))
+    batch["timestamp"] = start + frame // cameras / fps
+    batch["session"] = frame % cameras
+    batch["label"] = rng.integers(0, len(LABELS), size)
+    batch["confidence"] = rng.uniform(0, 1, size)
+    sizes = rng.uniform(20, 150, (size, 2))
+    batch["box"] = np.concatenate([rng.uniform(0, 1, (size, 2)) * ([WIDTH, HEIGHT] - sizes), sizes], axis=1)
+    return batch
+
+
+def run(rule_count, cameras, batch_size, batches, zones, seed):
+    rng = np.random.default_rng(seed)
+    engine = rules.RuleEngine(make_rules(rule_count, zones, rng), LABELS)
+    names = {c: "camera%d" % c for c in range(cameras)}
+    data = [make_batch(cameras, batch_size, b, 30.0, rng) for b in range(batches)]
+    costs, alerts = [], 0
+    for batch in data:
+        start = time.perf_counter()
+        alerts += len(engine.evaluate(batch, names))
+        costs.append(time.perf_counter() - start)
+    stats = engine.stats()
+    slowest = sorted(stats.items(), key=lambda item: -item[1]["cost"])[:5]
+    return {
+        "rules": rule_count,
+        "cameras": cameras,
+        "batch": batch_size,
+        "batch_ms": 1e3 * float(np.median(costs)),
+        "detection_us": 1e6 * float(np.median(costs)) / batch_size,
+        "alerts": alerts,
+        "slowest_rules": {name: {
+            "cost_per_batch_us": 1e6 * rule["cost_per_evaluation"],
+            "hits": rule["hits"],
+            "fires": rule["fires"],
+        } for name, rule in slowest},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rules', type=int, nargs='+', default=[10, 100, 500])
+    parser.add_argument('--cameras', type=int, nargs='+', default=[1, 16, 64])
+    parser.add_argument('--batch', type=int, nargs='+', default=[1000])
+    parser.add_argument('--batches', type=int, default=20)
+    parser.add_argument('--zones', type=int, default=8, help='distinct zones shared by the rules')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    results = [run(rule_count, cameras, batch_size, args.batches, args.zones, args.seed)
+               for rule_count in args.rules for cameras in args.cameras for batch_size in args.batch]
+    if args.output:
+        with open(args.output, 'w') as results_file:
+            json.dump(results, results_file, indent=2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
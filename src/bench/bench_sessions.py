@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Scaling benchmark of the multi-session bring-up
+
+For each session count N, N sessions are generated from the first entry
+of pipe_config.json (RTSP port and sensor id incremented per session),
+brought up and torn down through gstd. Reports the control-plane
+bring-up and tear-down time and the steady-state CPU used by the gstd
+process per session.
+
+Run from the src directory with GStreamer Daemon available:
+    python3 -m bench.bench_sessions [--sessions 1 2 4 8] [--steady SECONDS]
+"""
+import argparse
+import json
+import time
+
+import psutil
+
+from gst import gstc
+import main as demo
+
+
+def make_sessions(template, count):
+    sessions = {}
+    for i in range(count):
+        params = dict(template)
+        params["rtsp_port"] = str(int(template["rtsp_port"]) + i)
+        params["sensor_id"] = str(int(template.get("sensor_id", "0")) + i)
+        params["session_id"] = template["session_id"] + str(i)
+        sessions["Test%d" % i] = params
+    return sessions
+
+
+def gstd_process():
+    for proc in psutil.process_iter(['name']):
+        if proc.info['name'] == gstc.GSTD_PROCNAME:
+            return proc
+    return None
+
+
+def run(gstd_client, template, count, steady):
+    params = make_sessions(template, count)
+    start = time.perf_counter()
+    sessions = demo.bring_up(gstd_client, params, demo.profile_fragments("jetson"))
+    bring_up = time.perf_counter() - start
+
+    cpu = None
+    proc = gstd_process()
+    if proc and steady > 0:
+        proc.cpu_percent(None)
+        time.sleep(steady)
+        cpu = proc.cpu_percent(None) / count
+
+    start = time.perf_counter()
+    demo.tear_down(gstd_client, sessions)
+    tear_down = time.perf_counter() - start
+    return {
+        "sessions": count,
+        "bring_up_s": bring_up,
+        "tear_down_s": tear_down,
+        "cpu_percent_per_session": cpu,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--steady', type=float, default=10.0,
+                        help='seconds to sample CPU after bring-up')
+    parser.add_argument('--config', default='./pipe_config.json')
+    parser.add_argument('--port', type=int, default=5000)
+    args = parser.parse_args()
+
+    with open(args.config) as json_file:
+        template = next(iter(json.load(json_file).values()))
+
+    gstd_client = gstc.client(port=args.port, pool_size=2 * max(args.sessions))
+    results = [run(gstd_client, template, count, args.steady) for count in args.sessions]
+    gstd_client.close()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
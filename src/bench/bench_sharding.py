@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark of MediaEngine sessions sharded over processes
+
+Every session is a videotestsrc pipeline running as fast as it can, with
+a pad probe that runs the tracker on synthetic detections of every
+frame, as the Python side of a real session would. The same sessions
+are spread over 1, 2, 4... worker processes by a ShardPool. For every
+worker count, reports the total and per session frames per second, the
+CPU cores used and the speedup over a single worker.
+
+Run from the src directory with GStreamer installed:
+    python3 -m bench.bench_sharding [--sessions 8] [--workers 1 2 4 8] [--objects 20]
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from gst.sharding import ShardPool, ShardSession
+import tracker
+
+SESSION_PIPELINE = "videotestsrc is-live=false ! video/x-raw,width=320,height=240,framerate=30/1 ! " \
+                   "identity name=work ! fakesink sync=false"
+
+
+class TrackerWork(object):
+    """
+    Tracks objects-many synthetic boxes on every frame crossing a pad
+    """
+    def __init__(self, objects, seed=0):
+        self.frames = 0
+        self._tracker = tracker.Tracker()
+        self._rng = np.random.default_rng(seed)
+        self._boxes = np.concatenate([self._rng.uniform(0, 200, (objects, 2)),
+                                      self._rng.uniform(20, 100, (objects, 2))], axis=1)
+
+    def on_buffer(self, buffer):
+        self._boxes[:, :2] += self._rng.normal(0, 1, (len(self._boxes), 2))
+        self._tracker.step(self._boxes)
+        self.frames += 1
+
+    def stats(self):
+        return {"frames": self.frames}
+
+
+def attach_work(engine, session, pipe_names):
+    # Runs in the worker, see ShardSession
+    work = TrackerWork(int(os.environ.get("BENCH_SHARDING_OBJECTS", "20")))
+    engine.add_probe(pipe_names[0], "work", "src", work.on_buffer)
+    return work
+
+
+def frames(pool):
+    return {session: setup["frames"] for worker in pool.stats()["workers"]
+            for session, setup in worker["setup"].items()}
+
+
+def run(sessions, workers, duration, warmup):
+    with ShardPool(workers, overload=float("inf"), period=0.25) as pool:
+        for i in range(sessions):
+            pool.add_session(ShardSession("session%d" % i, [("session%d" % i, SESSION_PIPELINE)],
+                                          "bench.bench_sharding:attach_work"))
+        time.sleep(warmup)
+        start_frames, start = frames(pool), time.perf_counter()
+        time.sleep(duration)
+        end_frames, elapsed = frames(pool), time.perf_counter() - start
+        stats = pool.stats()
+    fps = {name: (end_frames[name] - start_frames.get(name, 0)) / elapsed for name in end_frames}
+    return {
+        "sessions": sessions,
+        "workers": workers,
+        "fps": sum(fps.values()),
+        "fps_per_session": sum(fps.values()) / sessions,
+        "cpu_cores": stats["cpu_cores"],
+        "faults": stats["faults"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=8)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--objects', type=int, default=20, help='tracked boxes per frame')
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--warmup', type=float, default=2.0)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    # Inherited by the spawned workers
+    os.environ["BENCH_SHARDING_OBJECTS"] = str(args.objects)
+    results = [run(args.sessions, workers, args.duration, args.warmup) for workers in args.workers]
+    for result in results:
+        result["speedup"] = result["fps"] / results[0]["fps"] if results[0]["fps"] else None
+    if args.output:
+        with open(args.output, 'w') as results_file:
+            json.dump(results, results_file, indent=2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
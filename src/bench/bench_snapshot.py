@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Burst benchmark of the snapshot service
+
+Submits bursts of alerts, each with a number of blank frames, to a
+SnapshotService using a software encoder and reports the latency
+percentiles from submission to durable file and the write throughput.
+
+Run from the src directory:
+    python3 -m bench.bench_snapshot [--bursts N] [--alerts N] [--frames N]
+"""
+import argparse
+import json
+import tempfile
+import time
+
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+import snapshot
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--bursts', type=int, default=5)
+    parser.add_argument('--alerts', type=int, default=10, help='alerts per burst')
+    parser.add_argument('--frames', type=int, default=3, help='frames per alert')
+    parser.add_argument('--encoder', default='jpegenc')
+    parser.add_argument('--writers', type=int, default=2)
+    args = parser.parse_args()
+
+    Gst.init(None)
+    with tempfile.TemporaryDirectory() as directory:
+        service = snapshot.SnapshotService(directory=directory, encoder=args.encoder,
+                                           writers=args.writers)
+        service.start()
+        size = snapshot.blank_frame_size(service.caps)
+        frame = (0.0, Gst.Buffer.new_wrapped(bytes(size)))
+        total = args.bursts * args.alerts * args.frames
+        for _ in range(args.bursts):
+            for _ in range(args.alerts):
+                service.submit([frame] * args.frames)
+            time.sleep(0.5)
+        deadline = time.monotonic() + 30
+        while service.written + service.dropped < total and time.monotonic() < deadline:
+            time.sleep(0.05)
+        service.stop()
+        print(json.dumps(service.stats(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Client construction benchmark
+
+Measures how long gstc.client and pygstd.GSTD take to construct against
+a local FakeGstd: cold, with the discovery cache emptied before every
+construction so the port is probed each time, and warm, with the daemon
+already known to the process. For comparison, reports the time of the
+process table walk every construction used to do, on this host and with
+--busy extra idle processes running.
+
+Run from the src directory:
+    python3 -m bench.bench_startup [--constructions 200] [--busy 0 500]
+"""
+import argparse
+import json
+import logging
+import subprocess
+import sys
+import time
+
+from gst import gstc
+from gst import pygstd
+from gst.fakegstd import FakeGstd
+
+
+def timed(call, count):
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {
+        "p50_ms": latencies[len(latencies) // 2] * 1e3,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1e3,
+    }
+
+
+def process_scan():
+    # What test_gstd did on every construction
+    import psutil
+    for proc in psutil.process_iter():
+        if proc.name() == gstc.GSTD_PROCNAME:
+            return proc
+    return None
+
+
+def construct(port, cold):
+    def gstc_client():
+        if cold:
+            gstc.forget_gstd('127.0.0.1', port)
+        gstc.client('127.0.0.1', port, metrics=False).close()
+
+    def pygstd_client():
+        if cold:
+            gstc.forget_gstd('127.0.0.1', port)
+        pygstd.GSTD('127.0.0.1', port)
+    return gstc_client, pygstd_client
+
+
+def run(constructions, busy):
+    results = {}
+    with FakeGstd() as server:
+        for name, cold in (("cold", True), ("warm", False)):
+            gstc_client, pygstd_client = construct(server.port, cold)
+            results["gstc_" + name] = timed(gstc_client, constructions)
+            results["pygstd_" + name] = timed(pygstd_client, constructions)
+    try:
+        import psutil
+    except ImportError:
+        return results
+    for count in busy:
+        sleepers = [subprocess.Popen([sys.executable, "-c", "import time; time.sleep(600)"])
+                    for _ in range(count)]
+        try:
+            results["process_scan_%d_extra" % count] = timed(process_scan, max(constructions // 10, 5))
+            results["process_scan_%d_extra" % count]["processes"] = len(psutil.pids())
+        finally:
+            for sleeper in sleepers:
+                sleeper.kill()
+                sleeper.wait()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--constructions', type=int, default=200)
+    parser.add_argument('--busy', type=int, nargs='+', default=[0, 500],
+                        help='extra idle processes during the process table walk')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    logging.getLogger('GSTD').disabled = True
+    results = run(args.constructions, args.busy)
+    if args.output:
+        with open(args.output, 'w') as results_file:
+            json.dump(results, results_file, indent=2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Synthetic-detection benchmark of the tracker
+
+Objects move across a 752x480 frame at constant speed, bouncing on the
+borders. The net is simulated by noisy detections of every object, with
+some missed, on one frame out of every interval. For every object count
+and inference interval, reports the tracker cost per frame on inference
+and skipped frames, and how well the tracked boxes follow the objects:
+the mean IoU between every object and its best track box, on all frames.
+
+Run from the src directory:
+    python3 -m bench.bench_tracker [--objects 1 10 50 200] [--intervals 1 2 3 5 10]
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+import tracker
+
+WIDTH, HEIGHT = 752, 480
+
+
+def scene(objects, frames, rng):
+    sizes = rng.uniform(30, 120, (objects, 2))
+    positions = rng.uniform(0, 1, (objects, 2)) * ([WIDTH, HEIGHT] - sizes)
+    speeds = rng.uniform(-4, 4, (objects, 2))
+    truth = []
+    for _ in range(frames):
+        positions = positions + speeds
+        limit = [WIDTH, HEIGHT] - sizes
+        bounce = (positions < 0) | (positions > limit)
+        speeds[bounce] *= -1
+        positions = np.clip(positions, 0, limit)
+        truth.append(np.concatenate([positions, sizes], axis=1))
+    return truth
+
+
+def detect(boxes, rng, noise=3.0, miss_rate=0.05):
+    found = boxes[rng.uniform(size=len(boxes)) >= miss_rate]
+    return found + rng.normal(0, noise, found.shape)
+
+
+def run(objects, interval, frames, seed):
+    rng = np.random.default_rng(seed)
+    truth = scene(objects, frames, rng)
+    tracks = tracker.Tracker()
+    inference_cost, skipped_cost, overlap = [], [], []
+    for frame, boxes in enumerate(truth):
+        inferred = frame % interval == 0
+        detections = detect(boxes, rng) if inferred else None
+        start = time.perf_counter()
+        _, tracked, _ = tracks.step(detections)
+        (inference_cost if inferred else skipped_cost).append(time.perf_counter() - start)
+        if len(tracked):
+            overlap.append(tracker.iou(boxes, tracked).max(axis=1).mean())
+        else:
+            overlap.append(0.0)
+    # The first frames only build the tracks up
+    warmup = interval * tracks.min_hits
+    return {
+        "objects": objects,
+        "interval": interval,
+        "inference_frame_us": 1e6 * float(np.mean(inference_cost)),
+        "skipped_frame_us": 1e6 * float(np.mean(skipped_cost)) if skipped_cost else None,
+        "mean_iou": float(np.mean(overlap[warmup:])),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--objects', type=int, nargs='+', default=[1, 10, 50, 200])
+    parser.add_argument('--intervals', type=int, nargs='+', default=[1, 2, 3, 5, 10])
+    parser.add_argument('--frames', type=int, default=600)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    results = [run(objects, interval, args.frames, args.seed)
+               for objects in args.objects for interval in args.intervals]
+    if args.output:
+        with open(args.output, 'w') as results_file:
+            json.dump(results, results_file, indent=2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
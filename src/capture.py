@@ -0,0 +1,149 @@
+import bisect
+import collections
+import logging
+import threading
+import time
+
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst, GLib
+
+from gst.pygst import MediaEngine
+
+# Shared memory link between the gstd inference output and the capture
+CAPTURE_SOCKET = "/tmp/gst-inference-capture"
+CAPTURE_CAPS = "video/x-raw,format=I420,width=752,height=480,framerate=30/1"
+CAPTURE_PIPE = "capture"
+CAPTURE_SINK = "capture_sink"
+
+
+class FrameRing(object):
+    """
+    Bounded ring buffer of the last raw frames
+
+    Frames are kept as references to their Gst.Buffer, so nothing is
+    copied when they are stored. The ring is limited both in frames and
+    in bytes, the oldest frames are evicted first.
+    """
+    def __init__(self, max_frames=90, max_bytes=32 * 1024 * 1024):
+        self.max_frames = max_frames
+        self.max_bytes = max_bytes
+        self.evicted = 0
+        self._timestamps = collections.deque()
+        self._buffers = collections.deque()
+        self._bytes = 0
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        return len(self._timestamps)
+
+    @property
+    def bytes(self):
+        return self._bytes
+
+    def push(self, timestamp, buffer):
+        with self._cond:
+            self._timestamps.append(timestamp)
+            self._buffers.append(buffer)
+            self._bytes += buffer.get_size()
+            while len(self._timestamps) > self.max_frames or self._bytes > self.max_bytes:
+                self._timestamps.popleft()
+                self._bytes -= self._buffers.popleft().get_size()
+                self.evicted += 1
+            self._cond.notify_all()
+
+    def around(self, timestamp, before=0, after=0, timeout=0.0):
+        """
+        Returns the frames around a trigger time
+        Parameters
+        ----------
+        timestamp : float
+            Trigger time, in time.monotonic() seconds
+        before : int
+            Frames received before the trigger to include
+        after : int
+            Frames received after the trigger to include, waiting up to
+            timeout seconds for them to arrive
+        Returns
+        -------
+        list
+            (timestamp, Gst.Buffer) tuples, oldest first
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                timestamps = list(self._timestamps)
+                idx = bisect.bisect_right(timestamps, timestamp)
+                remaining = deadline - time.monotonic()
+                if len(timestamps) - idx >= after or remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            buffers = list(self._buffers)
+        start = max(idx - before, 0)
+        end = min(idx + after, len(timestamps))
+        return list(zip(timestamps[start:end], buffers[start:end]))
+
+
+class FrameCapture(object):
+    """
+    In-process capture of the inference output into a FrameRing
+
+    The gstd inference pipeline publishes its annotated frames through a
+    shmsink, a MediaEngine pipeline reads them with shmsrc into an appsink
+    and every sample is pushed to the ring as it arrives.
+    """
+    def __init__(self, socket_path=CAPTURE_SOCKET, caps=CAPTURE_CAPS, max_frames=90,
+                 max_bytes=32 * 1024 * 1024):
+        Gst.init(None)
+        self.socket_path = socket_path
+        self.caps = caps
+        self.ring = FrameRing(max_frames, max_bytes)
+        self._loop = GLib.MainLoop()
+        self._engine = MediaEngine(CAPTURE_PIPE, self._loop)
+        self._thread = None
+
+    def start(self):
+        desc = "shmsrc socket-path={} is-live=true do-timestamp=true ! {} ! " \
+               "appsink name={} emit-signals=true max-buffers=1 drop=true sync=false".format(
+                   self.socket_path, self.caps, CAPTURE_SINK)
+        self._engine.create_pipe(CAPTURE_PIPE, desc)
+        sink = self._engine.get_element(CAPTURE_PIPE, CAPTURE_SINK)
+        sink.connect("new-sample", self._on_sample)
+        self._engine.play_pipe(CAPTURE_PIPE)
+        self._thread = threading.Thread(target=self._loop.run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._engine.stop_pipe(CAPTURE_PIPE)
+        self._loop.quit()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def frames_around(self, timestamp, before=15, after=15, timeout=1.0):
+        return self.ring.around(timestamp, before, after, timeout)
+
+    def save(self, timestamp, location, before=15, after=15, timeout=1.0):
+        """
+        Writes the raw frames around a trigger time, location is a
+        pattern with a %d placeholder for the frame index
+        """
+        frames = self.frames_around(timestamp, before, after, timeout)
+        for i, (_, buffer) in enumerate(frames):
+            ok, info = buffer.map(Gst.MapFlags.READ)
+            if not ok:
+                logging.error("Could not map captured frame {}".format(i))
+                continue
+            try:
+                with open(location % i, "wb") as frame_file:
+                    frame_file.write(info.data)
+            finally:
+                buffer.unmap(info)
+        logging.info("Saved {} captured frames to {}".format(len(frames), location))
+        return len(frames)
+
+    def _on_sample(self, sink):
+        sample = sink.emit("pull-sample")
+        if sample:
+            self.ring.push(time.monotonic(), sample.get_buffer())
+        return Gst.FlowReturn.OK
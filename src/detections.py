@@ -0,0 +1,254 @@
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+# One record per detection, box as (x, y, width, height)
+DETECTION_DTYPE = np.dtype([
+    ("timestamp", "f8"),
+    ("session", "u2"),
+    ("label", "u2"),
+    ("confidence", "f4"),
+    ("box", "f4", (4,)),
+])
+
+
+class ArrayRing(object):
+    """
+    Fixed size ring of records over a NumPy structured array
+
+    Records are written in blocks with slice assignments and read back
+    as views of the array, so neither side creates Python objects per
+    record. Timestamps must not decrease, which makes every time range a
+    contiguous run of at most two slices.
+    """
+    def __init__(self, array, head=0, count=0):
+        self.array = array
+        self.capacity = len(array)
+        self.head = head
+        self.count = count
+        self.written = count
+
+    def __len__(self):
+        return self.count
+
+    def append(self, records):
+        """
+        Writes a block of records, returns the records evicted to make
+        room, oldest first, as copies
+        """
+        n = len(records)
+        if n > self.capacity:
+            records = records[-self.capacity:]
+            n = self.capacity
+        overflow = max(self.count + n - self.capacity, 0)
+        evicted = np.concatenate(self.chunks(0, overflow)) if overflow else records[:0]
+        first = min(n, self.capacity - self.head)
+        self.array[self.head:self.head + first] = records[:first]
+        self.array[:n - first] = records[first:]
+        self.head = (self.head + n) % self.capacity
+        self.count = min(self.count + n, self.capacity)
+        self.written += n
+        return evicted
+
+    def chunks(self, begin=0, end=None):
+        """
+        Returns views of the records begin to end, in age order, as at
+        most two slices of the array
+        """
+        end = self.count if end is None else end
+        if begin >= end:
+            return []
+        first = (self.head - self.count + begin) % self.capacity
+        last = first + end - begin
+        if last <= self.capacity:
+            return [self.array[first:last]]
+        return [self.array[first:], self.array[:last - self.capacity]]
+
+    def window(self, start=None, end=None):
+        """
+        Returns the views of the records with start <= timestamp < end
+        """
+        chunks = self.chunks()
+        timestamps = [chunk["timestamp"] for chunk in chunks]
+        begin = 0 if start is None else sum(int(np.searchsorted(t, start, "left")) for t in timestamps)
+        stop = self.count if end is None else sum(int(np.searchsorted(t, end, "left")) for t in timestamps)
+        return self.chunks(begin, stop)
+
+
+class DetectionRing(object):
+    """
+    Bounded store of the detections of every session
+
+    Detections are kept in a DETECTION_DTYPE ArrayRing, sessions are
+    numbered as they appear. Queries return views of the ring with a
+    mask per view, nothing is copied until select() is asked for the
+    records; views stay valid until capacity more detections are
+    written. With a spill path, the detections leaving the ring are
+    written to a memory mapped .npy ring on disk, which keeps the
+    history across restarts.
+    """
+    def __init__(self, capacity=65536, spill=None, spill_capacity=16 * 1024 * 1024):
+        self.ring = ArrayRing(np.zeros(capacity, dtype=DETECTION_DTYPE))
+        self.spill = open_spill(spill, spill_capacity) if spill else None
+        self.sessions = {}
+        self._lock = threading.Lock()
+
+    def session_id(self, session):
+        with self._lock:
+            return self.sessions.setdefault(session, len(self.sessions))
+
+    def append(self, session, labels, confidences, boxes, timestamp=None):
+        """
+        Stores the detections of one frame
+        Parameters
+        ----------
+        session : str
+            Session the frame belongs to
+        labels, confidences : array
+            (M,) label indices and confidences
+        boxes : array
+            (M, 4) (x, y, width, height) boxes
+        timestamp : float
+            Frame time, time.time() seconds by default, raised to the
+            last stored one if older
+        """
+        labels = np.asarray(labels)
+        records = np.empty(len(labels), dtype=DETECTION_DTYPE)
+        records["session"] = self.session_id(session)
+        records["label"] = labels
+        records["confidence"] = confidences
+        records["box"] = boxes
+        with self._lock:
+            # The time ranges are bisected, timestamps must never decrease
+            records["timestamp"] = time.time() if timestamp is None else timestamp
+            if self.ring.count:
+                last = self.ring.array[(self.ring.head - 1) % self.ring.capacity]["timestamp"]
+                np.maximum(records["timestamp"], last, out=records["timestamp"])
+            evicted = self.ring.append(records)
+            if self.spill is not None and len(evicted):
+                self.spill.append(evicted)
+
+    def query(self, start=None, end=None, labels=None, sessions=None, history=False):
+        """
+        Finds detections by time range, labels and sessions
+        Parameters
+        ----------
+        start, end : float
+            Time range, start included and end excluded
+        labels : list
+            Label indices to keep, all by default
+        sessions : list
+            Session names to keep, all by default
+        history : bool
+            Search the spill file instead of the ring
+        Returns
+        -------
+        list
+            (view, mask) tuples, the matches are view[mask]
+        """
+        ring = self.spill if history else self.ring
+        if ring is None:
+            return []
+        session_ids = None
+        if sessions is not None:
+            session_ids = [self.sessions[s] for s in sessions if s in self.sessions]
+        with self._lock:
+            views = ring.window(start, end)
+        result = []
+        for view in views:
+            mask = np.ones(len(view), dtype=bool)
+            if labels is not None:
+                mask &= np.isin(view["label"], labels)
+            if session_ids is not None:
+                mask &= np.isin(view["session"], session_ids)
+            result.append((view, mask))
+        return result
+
+    def since(self, cursor):
+        """
+        Returns a copy of the detections written after a cursor, as one
+        array, and the new cursor, starting from 0. Detections already
+        overwritten are skipped.
+        """
+        with self._lock:
+            written = self.ring.written
+            new = min(written - cursor, len(self.ring))
+            # Copied under the lock, appends overwrite the ring in place
+            chunks = self.ring.chunks(len(self.ring) - new)
+            batch = np.concatenate(chunks) if chunks else np.zeros(0, dtype=DETECTION_DTYPE)
+            return batch, written
+
+    def count(self, *args, **kwargs):
+        return sum(int(mask.sum()) for _, mask in self.query(*args, **kwargs))
+
+    def select(self, *args, **kwargs):
+        """
+        Returns a copy of the detections matching a query, as one array
+        """
+        matches = [view[mask] for view, mask in self.query(*args, **kwargs)]
+        return np.concatenate(matches) if matches else np.zeros(0, dtype=DETECTION_DTYPE)
+
+    def stats(self):
+        return {
+            "detections": len(self.ring),
+            "written": self.ring.written,
+            "spilled": len(self.spill) if self.spill is not None else None,
+            "sessions": len(self.sessions),
+        }
+
+    def flush(self):
+        if self.spill is not None:
+            self.spill.array.flush()
+
+
+def open_spill(path, capacity):
+    """
+    Opens or creates a memory mapped .npy ring of detections
+    """
+    if os.path.exists(path):
+        array = np.lib.format.open_memmap(path, mode="r+")
+        if array.dtype != DETECTION_DTYPE:
+            raise RuntimeError("Spill file {} holds other records".format(path))
+        # Empty slots are zero, once full the newest record is where the timestamps wrap
+        used = int(np.count_nonzero(array["timestamp"]))
+        head = used
+        if used == len(array):
+            head = len(array) - int(np.argmax(array["timestamp"][::-1]))
+        logging.info("Reopened spill file {} with {} detections".format(path, used))
+        return ArrayRing(array, head % len(array), used)
+    array = np.lib.format.open_memmap(path, mode="w+", dtype=DETECTION_DTYPE, shape=(capacity,))
+    return ArrayRing(array)
+
+
+class DetectionStage(object):
+    """
+    Feeds a DetectionRing from the frames crossing a pad of a MediaEngine
+    pipeline, extract(buffer) returns the (labels, confidences, boxes) of
+    a frame or None when it has no detections
+    """
+    def __init__(self, engine, pipe_name, element_name, session, ring, extract, pad_name="src"):
+        self._engine = engine
+        self._pad = (pipe_name, element_name, pad_name)
+        self._session = session
+        self._ring = ring
+        self._extract = extract
+        self._probe = None
+
+    def start(self):
+        self._probe = self._engine.add_probe(*self._pad, self._on_buffer)
+
+    def stop(self):
+        if self._probe is not None:
+            self._engine.remove_probe(*self._pad, self._probe)
+            self._probe = None
+
+    def _on_buffer(self, buffer):
+        try:
+            found = self._extract(buffer)
+            if found is not None:
+                self._ring.append(self._session, *found)
+        except Exception:
+            logging.exception("Detection extraction failed on frame {}".format(buffer.pts))
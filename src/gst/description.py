@@ -0,0 +1,271 @@
+"""
+Structural representation of gst-launch pipeline descriptions
+
+A description is parsed into chains of linked nodes: elements with their
+properties and caps, and references to the pads of named elements
+(t0., net.sink_model). The chains can be rewritten and rendered back, and
+optimize() uses that to collapse redundant conversions.
+"""
+import collections
+
+# Elements converting format and memory, merged only with their own kind
+CONVERTERS = ("nvvidconv", "videoconvert")
+
+
+class Element(object):
+    """
+    Class used to store an element of a description
+    """
+    def __init__(self, factory, properties=None):
+        self.factory = factory
+        self.properties = collections.OrderedDict(properties or [])
+
+    @property
+    def caps(self):
+        if self.factory == "capsfilter":
+            return self.properties.get("caps")
+        return None
+
+    def render(self):
+        return " ".join([self.factory] + ["%s=%s" % item for item in self.properties.items()])
+
+
+class Reference(object):
+    """
+    Class used to store a reference to a pad of a named element
+    """
+    def __init__(self, token):
+        self.token = token
+
+    def render(self):
+        return self.token
+
+
+class Description(object):
+    """
+    Parsed pipeline description, a list of chains of linked nodes
+    """
+    def __init__(self, chains):
+        self.chains = chains
+
+    @classmethod
+    def parse(cls, desc):
+        """
+        Parses a gst-launch description
+        Parameters
+        ----------
+        desc : str
+            Pipeline description, quoted values may contain spaces
+        Raises
+        ------
+        ValueError:
+            In case a property or a link has nothing to apply to
+        """
+        chains = []
+        linked = False
+        for token in tokenize(desc):
+            if token == "!":
+                if not chains or not chains[-1]:
+                    raise ValueError("Link without an upstream element")
+                linked = True
+                continue
+            if is_reference(token):
+                node = Reference(token)
+            elif "=" in token and not is_caps(token):
+                node = chains[-1][-1] if chains and chains[-1] else None
+                if not isinstance(node, Element):
+                    raise ValueError("Property {} without an element".format(token))
+                key, value = token.split("=", 1)
+                node.properties[key] = value
+                continue
+            elif is_caps(token):
+                # Bare caps are an implicit capsfilter
+                node = Element("capsfilter", [("caps", token)])
+            else:
+                node = Element(token)
+            if linked:
+                chains[-1].append(node)
+            else:
+                chains.append([node])
+            linked = False
+        if linked:
+            raise ValueError("Link without a downstream element")
+        return cls(chains)
+
+    def render(self):
+        return " ".join(" ! ".join(node.render() for node in chain) for chain in self.chains)
+
+    def elements(self):
+        return [node for chain in self.chains for node in chain if isinstance(node, Element)]
+
+
+def tokenize(desc):
+    """
+    Splits a description on whitespace, keeping quoted values whole
+    Raises
+    ------
+    ValueError:
+        In case a quote is not closed
+    """
+    tokens = []
+    token = []
+    quote = None
+    for char in desc:
+        if quote:
+            token.append(char)
+            if char == quote:
+                quote = None
+        elif char in "\"'":
+            token.append(char)
+            quote = char
+        elif char.isspace():
+            if token:
+                tokens.append("".join(token))
+                token = []
+        else:
+            token.append(char)
+    if quote:
+        raise ValueError("No closing quotation in pipeline description")
+    if token:
+        tokens.append("".join(token))
+    return tokens
+
+
+def is_reference(token):
+    name, dot, pad = token.partition(".")
+    return bool(dot) and "=" not in token and "/" not in token and name.replace("-", "_").isidentifier()
+
+
+def is_caps(token):
+    # video/x-raw, video/x-raw(memory:NVMM),width=752 ...
+    media = token.split(",", 1)[0].split("(", 1)[0]
+    return "/" in media and "=" not in media
+
+
+def caps_fields(caps):
+    """
+    Returns the fields of a caps string, without the media type and
+    memory features
+    """
+    return [field for field in caps.strip("\"'").split(",")[1:] if field]
+
+
+# Fields raw video caps need to describe a single format, converters
+# never change the framerate
+RAW_VIDEO_FIELDS = ("format", "width", "height")
+
+
+def is_fixed_system(caps):
+    """
+    Returns whether caps name a single format in system memory: no
+    memory feature, no ranges or lists, and for raw video every field
+    of RAW_VIDEO_FIELDS
+    """
+    media = caps.strip("\"'").split(",", 1)[0]
+    fields = caps_fields(caps)
+    if "(" in media or not fields:
+        return False
+    values = dict(field.partition("=")[::2] for field in fields)
+    if any(not value or value.lstrip().startswith(("[", "{")) for value in values.values()):
+        return False
+    names = {name.strip() for name in values}
+    return media != "video/x-raw" or all(name in names for name in RAW_VIDEO_FIELDS)
+
+
+class OptimizeReport(object):
+    """
+    Class used to store what optimize() removed, by rule
+    """
+    def __init__(self):
+        self.rules = collections.Counter()
+        self.converters_removed = 0
+        self.capsfilters_removed = 0
+
+    def as_dict(self):
+        return {
+            "converters_removed": self.converters_removed,
+            "capsfilters_removed": self.capsfilters_removed,
+            "rules": dict(self.rules),
+        }
+
+
+def optimize(desc, report=None):
+    """
+    Collapses the redundant conversions of a description
+
+    Within every chain, until nothing changes:
+      * conv ! capsfilter ! conv of the same kind, the caps fixed and
+        in system memory, is a round trip one converter does: the
+        capsfilter and the second converter go
+      * conv ! conv of the same kind is a single converter
+      * caps ! conv ! caps, both caps equal, fixed and in system
+        memory, is a no-op converter
+      * caps ! caps, both equal, is a single capsfilter
+    Caps with a memory feature are never dropped: a hop like
+    nvvidconv ! video/x-raw(memory:NVMM) ! nvvidconv is how nvvidconv
+    converts at all, it does not convert system to system memory. So
+    the Jetson fragments have nothing to collapse, the software profile
+    stands in for their hops with round trips through a fixed format.
+    Named elements are never removed, they may be referenced.
+    Parameters
+    ----------
+    desc : str
+        Pipeline description
+    report : OptimizeReport
+        Accumulates the removals, to sum them over several pipelines
+    Returns
+    -------
+    str
+        The minimal description
+    """
+    report = report if report is not None else OptimizeReport()
+    description = Description.parse(desc)
+    for chain in description.chains:
+        while _collapse(chain, report):
+            pass
+    return description.render()
+
+
+def _removable(node):
+    return isinstance(node, Element) and "name" not in node.properties
+
+
+def _converter(node):
+    return isinstance(node, Element) and node.factory in CONVERTERS
+
+
+def _collapse(chain, report):
+    for i, node in enumerate(chain):
+        window = chain[i:i + 3]
+        if len(window) == 3 and _converter(window[0]) and isinstance(window[1], Element) and \
+                window[1].caps is not None and is_fixed_system(window[1].caps) and \
+                _converter(window[2]) and window[2].factory == window[0].factory and \
+                not window[2].properties and _removable(window[1]):
+            del chain[i + 1:i + 3]
+            report.rules["round trip"] += 1
+            report.converters_removed += 1
+            report.capsfilters_removed += 1
+            return True
+        if len(window) >= 2 and _converter(window[0]) and _converter(window[1]) and \
+                window[0].factory == window[1].factory and \
+                window[0].properties == window[1].properties and _removable(window[1]):
+            del chain[i + 1]
+            report.rules["back to back"] += 1
+            report.converters_removed += 1
+            return True
+        if len(window) == 3 and isinstance(window[0], Element) and window[0].caps is not None and \
+                is_fixed_system(window[0].caps) and _converter(window[1]) and isinstance(window[2], Element) and \
+                window[2].caps == window[0].caps and _removable(window[1]) and _removable(window[2]):
+            del chain[i + 1:i + 3]
+            report.rules["no-op"] += 1
+            report.converters_removed += 1
+            report.capsfilters_removed += 1
+            return True
+        if len(window) >= 2 and isinstance(window[0], Element) and window[0].caps is not None and \
+                isinstance(window[1], Element) and window[1].caps == window[0].caps and \
+                _removable(window[1]):
+            del chain[i + 1]
+            report.rules["duplicate caps"] += 1
+            report.capsfilters_removed += 1
+            return True
+    return False
@@ -0,0 +1,231 @@
+import asyncio
+import collections
+import logging
+import queue
+import threading
+import time
+
+from gst.gstc import AsyncClient
+
+
+class SignalWatch(object):
+    """
+    Class used to store a watched signal, its callbacks and counters
+    """
+    def __init__(self, pipe, element, signal, callback, on_close):
+        self.pipe = pipe
+        self.element = element
+        self.signal = signal
+        self.callback = callback
+        self.on_close = on_close
+        self.task = None
+        self.events = 0
+        self.dropped = 0
+        self.errors = 0
+        self.timestamps = collections.deque()
+
+    @property
+    def key(self):
+        return (self.pipe, self.element, self.signal)
+
+
+class SignalDispatcher(object):
+    """
+    Watches any number of gstd element signals from a single event loop
+
+    Every watched (pipeline, element, signal) waits in signal_connect on
+    its own pooled AsyncClient stream, all multiplexed by one asyncio
+    loop running in a background thread. Emissions are pushed to a
+    bounded queue and delivered to the callbacks by worker threads, so a
+    slow callback never stops the signals from being collected; when the
+    queue is full the event is dropped and counted.
+    """
+    def __init__(self, ip='localhost', port=5000, queue_size=64, workers=2, max_watches=32,
+                 rate_window=10.0, retry_delay=1.0):
+        self.ip = ip
+        self.port = port
+        self.workers = workers
+        self.max_watches = max_watches
+        self.rate_window = rate_window
+        self.retry_delay = retry_delay
+        self._watches = {}
+        self._queue = queue.Queue(queue_size)
+        self._lock = threading.Lock()
+        self._loop = None
+        self._client = None
+        self._threads = []
+        self._running = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.stop()
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._loop = asyncio.new_event_loop()
+        started = threading.Event()
+        loop_thread = threading.Thread(target=self._run_loop, args=(started,), daemon=True)
+        loop_thread.start()
+        started.wait()
+        self._threads = [loop_thread]
+        for _ in range(self.workers):
+            worker = threading.Thread(target=self._run_worker, daemon=True)
+            worker.start()
+            self._threads.append(worker)
+        with self._lock:
+            watches = list(self._watches.values())
+        for watch in watches:
+            self._schedule(watch)
+
+    def stop(self):
+        if not self._running:
+            return
+        self._running = False
+        with self._lock:
+            watches = list(self._watches.values())
+        for watch in watches:
+            self._cancel(watch)
+        asyncio.run_coroutine_threadsafe(self._client.close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        for _ in range(self.workers):
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self._loop.close()
+
+    def watch(self, pipe, element, signal, callback, on_close=None):
+        """
+        Starts delivering the emissions of a signal to a callback
+        Parameters
+        ----------
+        pipe, element, signal : str
+            Signal to watch in gstd
+        callback : callable
+            Called as callback(key, result) from a worker thread, the
+            gstd result carries the time.monotonic() reception time in
+            result['timestamp']
+        on_close : callable
+            Called as on_close(key) once gstd disconnects the signal,
+            unless the dispatcher is stopping
+        Raises
+        ------
+        RuntimeError:
+            In case the signal is already watched or there are too many
+            watches for the connection pool
+        """
+        watch = SignalWatch(pipe, element, signal, callback, on_close)
+        with self._lock:
+            if watch.key in self._watches:
+                raise RuntimeError("Signal {} is already watched".format(watch.key))
+            if len(self._watches) >= self.max_watches:
+                raise RuntimeError("Too many watched signals")
+            self._watches[watch.key] = watch
+        if self._running:
+            self._schedule(watch)
+        return watch.key
+
+    def unwatch(self, pipe, element, signal):
+        with self._lock:
+            watch = self._watches.pop((pipe, element, signal), None)
+        if watch and self._running:
+            self._cancel(watch)
+            asyncio.run_coroutine_threadsafe(
+                self._client.signal_disconnect(pipe, element, signal), self._loop).result()
+
+    @property
+    def metrics(self):
+        return self._client.metrics if self._client else None
+
+    def stats(self):
+        """
+        Returns the queue state and the per signal event counters
+        """
+        now = time.monotonic()
+        with self._lock:
+            watches = list(self._watches.values())
+        signals = {}
+        for watch in watches:
+            recent = [t for t in list(watch.timestamps) if now - t <= self.rate_window]
+            signals['/'.join(watch.key)] = {
+                'events': watch.events,
+                'rate': len(recent) / self.rate_window,
+                'dropped': watch.dropped,
+                'errors': watch.errors,
+            }
+        return {
+            'queue_depth': self._queue.qsize(),
+            'queue_size': self._queue.maxsize,
+            'dropped': sum(watch.dropped for watch in watches),
+            'signals': signals,
+        }
+
+    def _run_loop(self, started):
+        asyncio.set_event_loop(self._loop)
+        self._client = AsyncClient(self.ip, self.port, pool_size=self.max_watches + 1)
+        started.set()
+        self._loop.run_forever()
+
+    def _schedule(self, watch):
+        def create():
+            watch.task = self._loop.create_task(self._watch_signal(watch))
+        self._loop.call_soon_threadsafe(create)
+
+    def _cancel(self, watch):
+        def cancel():
+            if watch.task:
+                watch.task.cancel()
+        self._loop.call_soon_threadsafe(cancel)
+
+    async def _watch_signal(self, watch):
+        while True:
+            result = await self._client.signal_connect(watch.pipe, watch.element, watch.signal)
+            if result is None or result['code'] != 0:
+                # Socket failure or gstd error, try again later
+                watch.errors += 1
+                await asyncio.sleep(self.retry_delay)
+                continue
+            if result['response'] is None:
+                logging.info("Signal {} disconnected".format(watch.key))
+                with self._lock:
+                    self._watches.pop(watch.key, None)
+                if watch.on_close:
+                    self._enqueue(watch, None)
+                return
+            watch.events += 1
+            result['timestamp'] = time.monotonic()
+            watch.timestamps.append(result['timestamp'])
+            self._trim(watch, result['timestamp'])
+            self._enqueue(watch, result)
+
+    def _enqueue(self, watch, result):
+        try:
+            self._queue.put_nowait((watch, result))
+        except queue.Full:
+            watch.dropped += 1
+            logging.debug("Dropped event from signal {}, queue is full".format(watch.key))
+
+    def _trim(self, watch, now):
+        while watch.timestamps and now - watch.timestamps[0] > self.rate_window:
+            watch.timestamps.popleft()
+
+    def _run_worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            watch, result = item
+            try:
+                if result is None:
+                    # Watches closing while the dispatcher stops were not closed by gstd
+                    if self._running:
+                        watch.on_close(watch.key)
+                else:
+                    watch.callback(watch.key, result)
+            except Exception:
+                logging.exception("Callback of signal {} failed".format(watch.key))
@@ -0,0 +1,525 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the GStreamer Daemon
+
+Speaks the gstd TCP protocol: one command line per socket read, answered
+with a NUL-terminated JSON document. Pipelines are only bookkeeping, the
+descriptions are split into named elements and their properties so
+reads, element_get/set and the state changes answer like gstd would,
+but no media flows. Latency, response sizes, blocking signals and
+failures can be configured globally or per command, so the clients and
+the application control flow can be exercised and benchmarked without
+gstd or the target hardware.
+
+Run standalone from the src directory:
+    python3 -m gst.fakegstd [--port 5000] [--latency SECONDS] ...
+"""
+import argparse
+import json
+import logging
+import random
+import re
+import socket
+import socketserver
+import threading
+import time
+
+from gst.framing import terminator
+
+# Return codes, following the gstd numbering for the ones the clients use
+GSTD_EOK = 0
+GSTD_BAD_COMMAND = 4
+GSTD_NO_RESOURCE = 5
+GSTD_EXISTING_RESOURCE = 6
+GSTD_BAD_VALUE = 16
+GSTD_INJECTED_FAILURE = 99
+
+DESCRIPTIONS = {
+    GSTD_EOK: "Success",
+    GSTD_BAD_COMMAND: "Bad command",
+    GSTD_NO_RESOURCE: "Resource not found",
+    GSTD_EXISTING_RESOURCE: "Existing resource",
+    GSTD_BAD_VALUE: "Bad value",
+    GSTD_INJECTED_FAILURE: "Injected failure",
+}
+
+STATES = ("NULL", "READY", "PAUSED", "PLAYING")
+
+# gstd reads each command with a single recv of this size
+read_size = 1024 * 1024
+
+
+class FakePipeline(object):
+    """
+    Class used to store the state, elements and bus of a fake pipeline
+    """
+    def __init__(self, description):
+        self.description = description
+        self.state = "NULL"
+        self.elements = parse_elements(description)
+        self.bus = []
+        self.bus_filter = None
+        self.bus_timeout = None
+        self.bus_cond = threading.Condition()
+
+
+class FakeGstd(object):
+    """
+    Threaded fake gstd server
+
+    Every option taking a value per command accepts either a single
+    value or a dict keyed by command name, with '*' as the fallback.
+    Parameters
+    ----------
+    latency : float or dict
+        Seconds to wait before answering, plus a uniform random jitter
+    response_size : int or dict
+        Bytes of padding added to the answers, to exercise large responses
+    failure_rate : float or dict
+        Probability of answering with an error code
+    disconnect_rate : float or dict
+        Probability of closing the connection without an answer
+    signal_interval : float
+        Seconds after which a blocked signal_connect gets a synthetic
+        emission, None blocks until emit() is called
+    """
+    def __init__(self, address='127.0.0.1', port=0, latency=0.0, jitter=0.0, response_size=0,
+                 failure_rate=0.0, disconnect_rate=0.0, signal_interval=None, seed=None):
+        self.address = address
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.response_size = response_size
+        self.failure_rate = failure_rate
+        self.disconnect_rate = disconnect_rate
+        self.signal_interval = signal_interval
+        self.pipelines = {}
+        self.commands = {}
+        self.failures = 0
+        self.disconnects = 0
+        self.connections = 0
+        self.emitted = 0
+        self.delivered = 0
+        self._random = random.Random(seed)
+        self._signals = {}
+        self._signal_timeouts = {}
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+        self._stopping = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.stop()
+
+    def start(self):
+        server = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                server._serve(self.request)
+
+        self._stopping = False
+        self._server = socketserver.ThreadingTCPServer((self.address, self.port), Handler,
+                                                       bind_and_activate=False)
+        self._server.daemon_threads = True
+        self._server.allow_reuse_address = True
+        self._server.server_bind()
+        self._server.server_activate()
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.port
+
+    def stop(self):
+        if not self._server:
+            return
+        self._stopping = True
+        # Wake up the commands blocked on signals and buses
+        with self._lock:
+            waiters = [w for ws in self._signals.values() for w in ws]
+            pipelines = list(self.pipelines.values())
+        for waiter in waiters:
+            waiter[0].set()
+        for pipeline in pipelines:
+            with pipeline.bus_cond:
+                pipeline.bus_cond.notify_all()
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._server = None
+
+    def emit(self, pipe, element, signal, arguments=None):
+        """
+        Emits a signal to the clients blocked in signal_connect on it,
+        returns how many received it. As with gstd, an emission nobody
+        waits for is lost.
+        """
+        key = (pipe, element, signal)
+        with self._lock:
+            waiters = self._signals.pop(key, [])
+            self.emitted += 1
+            self.delivered += len(waiters)
+        for waiter in waiters:
+            waiter[1] = signal_response(element, signal, arguments)
+            waiter[0].set()
+        return len(waiters)
+
+    def waiting(self, pipe, element, signal):
+        with self._lock:
+            return len(self._signals.get((pipe, element, signal), []))
+
+    def post_message(self, pipe, message_type, **fields):
+        """
+        Posts a message to the bus of a pipeline for bus_read to return
+        """
+        pipeline = self.pipelines.get(pipe)
+        if pipeline is None:
+            return False
+        message = {"type": message_type, "source": pipe, "timestamp": time.monotonic()}
+        message.update(fields)
+        with pipeline.bus_cond:
+            pipeline.bus.append(message)
+            pipeline.bus_cond.notify_all()
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                "commands": dict(self.commands),
+                "failures": self.failures,
+                "disconnects": self.disconnects,
+                "connections": self.connections,
+                "signals_emitted": self.emitted,
+                "signals_delivered": self.delivered,
+                "pipelines": len(self.pipelines),
+            }
+
+    def _serve(self, conn):
+        with self._lock:
+            self.connections += 1
+        while not self._stopping:
+            try:
+                data = conn.recv(read_size)
+            except socket.error:
+                return
+            if not data:
+                return
+            line = data.rstrip(terminator).decode('utf-8', 'replace').strip()
+            command = line.split(' ', 1)[0]
+            with self._lock:
+                self.commands[command] = self.commands.get(command, 0) + 1
+                delay = self._option(self.latency, command)
+                if self.jitter:
+                    delay += self._random.uniform(0, self.jitter)
+                disconnect = self._random.random() < self._option(self.disconnect_rate, command)
+                fail = self._random.random() < self._option(self.failure_rate, command)
+            if delay:
+                time.sleep(delay)
+            if disconnect:
+                with self._lock:
+                    self.disconnects += 1
+                return
+            if fail:
+                with self._lock:
+                    self.failures += 1
+                code, response = GSTD_INJECTED_FAILURE, None
+            else:
+                code, response = self.execute(line)
+            answer = {"code": code, "description": DESCRIPTIONS.get(code, "Unknown error"),
+                      "response": response}
+            padding = self._option(self.response_size, command)
+            if padding:
+                answer["padding"] = "x" * padding
+            try:
+                conn.sendall(json.dumps(answer).encode('utf-8') + terminator)
+            except socket.error:
+                return
+
+    def _option(self, value, command):
+        if isinstance(value, dict):
+            return value.get(command, value.get('*', 0))
+        return value or 0
+
+    def execute(self, line):
+        """
+        Runs a command line against the fake state, returns (code, response)
+        """
+        tokens = line.split(' ')
+        handler = getattr(self, '_cmd_' + tokens[0], None)
+        if handler is None:
+            return GSTD_BAD_COMMAND, None
+        try:
+            return handler(*tokens[1:])
+        except TypeError:
+            # Wrong number of arguments
+            return GSTD_BAD_COMMAND, None
+
+    # Resource commands
+
+    def _cmd_create(self, uri, name, *description):
+        if uri.strip('/') != 'pipelines':
+            return GSTD_NO_RESOURCE, None
+        with self._lock:
+            if name in self.pipelines:
+                return GSTD_EXISTING_RESOURCE, None
+            self.pipelines[name] = FakePipeline(' '.join(description))
+        return GSTD_EOK, None
+
+    def _cmd_read(self, uri):
+        path = uri.strip('/').split('/')
+        if path == ['pipelines']:
+            return GSTD_EOK, nodes('pipelines', self.pipelines)
+        pipeline = self.pipelines.get(path[1]) if len(path) > 1 and path[0] == 'pipelines' else None
+        if pipeline is None:
+            return GSTD_NO_RESOURCE, None
+        rest = path[2:]
+        if rest == ['state']:
+            return GSTD_EOK, {"name": "state", "value": pipeline.state}
+        if rest == ['elements']:
+            return GSTD_EOK, nodes('elements', pipeline.elements)
+        if len(rest) >= 2 and rest[0] == 'elements' and rest[1] in pipeline.elements:
+            properties = pipeline.elements[rest[1]]
+            if rest[2:] == ['properties']:
+                return GSTD_EOK, nodes('properties', properties)
+            if rest[2:] == ['signals']:
+                return GSTD_EOK, nodes('signals', {})
+            if len(rest) == 4 and rest[2] == 'properties':
+                return GSTD_EOK, {"name": rest[3], "value": properties.get(rest[3], 0)}
+        return GSTD_NO_RESOURCE, None
+
+    def _cmd_update(self, uri, *value):
+        path = uri.strip('/').split('/')
+        value = ' '.join(value)
+        pipeline = self.pipelines.get(path[1]) if len(path) > 1 and path[0] == 'pipelines' else None
+        if pipeline is None:
+            return GSTD_NO_RESOURCE, None
+        rest = path[2:]
+        if rest == ['state']:
+            if value.upper() not in STATES:
+                return GSTD_BAD_VALUE, None
+            pipeline.state = value.upper()
+            return GSTD_EOK, None
+        if len(rest) == 4 and rest[0] == 'elements' and rest[2] == 'properties' \
+                and rest[1] in pipeline.elements:
+            pipeline.elements[rest[1]][rest[3]] = value
+            return GSTD_EOK, None
+        return GSTD_NO_RESOURCE, None
+
+    def _cmd_delete(self, uri, name):
+        if uri.strip('/') != 'pipelines':
+            return GSTD_NO_RESOURCE, None
+        with self._lock:
+            if self.pipelines.pop(name, None) is None:
+                return GSTD_NO_RESOURCE, None
+        return GSTD_EOK, None
+
+    # High level commands, mapped to the resource ones like gstd does
+
+    def _cmd_pipeline_create(self, name, *description):
+        return self._cmd_create('/pipelines', name, *description)
+
+    def _cmd_pipeline_delete(self, name):
+        return self._cmd_delete('/pipelines', name)
+
+    def _cmd_pipeline_play(self, name):
+        return self._cmd_update('/pipelines/%s/state' % name, 'playing')
+
+    def _cmd_pipeline_pause(self, name):
+        return self._cmd_update('/pipelines/%s/state' % name, 'paused')
+
+    def _cmd_pipeline_stop(self, name):
+        return self._cmd_update('/pipelines/%s/state' % name, 'null')
+
+    def _cmd_element_set(self, pipe, element, prop, *value):
+        return self._cmd_update('/pipelines/%s/elements/%s/properties/%s' % (pipe, element, prop), *value)
+
+    def _cmd_element_get(self, pipe, element, prop):
+        return self._cmd_read('/pipelines/%s/elements/%s/properties/%s' % (pipe, element, prop))
+
+    def _cmd_list_pipelines(self):
+        return self._cmd_read('/pipelines')
+
+    def _cmd_list_elements(self, pipe):
+        return self._cmd_read('/pipelines/%s/elements' % pipe)
+
+    def _cmd_list_properties(self, pipe, element):
+        return self._cmd_read('/pipelines/%s/elements/%s/properties' % (pipe, element))
+
+    def _cmd_list_signals(self, pipe, element):
+        return self._cmd_read('/pipelines/%s/elements/%s/signals' % (pipe, element))
+
+    # Bus
+
+    def _cmd_bus_read(self, pipe):
+        pipeline = self.pipelines.get(pipe)
+        if pipeline is None:
+            return GSTD_NO_RESOURCE, None
+        deadline = None if pipeline.bus_timeout is None else time.monotonic() + pipeline.bus_timeout
+        with pipeline.bus_cond:
+            while not self._stopping:
+                while pipeline.bus:
+                    message = pipeline.bus.pop(0)
+                    if pipeline.bus_filter is None or message["type"] in pipeline.bus_filter:
+                        return GSTD_EOK, message
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                pipeline.bus_cond.wait(remaining)
+        return GSTD_EOK, None
+
+    def _cmd_bus_filter(self, pipe, *types):
+        pipeline = self.pipelines.get(pipe)
+        if pipeline is None:
+            return GSTD_NO_RESOURCE, None
+        types = set('+'.join(types).lower().split('+')) - {''}
+        pipeline.bus_filter = None if not types or 'all' in types else types
+        return GSTD_EOK, None
+
+    def _cmd_bus_timeout(self, pipe, timeout):
+        pipeline = self.pipelines.get(pipe)
+        if pipeline is None:
+            return GSTD_NO_RESOURCE, None
+        # Nanoseconds, negative waits forever
+        timeout = int(timeout)
+        pipeline.bus_timeout = None if timeout < 0 else timeout / 1e9
+        return GSTD_EOK, None
+
+    # Events
+
+    def _cmd_event_eos(self, pipe):
+        if not self.post_message(pipe, "eos"):
+            return GSTD_NO_RESOURCE, None
+        return GSTD_EOK, None
+
+    def _cmd_event_seek(self, pipe, *args):
+        return self._event(pipe)
+
+    def _cmd_event_flush_start(self, pipe):
+        return self._event(pipe)
+
+    def _cmd_event_flush_stop(self, pipe, *reset):
+        return self._event(pipe)
+
+    def _event(self, pipe):
+        if pipe not in self.pipelines:
+            return GSTD_NO_RESOURCE, None
+        return GSTD_EOK, None
+
+    # Signals
+
+    def _cmd_signal_connect(self, pipe, element, signal):
+        pipeline = self.pipelines.get(pipe)
+        if pipeline is None or element not in pipeline.elements:
+            return GSTD_NO_RESOURCE, None
+        key = (pipe, element, signal)
+        waiter = [threading.Event(), None]
+        with self._lock:
+            self._signals.setdefault(key, []).append(waiter)
+            timeout = self._signal_timeouts.get(key)
+        synthetic = self.signal_interval is not None and (timeout is None or self.signal_interval < timeout)
+        if not waiter[0].wait(self.signal_interval if synthetic else timeout) and synthetic:
+            # Nobody emitted, produce the synthetic emission
+            self.emit(pipe, element, signal)
+        with self._lock:
+            if waiter in self._signals.get(key, []):
+                self._signals[key].remove(waiter)
+        return GSTD_EOK, waiter[1]
+
+    def _cmd_signal_timeout(self, pipe, element, signal, timeout):
+        if pipe not in self.pipelines:
+            return GSTD_NO_RESOURCE, None
+        # Milliseconds, negative waits forever
+        timeout = int(timeout)
+        with self._lock:
+            self._signal_timeouts[(pipe, element, signal)] = None if timeout < 0 else timeout / 1000.0
+        return GSTD_EOK, None
+
+    def _cmd_signal_disconnect(self, pipe, element, signal):
+        if pipe not in self.pipelines:
+            return GSTD_NO_RESOURCE, None
+        with self._lock:
+            waiters = self._signals.pop((pipe, element, signal), [])
+        for waiter in waiters:
+            waiter[0].set()
+        return GSTD_EOK, None
+
+    # Debug
+
+    def _cmd_debug_enable(self, enable):
+        return GSTD_EOK, None
+
+    def _cmd_debug_threshold(self, threshold):
+        return GSTD_EOK, None
+
+    def _cmd_debug_color(self, color):
+        return GSTD_EOK, None
+
+    def _cmd_debug_reset(self, reset):
+        return GSTD_EOK, None
+
+
+def parse_elements(description):
+    """
+    Returns the element names of a pipeline description and their
+    properties. Unnamed elements get gstd-like names such as queue0, and
+    quoted values with spaces are not supported.
+    """
+    elements = {}
+    counters = {}
+    for segment in re.split(r'\s!\s', description):
+        tokens = [t for t in segment.split() if t]
+        if not tokens or '=' in tokens[0] or '.' in tokens[0]:
+            # Caps filters and pad references
+            continue
+        factory = tokens[0]
+        properties = dict(t.split('=', 1) for t in tokens[1:] if '=' in t)
+        name = properties.pop('name', None)
+        if name is None:
+            name = '%s%d' % (factory, counters.get(factory, 0))
+            counters[factory] = counters.get(factory, 0) + 1
+        elements[name] = properties
+    return elements
+
+
+def nodes(name, children):
+    return {"name": name, "nodes": [{"name": child} for child in children]}
+
+
+def signal_response(element, signal, arguments=None):
+    arguments = [{"type": "GstElement", "value": element}] + list(arguments or [])
+    return {"name": signal, "arguments": arguments}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--address', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--response-size', type=int, default=0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--disconnect-rate', type=float, default=0.0)
+    parser.add_argument('--signal-interval', type=float, default=None)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = FakeGstd(args.address, args.port, args.latency, args.jitter, args.response_size,
+                      args.failure_rate, args.disconnect_rate, args.signal_interval, args.seed)
+    server.start()
+    logging.info("Fake gstd listening on {}:{}".format(args.address, server.port))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    server.stop()
+    logging.info("Fake gstd stats: " + json.dumps(server.stats()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+terminator = '\x00'.encode('utf-8')
+default_read_size = 64 * 1024
+# Buffers grown by a big response are released once they sit idle
+max_idle_capacity = 1024 * 1024
+
+
+class ResponseFramer(object):
+    """
+    Splits the GStreamer Daemon byte stream into NUL terminated responses
+
+    Data is received straight into a growing bytearray, there is no cap
+    on the response size and the terminator search only looks at bytes
+    that arrived since the previous scan. Bytes received after a
+    terminator are kept for the next response on the same connection.
+    """
+    def __init__(self, read_size=default_read_size, terminator=terminator):
+        self.read_size = read_size
+        self.terminator = terminator
+        self._buf = bytearray(read_size)
+        self._end = 0
+        self._scan = 0
+
+    def pending(self):
+        """
+        Returns the number of buffered bytes not yet returned as a response
+        """
+        return self._end
+
+    def feed(self, data):
+        """
+        Appends raw bytes to the stream, mainly for non socket transports
+        """
+        self._reserve(len(data))
+        self._buf[self._end:self._end + len(data)] = data
+        self._end += len(data)
+
+    def next_response(self):
+        """
+        Returns the next complete response already buffered or None
+        """
+        start = max(self._scan - len(self.terminator) + 1, 0)
+        idx = self._buf.find(self.terminator, start, self._end)
+        if idx < 0:
+            self._scan = self._end
+            return None
+        msg = bytes(self._buf[:idx])
+        rest = idx + len(self.terminator)
+        remaining = self._end - rest
+        if remaining:
+            self._buf[:remaining] = self._buf[rest:self._end]
+        self._end = remaining
+        self._scan = 0
+        if len(self._buf) > max_idle_capacity and remaining < self.read_size:
+            self._buf = self._buf[:max(remaining, self.read_size)]
+        return msg
+
+    def recv(self, sock):
+        """
+        Reads from the socket until a full response is available
+
+        Returns
+        -------
+        bytes
+            Response without its terminator, or None if the peer closed
+            the connection first
+        Raises
+        ------
+        socket.error:
+            In case the socket fails receiving
+        """
+        msg = self.next_response()
+        while msg is None:
+            self._reserve(self.read_size)
+            with memoryview(self._buf) as view:
+                count = sock.recv_into(view[self._end:], self.read_size)
+            if not count:
+                return None
+            self._end += count
+            msg = self.next_response()
+        return msg
+
+    def _reserve(self, count):
+        missing = self._end + count - len(self._buf)
+        if missing > 0:
+            # Grow geometrically so big responses stay linear time
+            self._buf.extend(bytes(max(missing, len(self._buf))))
+
+
+def recvall(sock, read_size=default_read_size):
+    """
+    Receives a single response from a socket used for one command only
+    """
+    return ResponseFramer(read_size).recv(sock)
@@ -1,30 +1,135 @@
+import asyncio
+import collections
+import concurrent.futures
 import json
 import logging
+import os
+import shutil
 import socket
 import subprocess
-import psutil
+import tempfile
+import threading
 import time
+import traceback
+
+from gst.framing import ResponseFramer, default_read_size, recvall
+from gst.metrics import ClientMetrics
 
 GSTD_PROCNAME = 'gstd'
-terminator = '\x00'.encode('utf-8')
-max_size = 8192
-def recvall(sock):
-    buf = b''
-    count = max_size
+
+# (ip, port) of the daemons seen answering, for the whole process
+_known_gstd = set()
+_known_lock = threading.Lock()
+
+
+def probe_gstd(ip='localhost', port=5000, timeout=0.5):
+    """
+    Returns whether a gstd answers a command on the port, in one attempt
+    """
     try:
-        while count:
-            newbuf = sock.recv(max_size//8)
-            if not newbuf: return None
-            if terminator in newbuf:
-                # this is the last item
-                buf += newbuf[:newbuf.find(terminator)]
-                break
-            else:
-                buf += newbuf
-                count -= len(newbuf)
+        with socket.create_connection((ip, port), timeout) as sock:
+            sock.settimeout(timeout)
+            sock.sendall(b'list_pipelines')
+            return recvall(sock) is not None
     except socket.error:
-        buf = json.dumps({"error":"socket error", "msg": traceback.format_exc(), "code": -1 })
-    return buf
+        return False
+
+
+def wait_for_gstd(ip='localhost', port=5000, timeout=10.0, delay=0.05, max_delay=1.0):
+    """
+    Polls the daemon port with exponential backoff until gstd answers a
+    command, returns False if it is not ready before the timeout
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if probe_gstd(ip, port, max(remaining, delay)):
+            with _known_lock:
+                _known_gstd.add((ip, port))
+            return True
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, max_delay)
+
+
+def find_gstd(ip='localhost', port=5000, timeout=0.5):
+    """
+    Returns whether a gstd answers at (ip, port). Daemons found are
+    remembered for the rest of the process, so only the first client
+    pays for the probe.
+    """
+    if (ip, port) in _known_gstd:
+        return True
+    if probe_gstd(ip, port, timeout):
+        with _known_lock:
+            _known_gstd.add((ip, port))
+        return True
+    return False
+
+
+def forget_gstd(ip='localhost', port=5000):
+    with _known_lock:
+        _known_gstd.discard((ip, port))
+
+
+def gstd_pidfile(port):
+    return os.path.join(tempfile.gettempdir(), 'gstd-%d.pid' % port)
+
+
+def launched_gstd(port):
+    """
+    Returns the pid of the gstd launched for the port by this or an
+    earlier client, if it is still alive
+    """
+    try:
+        with open(gstd_pidfile(port)) as pidfile:
+            pid = int(pidfile.read().strip())
+        os.kill(pid, 0)
+        return pid
+    except (OSError, ValueError):
+        return None
+
+
+def running_gstd():
+    """
+    Returns whether any gstd process exists. Walks the process table,
+    only for when the port does not answer.
+    """
+    try:
+        import psutil
+    except ImportError:
+        return False
+    return any(proc.info['name'] == GSTD_PROCNAME for proc in psutil.process_iter(['name']))
+
+
+def launch_gstd(ip='localhost', port=5000, timeout=10.0):
+    """
+    Starts a gstd, records it in the pidfile of the port and waits until
+    it answers. Returns the Popen object, None if gstd is not installed
+    or did not come up.
+    """
+    gstd_bin = shutil.which(GSTD_PROCNAME)
+    if not gstd_bin:
+        return None
+    proc = subprocess.Popen([gstd_bin])
+    with open(gstd_pidfile(port), 'w') as pidfile:
+        pidfile.write(str(proc.pid))
+    if wait_for_gstd(ip, port, timeout):
+        return proc
+    kill_gstd(proc, ip, port)
+    return None
+
+
+def kill_gstd(proc, ip='localhost', port=5000):
+    proc.kill()
+    forget_gstd(ip, port)
+    if launched_gstd(port) in (proc.pid, None):
+        try:
+            os.remove(gstd_pidfile(port))
+        except OSError:
+            pass
 
 # Add color to logging output
 COLORS = {
@@ -43,8 +148,284 @@ class colorFormatter(logging.Formatter):
             record.levelname = "\033[1;" + COLORS[record.levelname] + record.levelname + "\033[0m"
         return logging.Formatter.format(self, record)
 
+class Connection(object):
+    """
+    Persistent socket to a GStreamer Daemon with its response framer
+    """
+    def __init__(self, ip, port, timeout=None, read_size=default_read_size):
+        self.sock = socket.create_connection((ip, port), timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.framer = ResponseFramer(read_size)
+
+    def send(self, data):
+        self.sock.sendall(data)
+
+    def recv(self):
+        return self.framer.recv(self.sock)
+
+    def healthy(self):
+        # An idle connection must have nothing to read: EOF means the
+        # daemon hung up, pending bytes mean a response got out of sync.
+        if self.framer.pending():
+            return False
+        try:
+            self.sock.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT)
+        except BlockingIOError:
+            return True
+        except socket.error:
+            return False
+        return False
+
+    def close(self):
+        self.sock.close()
+
+class ConnectionPool(object):
+    """
+    Bounded pool of persistent TCP connections to a GStreamer Daemon
+
+    Connections are handed out by acquire() and given back with release(),
+    so consecutive commands reuse a warm connection instead of paying
+    a connect handshake each time. Idle connections are health checked
+    before reuse and dropped if the daemon closed them.
+    """
+    def __init__(self, ip, port, size=4, timeout=None, read_size=default_read_size):
+        self.ip = ip
+        self.port = port
+        self.size = size
+        self.timeout = timeout
+        self.read_size = read_size
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.reconnects = 0
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def acquire(self):
+        """
+        Returns a (connection, reused) tuple, blocking while all the
+        connections of the pool are in use
+        """
+        self._slots.acquire()
+        try:
+            with self._lock:
+                if self._closed:
+                    raise socket.error('Connection pool is closed')
+                while self._idle:
+                    conn = self._idle.pop()
+                    if conn.healthy():
+                        self.hits += 1
+                        return conn, True
+                    self.stale += 1
+                    conn.close()
+                self.misses += 1
+            return Connection(self.ip, self.port, self.timeout, self.read_size), False
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn, reuse=True):
+        """
+        Gives a connection back to the pool, closing it instead when it
+        can't be reused or the pool has been closed
+        """
+        with self._lock:
+            if reuse and not self._closed:
+                self._idle.append(conn)
+                conn = None
+        if conn:
+            conn.close()
+        self._slots.release()
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self.size,
+                'idle': len(self._idle),
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale': self.stale,
+                'reconnects': self.reconnects,
+            }
+
+    def count_reconnect(self):
+        with self._lock:
+            self.reconnects += 1
+
+# Commands whose answers only change with the pipelines, and the ones changing them
+CACHED_COMMANDS = ('read', 'list_pipelines', 'list_elements', 'list_properties', 'list_signals')
+STRUCTURAL_COMMANDS = ('pipeline_create', 'pipeline_delete', 'create', 'delete')
+
+
+def command_pipe(cmd_line):
+    """
+    Returns the pipeline a command line refers to, None for commands
+    about all of them or none
+    """
+    if len(cmd_line) < 2:
+        return None
+    if cmd_line[0] in ('read', 'update', 'create', 'delete'):
+        parts = str(cmd_line[1]).strip('/').split('/')
+        return parts[1] if len(parts) > 1 and parts[0] == 'pipelines' else None
+    return str(cmd_line[1])
+
+
+class ResponseCache(object):
+    """
+    TTL and LRU cache of GStreamer Daemon answers
+
+    Entries live ttl seconds and the least recently used are evicted past
+    size entries. Commands that create or delete pipelines drop every
+    entry, any other command naming a pipeline drops the entries of that
+    pipeline. An answer is only stored if no invalidation happened while
+    it was in flight.
+    """
+    def __init__(self, ttl=1.0, size=256):
+        self.ttl = ttl
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+        self.invalidations = 0
+        self._entries = collections.OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, cmd_line):
+        """
+        Returns the cached answer of a command line or None, with the
+        generation to give back to put()
+        """
+        key = tuple(cmd_line)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] > self.ttl:
+                del self._entries[key]
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None, self._generation
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], self._generation
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def put(self, cmd_line, answer, generation):
+        with self._lock:
+            if generation != self._generation:
+                return
+            key = tuple(cmd_line)
+            self._entries[key] = (time.monotonic(), answer, command_pipe(cmd_line))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+                self.evicted += 1
+
+    def invalidate(self, cmd_line):
+        structural = cmd_line[0] in STRUCTURAL_COMMANDS
+        pipe = command_pipe(cmd_line)
+        if not structural and pipe is None:
+            return
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            if structural:
+                self._entries.clear()
+                return
+            for key in [key for key, entry in self._entries.items() if entry[2] == pipe]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else None,
+                'expired': self.expired,
+                'evicted': self.evicted,
+                'invalidations': self.invalidations,
+            }
+
+
+class Batch(object):
+    """
+    Queue of GStreamer Daemon commands executed together by a client
+
+    Any gstd command can be queued by calling it as a method, e.g.
+    batch.pipeline_play('p0') or batch.element_set('p0', 'src0',
+    'listen-to', 'cam'). Results are available in the results list
+    once the batch runs, one parsed response per queued command.
+    """
+    def __init__(self, client, ordered=True):
+        self._client = client
+        self.ordered = ordered
+        self.commands = []
+        self.results = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.execute()
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        def queue(*args):
+            return self.add([name] + [str(arg) for arg in args])
+        return queue
+
+    def add(self, cmd_line):
+        self.commands.append(cmd_line)
+        return len(self.commands) - 1
+
+    def execute(self):
+        self.results = self._client.execute_many(self.commands, self.ordered)
+        return self.results
+
+    def errors(self):
+        """
+        Returns (index, command, result) for every failed command
+        """
+        return [(i, self.commands[i], r) for i, r in enumerate(self.results or [])
+                if r['code'] != 0]
+
 class client(object):
-    def __init__(self, ip='localhost', port=5000, logfile=None, loglevel='ERROR'):
+    def __init__(self, ip='localhost', port=5000, logfile=None, loglevel='ERROR', pool_size=4, timeout=None,
+                 read_size=default_read_size, metrics=True, cache_ttl=None, cache_size=256):
         
         # Init the logger
         self.logger = logging.getLogger('GSTD')
@@ -71,69 +452,193 @@ class client(object):
         self.proc = None
         self.pipes = []
         self.gstd_started = False
+        self.pool = ConnectionPool(ip, port, pool_size, timeout, read_size)
+        self.metrics = ClientMetrics('%s:%d' % (ip, port)) if metrics else None
+        # Opt-in cache of the read and list_* answers
+        self.cache = ResponseCache(cache_ttl, cache_size) if cache_ttl else None
+        self._executor = None
         self.logger.info('Starting GSTD instance with ip=%s port=%d logfile=%s loglevel=%s', self.ip, self.port, logfile, loglevel)
         self.test_gstd()
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
     def __del__(self):
         self.logger.info('Destroying GSTD instance with ip=%s port=%d', self.ip, self.port)
+        self.close()
+        if (self.gstd_started):
+            self.logger.info('Killing GStreamer Daemon process...')
+            kill_gstd(self.proc, self.ip, self.port)
+
+    def close(self):
+        if self.pool.closed:
+            return
         self.logger.info('Deleting pipelines...')
         while (self.pipes != []):
             ret = self.pipeline_delete(self.pipes[0])
             if (ret != 0):
                 self.pipes.pop(0)
-        if (self.gstd_started):
-            self.logger.info('Killing GStreamer Daemon process...')
-            self.proc.kill()
+        self.logger.info('Closing connections to GSTD at ip=%s port=%d', self.ip, self.port)
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        self.pool.close()
+
+    def pool_stats(self):
+        return self.pool.stats()
+
+    def metrics_snapshot(self):
+        return self.metrics.snapshot() if self.metrics else None
+
+    def cache_stats(self):
+        return self.cache.stats() if self.cache else None
 
     def socket_send(self, line):
         self.logger.debug('GSTD socket sending line: %s', line)
-        try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            s.connect((self.ip, self.port))
-            s.send(' '.join(line).encode('utf-8'))
-            data = recvall(s)
-            data = data.decode('utf-8')
-        except socket.error:
+        payload = ' '.join(str(arg) for arg in line).encode('utf-8')
+        start = self.metrics.begin() if self.metrics else None
+        data = None
+        while True:
+            try:
+                conn, reused = self.pool.acquire()
+            except socket.error:
+                self.logger.error('GSTD socket error')
+                break
+            # Only commands the daemon can't have run are sent again
+            retry = False
+            try:
+                conn.send(payload)
+            except socket.timeout:
+                data = None
+            except socket.error:
+                data = None
+                retry = True
+            else:
+                try:
+                    data = conn.recv()
+                    retry = data is None and not conn.framer.pending()
+                except ConnectionError:
+                    data = None
+                    retry = not conn.framer.pending()
+                except socket.error:
+                    data = None
+            if data is not None:
+                self.pool.release(conn)
+                break
+            self.pool.release(conn, reuse=False)
+            if reused and retry:
+                # The daemon dropped an idle connection, retry on a fresh one
+                self.logger.debug('GSTD pooled connection closed, reconnecting')
+                self.pool.count_reconnect()
+                continue
             self.logger.error('GSTD socket error')
-            data = None
+            break
+        if self.metrics:
+            self.metrics.end(line[0], start, len(payload), len(data) if data is not None else 0, data is None)
+        if self.cache and line[0] not in CACHED_COMMANDS:
+            self.cache.invalidate(line)
+        if data is not None:
+            data = data.decode('utf-8')
         self.logger.debug('GSTD socket received answer:\n %s', data)
         return data
 
-    def start_gstd(self):
+    def cached_send(self, line, fresh=False):
+        """
+        socket_send through the cache, when the client has one. Fresh
+        reads skip the lookup but still refresh the entry. Only
+        successful answers are stored.
+        """
+        if not self.cache:
+            return self.socket_send(line)
+        if not fresh:
+            data, generation = self.cache.get(line)
+            if data is not None:
+                self.logger.debug('GSTD cache hit for line: %s', line)
+                return data
+        else:
+            generation = self.cache.generation
+        data = self.socket_send(line)
         try:
-            gstd_bin = subprocess.check_output(['which',GSTD_PROCNAME])
-            gstd_bin = gstd_bin.rstrip()
-            self.logger.info('Startting GStreamer Daemon...')
-            subprocess.Popen([gstd_bin])
-            time.sleep(3)
-            if self.test_gstd():
-                self.gstd_started = True
-                self.logger.info("GStreamer Daemon started successfully!")
-                return True
-            else:
-                self.logger.info("GStreamer Daemon did not start correctly...")
-                return False
-        except subprocess.CalledProcessError:
-            # Did not find gstd
+            if data is not None and json.loads(data)['code'] == 0:
+                self.cache.put(line, data, generation)
+        except (ValueError, KeyError, TypeError):
+            pass
+        return data
+
+    def batch(self, ordered=True):
+        return Batch(self, ordered)
+
+    def execute_many(self, commands, ordered=True):
+        """
+        Runs a list of command lines and returns one parsed response per
+        command. Ordered batches run back to back on a warm pooled
+        connection so dependent commands see each other's effects;
+        unordered batches are spread over all the pool connections at once.
+        """
+        self.logger.info('Executing batch of %d commands', len(commands))
+        if ordered or len(commands) < 2:
+            answers = [self.socket_send(cmd_line) for cmd_line in commands]
+        else:
+            if not self._executor:
+                self._executor = concurrent.futures.ThreadPoolExecutor(self.pool.size)
+            answers = list(self._executor.map(self.socket_send, commands))
+        results = []
+        for cmd_line, jresult in zip(commands, answers):
+            try:
+                result = json.loads(jresult)
+                if (result['code'] != 0):
+                    self.logger.error('Batch command %s error: %s', cmd_line[0], result['description'])
+                else:
+                    self._track_pipes(cmd_line)
+            except (TypeError, ValueError):
+                self.logger.error('Batch command %s error', cmd_line[0])
+                result = {'code': -1, 'description': 'Invalid or missing response', 'response': None}
+            results.append(result)
+        return results
+
+    def _track_pipes(self, cmd_line):
+        if cmd_line[0] == 'pipeline_create':
+            self.pipes.append(cmd_line[1])
+        elif cmd_line[0] == 'pipeline_delete' and cmd_line[1] in self.pipes:
+            self.pipes.remove(cmd_line[1])
+        elif cmd_line[0] == 'create' and cmd_line[1] == 'pipelines':
+            self.pipes.append(cmd_line[2])
+        elif cmd_line[0] == 'delete' and cmd_line[1] == 'pipelines' and cmd_line[2] in self.pipes:
+            self.pipes.remove(cmd_line[2])
+
+    def start_gstd(self):
+        if not shutil.which(GSTD_PROCNAME):
             self.logger.error("GStreamer Daemon is not running and it is not installed.")
             self.logger.error("To get GStreamer Daemon, visit https://www.ridgerun.com/gstd.")
+            return False
+        self.logger.info('Starting GStreamer Daemon...')
+        self.proc = launch_gstd(self.ip, self.port)
+        if self.proc:
+            self.gstd_started = True
+            self.logger.info("GStreamer Daemon started successfully!")
+            return True
+        self.logger.info("GStreamer Daemon did not start correctly...")
         return False
 
     def test_gstd(self):
+        if find_gstd(self.ip, self.port):
+            return True
         if self.ip not in ['localhost', '127.0.0.1']:
-            # bypass process check, we don't know how to start gstd remotely
+            # we don't know how to start gstd remotely
             self.logger.warning("Assuming GSTD is running in the remote host at %s" % self.ip )
             return True
-        for proc in psutil.process_iter():
-        # check whether the process name matches
-            if proc.name() == GSTD_PROCNAME:
-                self.proc = proc
-        if self.proc or self.start_gstd():
-            # we already had gstd or were able to start it.
+        if launched_gstd(self.port) or running_gstd():
+            # Up but not answering yet, give it time before starting another
+            self.logger.info('Waiting for the running GStreamer Daemon...')
+            if wait_for_gstd(self.ip, self.port):
+                return True
+        if self.start_gstd():
             return True
-        else:
-            self.logger.error("GStreamer Daemon is not running and couldn't be started")
-            return False
+        self.logger.error("GStreamer Daemon is not running and couldn't be started")
+        return False
 
     def create(self, uri, property, value):
         self.logger.info('Creating property %s in uri %s with value "%s"', property, uri, value)
@@ -151,11 +656,11 @@ class client(object):
             traceback.print_exc()
             return None
 
-    def read(self, uri):
+    def read(self, uri, fresh=False):
         self.logger.info('Reading uri %s', uri)
         cmd_line = ['read', uri]
         try:
-            jresult = self.socket_send(cmd_line)
+            jresult = self.cached_send(cmd_line, fresh)
             result = json.loads(jresult)
             return result
         except Exception:
@@ -163,6 +668,27 @@ class client(object):
             traceback.print_exc()
             return None
 
+    def wait_pipeline_state(self, pipe_name, state='PLAYING', timeout=30.0, delay=0.05, max_delay=1.0):
+        """
+        Polls the state of a pipeline with backoff until it reaches the
+        target state, returns False if it doesn't before the timeout
+        """
+        self.logger.info('Waiting for pipeline %s to reach %s', pipe_name, state)
+        deadline = time.monotonic() + timeout
+        while True:
+            result = self.read('/pipelines/%s/state' % pipe_name, fresh=True)
+            try:
+                if result['response']['value'].upper() == state.upper():
+                    return True
+            except (KeyError, TypeError, AttributeError):
+                pass
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.logger.error('Pipeline %s did not reach %s in %s seconds', pipe_name, state, timeout)
+                return False
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, max_delay)
+
     def update(self, uri, value):
         self.logger.info('Updating uri %s with value "%s"', uri, value)
         cmd_line = ['update', uri, value]
@@ -300,57 +826,57 @@ class client(object):
             self.logger.error("invalid value received")
         return value
 
-    def list_pipelines(self):
+    def list_pipelines(self, fresh=False):
         self.logger.info('Listing pipelines')
         cmd_line = ['list_pipelines']
         try:
-            jresult = self.socket_send(cmd_line)
+            jresult = self.cached_send(cmd_line, fresh)
             result = json.loads(jresult)
             if (result['code'] != 0):
                 self.logger.error('Pipelines list error: %s', result['description'])
-            return result['nodes']
+            return result['response']['nodes']
         except Exception:
             self.logger.error('Pipelines list error')
             traceback.print_exc()
             return None
 
-    def list_elements(self, pipe):
+    def list_elements(self, pipe, fresh=False):
         self.logger.info('Listing elements of pipeline %s', pipe)
         cmd_line = ['list_elements', pipe]
         try:
-            jresult = self.socket_send(cmd_line)
+            jresult = self.cached_send(cmd_line, fresh)
             result = json.loads(jresult)
             if (result['code'] != 0):
                 self.logger.error('Elements list error: %s', result['description'])
-            return result['nodes']
+            return result['response']['nodes']
         except Exception:
             self.logger.error('Elements list error')
             traceback.print_exc()
             return None
 
-    def list_properties(self, pipe, element):
-        self.logger.info('Listing properties of  element %s from pipeline %s', element, pipeline)
+    def list_properties(self, pipe, element, fresh=False):
+        self.logger.info('Listing properties of  element %s from pipeline %s', element, pipe)
         cmd_line = ['list_properties', pipe, element]
         try:
-            jresult = self.socket_send(cmd_line)
+            jresult = self.cached_send(cmd_line, fresh)
             result = json.loads(jresult)
             if (result['code'] != 0):
                 self.logger.error('Properties list error: %s', result['description'])
-            return result['nodes']
+            return result['response']['nodes']
         except Exception:
             self.logger.error('Properties list error')
             traceback.print_exc()
             return None
 
-    def list_signals(self, pipe, element):
-        self.logger.info('Listing signals of  element %s from pipeline %s', element, pipeline)
+    def list_signals(self, pipe, element, fresh=False):
+        self.logger.info('Listing signals of  element %s from pipeline %s', element, pipe)
         cmd_line = ['list_signals', pipe, element]
         try:
-            jresult = self.socket_send(cmd_line)
+            jresult = self.cached_send(cmd_line, fresh)
             result = json.loads(jresult)
             if (result['code'] != 0):
                 self.logger.error('Signals list error: %s', result['description'])
-            return result['nodes']
+            return result['response']['nodes']
         except Exception:
             self.logger.error('Signals list error')
             traceback.print_exc()
@@ -362,6 +888,7 @@ class client(object):
         try:
             jresult = self.socket_send(cmd_line)
             result = json.loads(jresult)
+            return result
         except Exception:
             self.logger.error('Bus read error')
             traceback.print_exc()
@@ -513,7 +1040,7 @@ class client(object):
 
     def debug_color(self, colors):
         self.logger.info('Enabling/Disabling GStreamer debug colors')
-        cmd_line = ['debug_color', color]
+        cmd_line = ['debug_color', colors]
         try:
             jresult = self.socket_send(cmd_line)
             result = json.loads(jresult)
@@ -538,3 +1065,327 @@ class client(object):
             self.logger.error('Debug reset error')
             traceback.print_exc()
             return None
+
+
+class AsyncClient(object):
+    """
+    asyncio client for GStreamer Daemon
+
+    Mirrors the command surface of client, with every command as a
+    coroutine. Commands run concurrently over a bounded pool of
+    persistent streams, accept a per call timeout and can be cancelled;
+    a connection interrupted mid command is discarded, never reused.
+    Blocking waits are also available as async iterators through
+    signal_events() and bus_messages().
+    """
+    def __init__(self, ip='localhost', port=5000, pool_size=8, timeout=None,
+                 read_size=default_read_size, metrics=True):
+        self.logger = logging.getLogger('GSTD')
+        self.ip = ip
+        self.port = port
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.read_size = read_size
+        self.metrics = ClientMetrics('%s:%d/async' % (ip, port)) if metrics else None
+        self.pipes = []
+        self._idle = []
+        self._slots = None
+        self._closed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, tb):
+        await self.close()
+
+    async def close(self):
+        if self._closed:
+            return
+        self.logger.info('Deleting pipelines...')
+        while self.pipes:
+            ret = await self.pipeline_delete(self.pipes[0])
+            if (ret != 0):
+                self.pipes.pop(0)
+        self._closed = True
+        idle, self._idle = self._idle, []
+        for _, writer, _ in idle:
+            writer.close()
+
+    async def _acquire(self):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.pool_size)
+        await self._slots.acquire()
+        try:
+            if self._closed:
+                raise ConnectionError('GSTD client is closed')
+            while self._idle:
+                conn = self._idle.pop()
+                if not conn[0].at_eof():
+                    return conn, True
+                conn[1].close()
+            reader, writer = await asyncio.open_connection(self.ip, self.port)
+            return (reader, writer, ResponseFramer(self.read_size)), False
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _release(self, conn, reuse=True):
+        if reuse and not self._closed and not conn[2].pending():
+            self._idle.append(conn)
+        else:
+            conn[1].close()
+        self._slots.release()
+
+    async def _transact(self, conn, payload):
+        reader, writer, framer = conn
+        writer.write(payload)
+        await writer.drain()
+        msg = framer.next_response()
+        while msg is None:
+            data = await reader.read(self.read_size)
+            if not data:
+                return None
+            framer.feed(data)
+            msg = framer.next_response()
+        return msg
+
+    async def socket_send(self, line, timeout=None):
+        self.logger.debug('GSTD socket sending line: %s', line)
+        if timeout is None:
+            timeout = self.timeout
+        payload = ' '.join(str(arg) for arg in line).encode('utf-8')
+        start = self.metrics.begin() if self.metrics else None
+        try:
+            data = await self._send(payload, timeout)
+        except BaseException:
+            if self.metrics:
+                self.metrics.end(line[0], start, len(payload), 0, True)
+            raise
+        if self.metrics:
+            self.metrics.end(line[0], start, len(payload), len(data) if data is not None else 0, data is None)
+        if data is not None:
+            data = data.decode('utf-8')
+        self.logger.debug('GSTD socket received answer:\n %s', data)
+        return data
+
+    async def _send(self, payload, timeout):
+        data = None
+        while True:
+            try:
+                conn, reused = await self._acquire()
+            except OSError:
+                self.logger.error('GSTD socket error')
+                break
+            # Only commands the daemon can't have run are sent again
+            retry = False
+            try:
+                data = await asyncio.wait_for(self._transact(conn, payload), timeout)
+                retry = data is None and not conn[2].pending()
+            except asyncio.TimeoutError:
+                self._release(conn, reuse=False)
+                raise
+            except ConnectionError:
+                data = None
+                retry = not conn[2].pending()
+            except OSError:
+                data = None
+            except BaseException:
+                # Cancelled with a response still pending
+                self._release(conn, reuse=False)
+                raise
+            if data is not None:
+                self._release(conn)
+                break
+            self._release(conn, reuse=False)
+            if reused and retry:
+                self.logger.debug('GSTD pooled connection closed, reconnecting')
+                continue
+            self.logger.error('GSTD socket error')
+            break
+        return data
+
+    async def command(self, cmd_line, timeout=None):
+        """
+        Runs a command line and returns the parsed response or None
+        """
+        jresult = await self.socket_send(cmd_line, timeout)
+        try:
+            result = json.loads(jresult)
+        except (TypeError, ValueError):
+            self.logger.error('Command %s error: invalid or missing response', cmd_line[0])
+            return None
+        if (result['code'] != 0):
+            self.logger.error('Command %s error: %s', cmd_line[0], result['description'])
+        return result
+
+    async def execute_many(self, commands, ordered=True, timeout=None):
+        if ordered:
+            return [await self.command(cmd_line, timeout) for cmd_line in commands]
+        return await asyncio.gather(*[self.command(cmd_line, timeout) for cmd_line in commands])
+
+    async def _code(self, cmd_line, timeout=None):
+        result = await self.command(cmd_line, timeout)
+        return result['code'] if result else None
+
+    async def _nodes(self, cmd_line, timeout=None):
+        result = await self.command(cmd_line, timeout)
+        return result['response']['nodes'] if result else None
+
+    async def create(self, uri, property, value, timeout=None):
+        self.logger.info('Creating property %s in uri %s with value "%s"', property, uri, value)
+        code = await self._code(['create', uri, property, value], timeout)
+        if (code == 0 and uri == "pipelines"):
+            self.pipes.append(property)
+        return code
+
+    async def read(self, uri, timeout=None):
+        self.logger.info('Reading uri %s', uri)
+        return await self.command(['read', uri], timeout)
+
+    async def update(self, uri, value, timeout=None):
+        self.logger.info('Updating uri %s with value "%s"', uri, value)
+        return await self._code(['update', uri, value], timeout)
+
+    async def delete(self, uri, name, timeout=None):
+        self.logger.info('Deleting name %s at uri "%s"', name, uri)
+        code = await self._code(['delete', uri, name], timeout)
+        if (code == 0 and uri == "pipelines" and name in self.pipes):
+            self.pipes.remove(name)
+        return code
+
+    async def pipeline_create(self, pipe_name, pipe_desc, timeout=None):
+        self.logger.info('Creating pipeline %s with description "%s"', pipe_name, pipe_desc)
+        code = await self._code(['pipeline_create', pipe_name, pipe_desc], timeout)
+        if (code == 0):
+            self.pipes.append(pipe_name)
+        return code
+
+    async def pipeline_delete(self, pipe_name, timeout=None):
+        self.logger.info('Deleting pipeline %s', pipe_name)
+        code = await self._code(['pipeline_delete', pipe_name], timeout)
+        if (code == 0 and pipe_name in self.pipes):
+            self.pipes.remove(pipe_name)
+        return code
+
+    async def pipeline_play(self, pipe_name, timeout=None):
+        self.logger.info('Playing pipeline %s', pipe_name)
+        return await self._code(['pipeline_play', pipe_name], timeout)
+
+    async def pipeline_pause(self, pipe_name, timeout=None):
+        self.logger.info('Pausing pipeline %s', pipe_name)
+        return await self._code(['pipeline_pause', pipe_name], timeout)
+
+    async def pipeline_stop(self, pipe_name, timeout=None):
+        self.logger.info('Stoping pipeline %s', pipe_name)
+        return await self._code(['pipeline_stop', pipe_name], timeout)
+
+    async def element_set(self, pipe_name, element, prop, value, timeout=None):
+        self.logger.info('Setting element %s %s property in pipeline %s to:%s', element, prop, pipe_name, value)
+        return await self._code(['element_set', pipe_name, "%s %s %s" % (element, prop, value)], timeout)
+
+    async def element_get(self, pipe_name, element, prop, timeout=None):
+        self.logger.info('Getting value of element %s %s property in pipeline %s', element, prop, pipe_name)
+        result = await self.command(['element_get', pipe_name, "%s %s" % (element, prop)], timeout)
+        try:
+            return result['response']['value']
+        except (KeyError, TypeError):
+            self.logger.error("invalid value received")
+            return None
+
+    gstd_element_get = element_get
+
+    async def list_pipelines(self, timeout=None):
+        self.logger.info('Listing pipelines')
+        return await self._nodes(['list_pipelines'], timeout)
+
+    async def list_elements(self, pipe, timeout=None):
+        self.logger.info('Listing elements of pipeline %s', pipe)
+        return await self._nodes(['list_elements', pipe], timeout)
+
+    async def list_properties(self, pipe, element, timeout=None):
+        self.logger.info('Listing properties of  element %s from pipeline %s', element, pipe)
+        return await self._nodes(['list_properties', pipe, element], timeout)
+
+    async def list_signals(self, pipe, element, timeout=None):
+        self.logger.info('Listing signals of  element %s from pipeline %s', element, pipe)
+        return await self._nodes(['list_signals', pipe, element], timeout)
+
+    async def bus_read(self, pipe, timeout=None):
+        self.logger.info('Reading bus of pipeline %s', pipe)
+        return await self.command(['bus_read', pipe], timeout)
+
+    async def bus_filter(self, pipe, filter, timeout=None):
+        self.logger.info('Reading bus of pipeline %s with filter %s', pipe, filter)
+        return await self.command(['bus_filter', pipe, filter], timeout)
+
+    async def bus_timeout(self, pipe, bus_timeout, timeout=None):
+        self.logger.info('Reading bus of pipeline %s with timeout %s', pipe, bus_timeout)
+        return await self.command(['bus_timeout', pipe, bus_timeout], timeout)
+
+    async def bus_messages(self, pipe, timeout=None):
+        """
+        Async iterator over the bus messages of a pipeline, it ends once
+        gstd answers without a message (bus timeout) or fails
+        """
+        while True:
+            result = await self.bus_read(pipe, timeout)
+            if not result or result['code'] != 0 or result['response'] is None:
+                return
+            yield result
+
+    async def event_eos(self, pipe, timeout=None):
+        self.logger.info('Sending end-of-stream event to pipeline %s', pipe)
+        return await self._code(['event_eos', pipe], timeout)
+
+    async def event_seek(self, pipe, rate=1.0, format=3, flags=1, start_type=1, start=0, end_type=1, end=-1,
+                         timeout=None):
+        self.logger.info('Performing event seek in pipeline %s', pipe)
+        cmd_line = ['event_seek', pipe, rate, format, flags, start_type, start, end_type, end]
+        return await self._code(cmd_line, timeout)
+
+    async def event_flush_start(self, pipe, timeout=None):
+        self.logger.info('Putting pipeline %s in flushing mode', pipe)
+        return await self._code(['event_flush_start', pipe], timeout)
+
+    async def event_flush_stop(self, pipe, reset=True, timeout=None):
+        self.logger.info('Taking pipeline %s out of flushing mode', pipe)
+        return await self._code(['event_flush_stop', pipe], timeout)
+
+    async def signal_connect(self, pipe, element, signal, timeout=None):
+        self.logger.info('Connecting to signal %s of element %s from pipeline %s', signal, element, pipe)
+        return await self.command(['signal_connect', pipe, element, signal], timeout)
+
+    async def signal_timeout(self, pipe, element, signal, signal_timeout, timeout=None):
+        self.logger.info('Connecting to signal %s of element %s from pipeline %s with timeout %s', signal, element, pipe, signal_timeout)
+        return await self.command(['signal_timeout', pipe, element, signal, signal_timeout], timeout)
+
+    async def signal_disconnect(self, pipe, element, signal, timeout=None):
+        self.logger.info('Disonnecting from signal %s of element %s from pipeline %s', signal, element, pipe)
+        return await self.command(['signal_disconnect', pipe, element, signal], timeout)
+
+    async def signal_events(self, pipe, element, signal, timeout=None):
+        """
+        Async iterator over the emissions of an element signal, it ends
+        once the signal gets disconnected or the command fails
+        """
+        while True:
+            result = await self.signal_connect(pipe, element, signal, timeout)
+            if not result or result['code'] != 0 or result['response'] is None:
+                return
+            yield result
+
+    async def debug_enable(self, enable, timeout=None):
+        self.logger.info('Enabling/Disabling GStreamer debug')
+        return await self._code(['debug_enable', enable], timeout)
+
+    async def debug_threshold(self, threshold, timeout=None):
+        self.logger.info('Setting GStreamer debug threshold to %s', threshold)
+        return await self._code(['debug_threshold', threshold], timeout)
+
+    async def debug_color(self, colors, timeout=None):
+        self.logger.info('Enabling/Disabling GStreamer debug colors')
+        return await self._code(['debug_color', colors], timeout)
+
+    async def debug_reset(self, reset, timeout=None):
+        self.logger.info('Enabling/Disabling GStreamer debug threshold reset')
+        return await self._code(['debug_reset', reset], timeout)
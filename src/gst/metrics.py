@@ -0,0 +1,190 @@
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Latency buckets in seconds, from local round trips to blocking waits
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram(object):
+    """
+    Fixed bucket histogram, observe() is a bisect and two increments
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class CommandStats(object):
+    """
+    Class used to store the counters of a command type
+    """
+    def __init__(self, buckets):
+        self.latency = Histogram(buckets)
+        self.errors = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+
+
+class ClientMetrics(object):
+    """
+    Instrumentation of the commands sent to a GStreamer Daemon
+
+    Every command type gets a latency histogram, an error counter and
+    bytes in/out counters, and the number of commands in flight is kept
+    as a gauge. Use begin() before sending and end() once answered.
+    """
+    def __init__(self, name='gstd', buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.buckets = buckets
+        self.in_flight = 0
+        self._commands = {}
+        self._lock = threading.Lock()
+
+    def begin(self):
+        with self._lock:
+            self.in_flight += 1
+        return time.perf_counter()
+
+    def end(self, command, start, bytes_out, bytes_in, error=False):
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.in_flight -= 1
+            stats = self._commands.get(command)
+            if stats is None:
+                stats = self._commands[command] = CommandStats(self.buckets)
+            stats.latency.observe(elapsed)
+            stats.bytes_out += bytes_out
+            stats.bytes_in += bytes_in
+            if error:
+                stats.errors += 1
+
+    def snapshot(self):
+        """
+        Returns a copy of all the counters as plain data
+        """
+        with self._lock:
+            return {
+                'in_flight': self.in_flight,
+                'commands': {
+                    command: {
+                        'count': stats.latency.count,
+                        'errors': stats.errors,
+                        'bytes_out': stats.bytes_out,
+                        'bytes_in': stats.bytes_in,
+                        'latency_sum': stats.latency.sum,
+                        'latency_buckets': stats.latency.cumulative(),
+                    }
+                    for command, stats in self._commands.items()
+                },
+            }
+
+    def render(self):
+        """
+        Returns the counters in the Prometheus text exposition format
+        """
+        return render_metrics([self])
+
+    def families(self):
+        """
+        Returns the Prometheus samples of this client by metric family
+        """
+        snapshot = self.snapshot()
+        client = 'client="%s"' % self.name
+        commands = sorted(snapshot['commands'].items())
+        latency = []
+        for command, stats in commands:
+            labels = '%s,command="%s"' % (client, command)
+            for bound, count in stats['latency_buckets']:
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                latency.append('gstd_command_latency_seconds_bucket{%s,le="%s"} %d' % (labels, le, count))
+            latency.append('gstd_command_latency_seconds_sum{%s} %f' % (labels, stats['latency_sum']))
+            latency.append('gstd_command_latency_seconds_count{%s} %d' % (labels, stats['count']))
+        families = {
+            'gstd_commands_in_flight': ('gauge', ['gstd_commands_in_flight{%s} %d' % (client, snapshot['in_flight'])]),
+            'gstd_command_latency_seconds': ('histogram', latency),
+        }
+        for metric, key in (('gstd_command_errors_total', 'errors'),
+                            ('gstd_command_bytes_out_total', 'bytes_out'),
+                            ('gstd_command_bytes_in_total', 'bytes_in')):
+            families[metric] = ('counter', ['%s{%s,command="%s"} %d' % (metric, client, command, stats[key])
+                                            for command, stats in commands])
+        return families
+
+
+def render_metrics(registries):
+    """
+    Renders several registries as one Prometheus text document, with
+    the samples of every metric family grouped under a single TYPE line
+    """
+    merged = {}
+    for registry in registries:
+        for family, (kind, samples) in registry.families().items():
+            merged.setdefault(family, (kind, []))[1].extend(samples)
+    lines = []
+    for family, (kind, samples) in merged.items():
+        lines.append('# TYPE %s %s' % (family, kind))
+        lines.extend(samples)
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsServer(object):
+    """
+    Local HTTP endpoint serving the metrics of a set of registries
+
+    Any object with a families() method, like ClientMetrics, can be
+    registered. The server runs in a daemon thread and binds to
+    localhost unless told otherwise.
+    """
+    def __init__(self, registries, port=9100, address='127.0.0.1'):
+        self.registries = list(registries)
+        self.port = port
+        self.address = address
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        registries = self.registries
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = render_metrics(registries).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.address, self.port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
@@ -1,19 +1,53 @@
+import asyncio
+import collections
+import contextlib
 import logging
+import threading
+import time
 import gi
 gi.require_version('Gst', '1.0')
 from gi.repository import Gst, GLib
 
+
+class RestartPolicy(object):
+    """
+    Class used to store how failed pipelines are restarted
+
+    Restarts wait initial seconds, multiplied by factor after every
+    failed attempt up to maximum. After failures faults within window
+    seconds the circuit opens: the pipeline stays down for cooldown
+    seconds, then gets a single restart attempt.
+    """
+    def __init__(self, initial=0.1, maximum=10.0, factor=2.0, failures=5, window=60.0, cooldown=60.0,
+                 restart_on_eos=True):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.failures = failures
+        self.window = window
+        self.cooldown = cooldown
+        self.restart_on_eos = restart_on_eos
+
+
 class MediaEngine(object):
     """
     Class used to Manage Gstreamer Pipelines
     Media Engine abstracts the Gstreamer control
+
+    Every pipeline is supervised on its own: an EOS or ERROR is
+    attributed to the pipeline and element that posted it, and only that
+    pipeline is restarted, following the RestartPolicy. Meanwhile the
+    interpipesrc elements listening to its interpipesinks are moved to
+    the fallback node given at creation, and moved back once it plays.
     """
-    def __init__(self, session_name, loop):
+    def __init__(self, session_name, loop, policy=None):
         self._session_name = session_name
         self._pipes = {}
         self._loop = loop
+        self.policy = policy or RestartPolicy()
+        self._lock = threading.Lock()
 
-    def create_pipe(self, pipe_name, pipe_desc):
+    def create_pipe(self, pipe_name, pipe_desc, fallback=None):
         """
         Creates Gstreamer Pipeline from a description
         Parameters
@@ -22,6 +56,9 @@ class MediaEngine(object):
             Name of the pipeline to create
         pipe_desc : Pipeline Description
             Pipeline Description to create
+        fallback : Interpipe Node
+            Node the listeners of this pipeline switch to while it
+            restarts, they keep listening to it by default
         Raises
         ------
         RuntimeError:
@@ -33,25 +70,39 @@ class MediaEngine(object):
             raise RuntimeError("Invalid Pipeline Description")
 
         logging.info("Creating pipeline {} with description: {}".format(pipe_name, pipe_desc))
-        pipeline = Pipeline(pipe_name, pipe_desc)
-
-        try:
-            gst_pipe = Gst.parse_launch(pipe_desc)
-        except GLib.Error as e:
-            raise RuntimeError("Gstreamer Failed Parsing pipeline", str(e))
-
-        bus = gst_pipe.get_bus()
+        self._register(pipe_name, pipe_desc, parse(pipe_desc), fallback)
 
+    def _register(self, pipe_name, pipe_desc, gst_pipe, fallback):
+        pipeline = Pipeline(pipe_name, pipe_desc)
+        pipeline.fallback = fallback
         pipeline.gst_pipe = gst_pipe
-        pipeline.bus = bus
+        pipeline.bus = gst_pipe.get_bus()
         self._pipes[pipe_name] = pipeline
 
         try:
-            bus.add_signal_watch()
-            bus.connect("message", self._bus_call, self._loop)
+            self._watch_bus(pipe_name, pipeline.bus)
         except GLib.Error as e:
             raise RuntimeError("Gstreamer Failed Connecting Bus: ", str(e))
 
+    def _watch_bus(self, pipe_name, bus):
+        bus.add_signal_watch()
+        bus.connect("message", self._bus_call, pipe_name)
+
+    def _unwatch_bus(self, pipe_name, bus):
+        bus.remove_signal_watch()
+
+    def _schedule(self, delay, callback, *args):
+        return GLib.timeout_add(int(delay * 1000), callback, *args)
+
+    def _unschedule(self, handle):
+        GLib.source_remove(handle)
+
+    def _offload(self, function, args, done=None):
+        # Blocking GStreamer calls of the supervision, done(result) follows
+        result = function(*args)
+        if done:
+            done(result)
+
     def play_pipe(self, pipe_name):
         """
         Plays the Gstreamer Pipeline initially created
@@ -72,6 +123,7 @@ class MediaEngine(object):
             return
 
         logging.info("Playing pipeline {}".format(pipe_name))
+        pipeline.wanted = True
 
         try:
             pipeline.gst_pipe.set_state(Gst.State.PLAYING)
@@ -98,6 +150,9 @@ class MediaEngine(object):
             return
 
         logging.info("Stopping pipeline {}".format(pipe_name))
+        with self._lock:
+            pipeline.wanted = False
+            self._cancel_restart(pipeline)
 
         try:
             if(pipeline.gst_pipe.get_state(1 * Gst.SECOND)[1] == Gst.State.NULL):
@@ -106,7 +161,105 @@ class MediaEngine(object):
         except GLib.Error as e:
             raise RuntimeError("Gstreamer Failed Stopping Pipeline: ", str(e))
 
-    def _bus_call(self, bus, message, loop):
+    def delete_pipe(self, pipe_name):
+        """
+        Stops the Gstreamer Pipeline and releases it
+        Parameters
+        ----------
+        pipe_name : Pipeline Name
+            Name of the pipeline to delete
+        """
+        if pipe_name not in self._pipes:
+            logging.error("Pipeline {} has not been created".format(pipe_name))
+            return
+
+        self.stop_pipe(pipe_name)
+        logging.info("Deleting pipeline {}".format(pipe_name))
+        with self._lock:
+            pipeline = self._pipes.pop(pipe_name)
+        self._unwatch_bus(pipe_name, pipeline.bus)
+        pipeline.gst_pipe = None
+        pipeline.bus = None
+
+    def get_element(self, pipe_name, element_name):
+        """
+        Looks up an element of a pipeline by name
+        Parameters
+        ----------
+        pipe_name : Pipeline Name
+            Name of the pipeline owning the element
+        element_name : Element Name
+            Name given to the element in the pipeline description
+        Raises
+        ------
+        RuntimeError:
+            In case the pipeline hasn't been created yet
+            In case the pipeline has no element with that name
+        """
+        try:
+            pipeline = self._pipes[pipe_name]
+        except KeyError:
+            raise RuntimeError("Pipeline {} has not been created".format(pipe_name))
+
+        element = pipeline.gst_pipe.get_by_name(element_name)
+        if not element:
+            raise RuntimeError("Pipeline {} has no element {}".format(pipe_name, element_name))
+        return element
+
+    def add_probe(self, pipe_name, element_name, pad_name, callback):
+        """
+        Calls back with every buffer crossing a pad of an element
+        Parameters
+        ----------
+        pipe_name : Pipeline Name
+            Name of the pipeline owning the element
+        element_name : Element Name
+            Name given to the element in the pipeline description
+        pad_name : Pad Name
+            Static pad of the element, like src or sink
+        callback : callable
+            Called as callback(buffer) from the streaming thread
+        Returns
+        -------
+        int
+            Probe id, to remove the probe
+        Raises
+        ------
+        RuntimeError:
+            In case the pipeline or the element don't exist
+            In case the element has no such pad
+        """
+        pad = self.get_element(pipe_name, element_name).get_static_pad(pad_name)
+        if not pad:
+            raise RuntimeError("Element {} has no pad {}".format(element_name, pad_name))
+
+        def probe(pad, info):
+            callback(info.get_buffer())
+            return Gst.PadProbeReturn.OK
+
+        return pad.add_probe(Gst.PadProbeType.BUFFER, probe)
+
+    def remove_probe(self, pipe_name, element_name, pad_name, probe_id):
+        """
+        Removes a probe added with add_probe
+        Raises
+        ------
+        RuntimeError:
+            In case the pipeline or the element don't exist
+        """
+        pad = self.get_element(pipe_name, element_name).get_static_pad(pad_name)
+        if pad:
+            pad.remove_probe(probe_id)
+
+    def stats(self):
+        """
+        Returns the supervision state and counters of every pipeline,
+        recovery times in seconds from the fault to PLAYING again
+        """
+        with self._lock:
+            return {name: pipeline.stats() for name, pipeline in self._pipes.items()}
+
+    def _bus_call(self, bus, message, pipe_name):
         """
         Gstreamer Bus Callback to handle Gstreamer Messages
         Parameters
@@ -115,24 +268,147 @@ class MediaEngine(object):
             Gstreamer Bus owner of the callback
         message : GstMessage
             Gstreamer Message arriving to the bus
-        loop : GObject MainLoop
-            GObject Mainloop
+        pipe_name : Pipeline Name
+            Name of the pipeline owning the bus
         Returns
         -------
         bool
             Callback result
         """
+        pipeline = self._pipes.get(pipe_name)
+        if pipeline is None:
+            return True
         mtype = message.type
-        if mtype == Gst.MessageType.EOS or mtype == Gst.MessageType.ERROR:
-            if mtype == Gst.MessageType.EOS:
-                logging.warn('Detected EOS from session {}'.format(self._session_name))
+        if mtype == Gst.MessageType.ERROR:
+            error, debug = message.parse_error()
+            self._fault(pipeline, message.src.get_name(), error.message)
+            logging.debug("Pipeline {} error details: {}".format(pipe_name, debug))
+        elif mtype == Gst.MessageType.EOS:
+            if self.policy.restart_on_eos:
+                self._fault(pipeline, message.src.get_name(), "EOS")
             else:
-                logging.warn('Detected ERROR from session {}'.format(self._session_name))
-            for pipe in self._pipes:
-                self.stop_pipe(pipe)
-            loop.quit()
+                logging.warning("Detected EOS from pipeline {} of session {}".format(pipe_name, self._session_name))
+        elif mtype == Gst.MessageType.STATE_CHANGED and message.src == pipeline.gst_pipe:
+            if message.parse_state_changed()[1] == Gst.State.PLAYING:
+                self._recovered(pipeline)
         return True
 
+    def _fault(self, pipeline, element, reason):
+        now = time.monotonic()
+        with self._lock:
+            if not pipeline.wanted or pipeline.restart_timer is not None:
+                # Stopped on purpose, or already waiting for its restart
+                return
+            logging.warning("Detected {} from element {} of pipeline {} in session {}".format(
+                reason, element, pipeline.name, self._session_name))
+            pipeline.faults += 1
+            pipeline.last_error = (element, reason)
+            if pipeline.fault_time is None:
+                pipeline.fault_time = now
+            pipeline.fault_times.append(now)
+            while pipeline.fault_times and now - pipeline.fault_times[0] > self.policy.window:
+                pipeline.fault_times.popleft()
+
+            # A failed attempt after the cooldown opens the circuit again
+            if pipeline.state == "open" or len(pipeline.fault_times) >= self.policy.failures:
+                pipeline.state = "open"
+                pipeline.circuit_opened += 1
+                pipeline.fault_times.clear()
+                delay = self.policy.cooldown
+                logging.error("Pipeline {} keeps failing, next restart in {}s".format(pipeline.name, delay))
+            else:
+                pipeline.state = "restarting"
+                delay = pipeline.backoff or self.policy.initial
+                pipeline.backoff = min(delay * self.policy.factor, self.policy.maximum)
+            pipeline.restart_timer = self._schedule(delay, self._restart, pipeline)
+        self._fail_over(pipeline)
+        self._offload(pipeline.gst_pipe.set_state, (Gst.State.NULL,))
+
+    def _restart(self, pipeline):
+        with self._lock:
+            pipeline.restart_timer = None
+            if not pipeline.wanted:
+                return False
+            pipeline.restarts += 1
+        logging.info("Restarting pipeline {}".format(pipeline.name))
+        self._offload(replay, (pipeline.gst_pipe,), self._restarted(pipeline))
+        # One shot timeout
+        return False
+
+    def _restarted(self, pipeline):
+        def done(result):
+            # Unless it was stopped or deleted meanwhile
+            if result == Gst.StateChangeReturn.FAILURE and pipeline.wanted and pipeline.gst_pipe is not None:
+                self._fault(pipeline, pipeline.name, "failed restart")
+        return done
+
+    def _recovered(self, pipeline):
+        with self._lock:
+            if pipeline.fault_time is None:
+                pipeline.state = "playing"
+                return
+            recovery = time.monotonic() - pipeline.fault_time
+            pipeline.recovery_times.append(recovery)
+            pipeline.fault_time = None
+            pipeline.backoff = None
+            pipeline.state = "playing"
+        logging.info("Pipeline {} recovered in {:.3f}s".format(pipeline.name, recovery))
+        self._fail_back(pipeline)
+
+    def _cancel_restart(self, pipeline):
+        if pipeline.restart_timer is not None:
+            self._unschedule(pipeline.restart_timer)
+            pipeline.restart_timer = None
+        pipeline.state = "stopped"
+        pipeline.fault_time = None
+        pipeline.backoff = None
+
+    def _fail_over(self, pipeline):
+        if not pipeline.fallback or pipeline.failed_over:
+            return
+        nodes = {element.get_name() for element in pipeline.gst_pipe.iterate_recurse()
+                 if factory_name(element) == "interpipesink"}
+        for other in list(self._pipes.values()):
+            if other is pipeline:
+                continue
+            for element in other.gst_pipe.iterate_recurse():
+                if factory_name(element) == "interpipesrc" and element.get_property("listen-to") in nodes:
+                    pipeline.failed_over.append((element, element.get_property("listen-to")))
+                    element.set_property("listen-to", pipeline.fallback)
+        if pipeline.failed_over:
+            logging.info("Listeners of pipeline {} moved to {}".format(pipeline.name, pipeline.fallback))
+
+    def _fail_back(self, pipeline):
+        for element, node in pipeline.failed_over:
+            # Unless someone else moved it meanwhile
+            if element.get_property("listen-to") == pipeline.fallback:
+                element.set_property("listen-to", node)
+        pipeline.failed_over = []
+
+
+def parse(pipe_desc):
+    """
+    Builds a Gstreamer Pipeline from a description
+    Raises
+    ------
+    RuntimeError:
+        In case the description does not parse
+    """
+    try:
+        return Gst.parse_launch(pipe_desc)
+    except GLib.Error as e:
+        raise RuntimeError("Gstreamer Failed Parsing pipeline", str(e))
+
+
+def replay(gst_pipe):
+    gst_pipe.set_state(Gst.State.NULL)
+    return gst_pipe.set_state(Gst.State.PLAYING)
+
+
+def factory_name(element):
+    factory = element.get_factory()
+    return factory.get_name() if factory else None
+
 
 class Pipeline(object):
     """
@@ -141,3 +417,238 @@ class Pipeline(object):
     def __init__(self, name, pipe_desc):
         self.name = name
         self.pipe_desc = pipe_desc
+        self.gst_pipe = None
+        self.bus = None
+        self.fallback = None
+        self.wanted = False
+        self.state = "stopped"
+        self.faults = 0
+        self.restarts = 0
+        self.circuit_opened = 0
+        self.last_error = None
+        self.fault_time = None
+        self.fault_times = collections.deque()
+        self.backoff = None
+        self.restart_timer = None
+        self.recovery_times = collections.deque(maxlen=256)
+        self.failed_over = []
+
+    def stats(self):
+        recovery = list(self.recovery_times)
+        return {
+            "state": self.state,
+            "faults": self.faults,
+            "restarts": self.restarts,
+            "circuit_opened": self.circuit_opened,
+            "last_error": self.last_error,
+            "recovery_last_s": recovery[-1] if recovery else None,
+            "recovery_mean_s": sum(recovery) / len(recovery) if recovery else None,
+            "recovery_max_s": max(recovery) if recovery else None,
+        }
+
+
+class LoopMediaEngine(MediaEngine):
+    """
+    MediaEngine driven by an asyncio event loop instead of a GLib one
+
+    Every bus is read when its file descriptor turns readable, the
+    supervision timers are asyncio timers, the state changes of faults
+    and restarts run in the executor, and every message is handed to
+    dispatch(pipe_name, message) after the supervision saw it.
+    """
+    def __init__(self, session_name, loop, dispatch, policy=None, executor=None):
+        MediaEngine.__init__(self, session_name, None, policy)
+        self._event_loop = loop
+        self._dispatch = dispatch
+        self._executor = executor
+
+    def _watch_bus(self, pipe_name, bus):
+        self._event_loop.add_reader(bus.get_pollfd().fd, self._drain, pipe_name, bus)
+
+    def _unwatch_bus(self, pipe_name, bus):
+        # delete_pipe may run in an executor
+        self._event_loop.call_soon_threadsafe(self._event_loop.remove_reader, bus.get_pollfd().fd)
+
+    def _schedule(self, delay, callback, *args):
+        return self._event_loop.call_later(delay, callback, *args)
+
+    def _unschedule(self, handle):
+        # stop_pipe may run in an executor
+        self._event_loop.call_soon_threadsafe(handle.cancel)
+
+    def _offload(self, function, args, done=None):
+        future = self._event_loop.run_in_executor(self._executor, function, *args)
+
+        def finished(future):
+            if future.cancelled():
+                return
+            if future.exception():
+                logging.error("Pipeline state change failed: {}".format(future.exception()))
+            elif done:
+                done(future.result())
+        future.add_done_callback(finished)
+
+    def _drain(self, pipe_name, bus):
+        message = bus.pop()
+        while message:
+            self._bus_call(bus, message, pipe_name)
+            self._dispatch(pipe_name, message)
+            message = bus.pop()
+
+
+class AsyncMediaEngine(object):
+    """
+    asyncio front end of MediaEngine
+
+    Mirrors the MediaEngine surface with the pipeline commands as
+    coroutines on the running event loop, no GLib main loop needed.
+    play_pipe returns once the pipeline is PLAYING; parsing, stopping,
+    deleting and get_state block in GStreamer, so they run in an
+    executor, as do the state changes of the supervision. Bus
+    messages are available as an async iterator with messages() or
+    awaited one at a time with wait_message().
+    """
+    def __init__(self, session_name, policy=None, executor=None):
+        self._session_name = session_name
+        self._policy = policy
+        self._executor = executor
+        self._engine = None
+        self._subscribers = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, tb):
+        await self.close()
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            self._engine = LoopMediaEngine(self._session_name, asyncio.get_running_loop(),
+                                           self._dispatch, self._policy, self._executor)
+        return self._engine
+
+    async def create_pipe(self, pipe_name, pipe_desc, fallback=None):
+        """
+        Creates Gstreamer Pipeline from a description, see MediaEngine
+        """
+        if not pipe_desc:
+            raise RuntimeError("Invalid Pipeline Description")
+        logging.info("Creating pipeline {} with description: {}".format(pipe_name, pipe_desc))
+        gst_pipe = await self._blocking(parse, pipe_desc)
+        self.engine._register(pipe_name, pipe_desc, gst_pipe, fallback)
+
+    async def play_pipe(self, pipe_name, timeout=None):
+        """
+        Plays a pipeline and waits until it is PLAYING
+        Raises
+        ------
+        RuntimeError:
+            In case the pipeline hasn't been created yet
+            In case it fails or posts an ERROR before PLAYING
+        asyncio.TimeoutError:
+            In case it is not PLAYING after timeout seconds
+        """
+        gst_pipe = self._pipe(pipe_name)
+        types = Gst.MessageType.STATE_CHANGED | Gst.MessageType.ERROR
+        with self._subscribe(pipe_name, types) as queue:
+            self.engine.play_pipe(pipe_name)
+            if gst_pipe.get_state(0)[1] == Gst.State.PLAYING:
+                return
+            await asyncio.wait_for(self._until_playing(gst_pipe, queue), timeout)
+
+    async def stop_pipe(self, pipe_name):
+        """
+        Stops a pipeline, returns once it is in NULL
+        """
+        await self._blocking(self.engine.stop_pipe, pipe_name)
+
+    async def delete_pipe(self, pipe_name):
+        """
+        Stops a pipeline and releases it, see MediaEngine
+        """
+        await self._blocking(self.engine.delete_pipe, pipe_name)
+
+    async def get_state(self, pipe_name, timeout=1.0):
+        """
+        Returns the (result, state, pending) tuple of gst_element_get_state,
+        waiting up to timeout seconds in the executor
+        """
+        gst_pipe = self._pipe(pipe_name)
+        return await self._blocking(gst_pipe.get_state, int(timeout * Gst.SECOND))
+
+    def get_element(self, pipe_name, element_name):
+        return self.engine.get_element(pipe_name, element_name)
+
+    def add_probe(self, pipe_name, element_name, pad_name, callback):
+        return self.engine.add_probe(pipe_name, element_name, pad_name, callback)
+
+    def remove_probe(self, pipe_name, element_name, pad_name, probe_id):
+        self.engine.remove_probe(pipe_name, element_name, pad_name, probe_id)
+
+    def stats(self):
+        return self.engine.stats()
+
+    async def messages(self, pipe_name=None, types=None):
+        """
+        Yields the bus messages of a pipeline, or of all of them, as
+        they arrive
+        Parameters
+        ----------
+        pipe_name : Pipeline Name
+            Pipeline to follow, all by default
+        types : Gst.MessageType
+            Message types to keep, all by default
+        """
+        with self._subscribe(pipe_name, types) as queue:
+            while True:
+                yield (await queue.get())[1]
+
+    async def wait_message(self, pipe_name=None, types=None, timeout=None):
+        """
+        Returns the next bus message matching, see messages()
+        Raises
+        ------
+        asyncio.TimeoutError:
+            In case none arrives within timeout seconds
+        """
+        with self._subscribe(pipe_name, types) as queue:
+            return (await asyncio.wait_for(queue.get(), timeout))[1]
+
+    async def close(self):
+        if self._engine is None:
+            return
+        for pipe_name in list(self._engine._pipes):
+            await self.delete_pipe(pipe_name)
+
+    def _pipe(self, pipe_name):
+        try:
+            return self.engine._pipes[pipe_name].gst_pipe
+        except KeyError:
+            raise RuntimeError("Pipeline {} has not been created".format(pipe_name))
+
+    async def _until_playing(self, gst_pipe, queue):
+        while True:
+            pipe_name, message = await queue.get()
+            if message.type == Gst.MessageType.ERROR:
+                error, _ = message.parse_error()
+                raise RuntimeError("Pipeline {} failed: {}".format(pipe_name, error.message))
+            if message.src == gst_pipe and message.parse_state_changed()[1] == Gst.State.PLAYING:
+                return
+
+    def _blocking(self, function, *args):
+        return asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    @contextlib.contextmanager
+    def _subscribe(self, pipe_name, types):
+        subscriber = (pipe_name, types, asyncio.Queue())
+        self._subscribers.append(subscriber)
+        try:
+            yield subscriber[2]
+        finally:
+            self._subscribers.remove(subscriber)
+
+    def _dispatch(self, pipe_name, message):
+        for name, types, queue in self._subscribers:
+            if (name is None or name == pipe_name) and (types is None or message.type & types):
+                queue.put_nowait((pipe_name, message))
@@ -3,34 +3,16 @@ import cmd
 import curses
 import json
 import pprint
-import psutil
+import shutil
 import socket
-import subprocess
 import sys
 import time
 import traceback
 
-GSTD_PROCNAME = 'gstd'
+from gst.framing import recvall
+from gst.gstc import find_gstd, kill_gstd, launch_gstd, launched_gstd, running_gstd, wait_for_gstd
 
-terminator = '\x00'.encode('utf-8')
-max_size = 8192
-def recvall(sock):
-    buf = b''
-    count = max_size
-    try:
-        while count:
-            newbuf = sock.recv(max_size//8)
-            if not newbuf: return None
-            if terminator in newbuf:
-                # this is the last item
-                buf += newbuf[:newbuf.find(terminator)]
-                break
-            else:
-                buf += newbuf
-                count -= len(newbuf)
-    except socket.error:
-        buf = json.dumps({"error":"socket error", "msg": traceback.format_exc(), "code": -1 })
-    return buf
+GSTD_PROCNAME = 'gstd'
 
 class GSTD(object):
     def __init__(self, ip='localhost', port=5000):
@@ -45,15 +27,15 @@ class GSTD(object):
         for pipe in self.pipes:
             self.pipeline_delete(pipe)
         if (self.gstd_started):
-            self.proc.kill()
+            kill_gstd(self.proc, self.ip, self.port)
 
     def gstd_client(self, line):
         try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            s.connect((self.ip, self.port))
-            s.send(' '.join(line).encode('utf-8'))
-            data = recvall(s)
-            data = data.decode('utf-8')
+            with socket.create_connection((self.ip, self.port)) as s:
+                s.sendall(' '.join(line).encode('utf-8'))
+                data = recvall(s)
+            if data is not None:
+                data = data.decode('utf-8')
         except socket.error:
             data = None
         return data
@@ -166,37 +148,29 @@ class GSTD(object):
         return value
 
     def start_gstd(self):
-        try:
-            gstd_bin = subprocess.check_output(['which',GSTD_PROCNAME])
-            gstd_bin = gstd_bin.rstrip()
-            print("Starting GStreamer Daemon...")
-            subprocess.Popen([gstd_bin])
-            time.sleep(3)
-            if self.test_gstd():
-                self.gstd_started = True
-                print("GStreamer Daemon started successfully!")
-                return True
-            else:
-                print("GStreamer Daemon did not start correctly...")
-                return False
-        except subprocess.CalledProcessError:
-            # Did not find gstd
+        if not shutil.which(GSTD_PROCNAME):
             print("GStreamer Daemon is not running and it is not installed.")
             print("To get GStreamer Daemon, visit https://www.ridgerun.com/gstd.")
+            return False
+        print("Starting GStreamer Daemon...")
+        self.proc = launch_gstd(self.ip, self.port)
+        if self.proc:
+            self.gstd_started = True
+            print("GStreamer Daemon started successfully!")
+            return True
+        print("GStreamer Daemon did not start correctly...")
         return False
 
     def test_gstd(self):
+        if find_gstd(self.ip, self.port):
+            return True
         if self.ip not in ['localhost', '127.0.0.1']:
-            # bypass process check, we don't know how to start gstd remotely
+            # we don't know how to start gstd remotely
             print("Assuming GSTD is running in the remote host at %s" % self.ip )
             return True
-        for proc in psutil.process_iter():
-        # check whether the process name matches
-            if proc.name() == GSTD_PROCNAME:
-                self.proc = proc
-        if self.proc or self.start_gstd():
-            # we already had gstd or were able to start it.
-            return True
-        else:
-            # we didn't had it, and we couldn't start it.
-            return False
+        if launched_gstd(self.port) or running_gstd():
+            # Up but not answering yet, give it time before starting another
+            if wait_for_gstd(self.ip, self.port):
+                return True
+        # we didn't had it, and we couldn't start it.
+        return self.start_gstd()
@@ -0,0 +1,345 @@
+import importlib
+import logging
+import multiprocessing
+import os
+import threading
+import time
+
+
+class ShardSession(object):
+    """
+    Class used to store what a worker needs to run a session
+
+    pipes are (name, description, fallback) tuples created in order and
+    played together. The pipelines of a session only talk through
+    interpipes between themselves, interpipes do not cross processes.
+    setup is a "module:function" reference, imported and called in the
+    worker as function(engine, session, pipe_names) once the pipelines
+    exist, to attach probes or other per-frame Python work; the object
+    it returns is kept and, if it has a stats() method, reported.
+    """
+    def __init__(self, name, pipes, setup=None):
+        self.name = name
+        self.pipes = [tuple(pipe) + (None,) * (3 - len(pipe)) for pipe in pipes]
+        self.setup = setup
+
+
+class ShardWorker(object):
+    """
+    Class used to store a worker process and its connection
+    """
+    def __init__(self, index, process, conn):
+        self.index = index
+        self.process = process
+        self.conn = conn
+        self.sessions = []
+        self.lock = threading.Lock()
+        self.cpu = None
+        self.load = 0.0
+        self.overloaded = 0
+        self.stats = {}
+
+
+class ShardPool(object):
+    """
+    Shards MediaEngine sessions over a pool of worker processes
+
+    Every worker runs its own MediaEngine, GLib main loop and GIL, so
+    the Python work of the pipeline callbacks scales with the cores. The
+    pool places new sessions on the least loaded worker and drives them
+    over a pipe. A monitor thread collects the worker stats every
+    period: a worker that died or stopped answering is replaced and its
+    sessions are placed again, and a worker above overload cores for
+    patience periods in a row hands one session to the least loaded
+    worker, if that one has room for it.
+    """
+    def __init__(self, workers=None, overload=0.9, patience=3, period=1.0, timeout=5.0, policy=None):
+        """
+        Parameters
+        ----------
+        workers : int
+            Worker processes, one per core by default
+        overload : float
+            CPU cores a worker can use before sessions move away
+        patience : int
+            Monitor periods a worker stays overloaded before a move
+        period : float
+            Seconds between stats collections
+        timeout : float
+            Seconds a worker has to answer a command
+        policy : RestartPolicy
+            Pipeline supervision policy of the worker engines
+        """
+        self.workers = []
+        self.overload = overload
+        self.patience = patience
+        self.period = period
+        self.timeout = timeout
+        self.respawned = 0
+        self.migrated = 0
+        self._count = workers or os.cpu_count()
+        self._policy = policy
+        self._sessions = {}
+        self._context = multiprocessing.get_context("spawn")
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.stop()
+
+    def start(self):
+        self.workers = [self._spawn(i) for i in range(self._count)]
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run_monitor, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        for worker in self.workers:
+            try:
+                self._call(worker, "exit")
+            except RuntimeError:
+                pass
+            worker.process.join(self.timeout)
+            if worker.process.is_alive():
+                worker.process.kill()
+        self.workers = []
+
+    def add_session(self, session):
+        """
+        Creates and plays a ShardSession on the least loaded worker
+        Returns
+        -------
+        int
+            Index of the worker running the session
+        Raises
+        ------
+        RuntimeError:
+            In case the session already exists
+            In case the worker fails creating it
+            In case the pool is not started
+        """
+        with self._lock:
+            if session.name in self._sessions:
+                raise RuntimeError("Session {} already exists".format(session.name))
+            worker = self._least_loaded()
+            if worker is None:
+                raise RuntimeError("Session {} has no worker, the pool is not started".format(session.name))
+            self._place(worker, session)
+            return worker.index
+
+    def remove_session(self, name):
+        with self._lock:
+            session = self._sessions.pop(name)
+            worker = self._owner(name)
+            worker.sessions.remove(session)
+        self._call(worker, "remove", name)
+
+    def placement(self):
+        with self._lock:
+            return {session.name: worker.index for worker in self.workers for session in worker.sessions}
+
+    def stats(self):
+        """
+        Returns the last stats of every worker and their totals
+        """
+        with self._lock:
+            workers = [{
+                "pid": worker.process.pid,
+                "sessions": [session.name for session in worker.sessions],
+                "cpu_cores": worker.load,
+                "engine": worker.stats.get("engine", {}),
+                "setup": worker.stats.get("setup", {}),
+            } for worker in self.workers]
+        return {
+            "workers": workers,
+            "sessions": sum(len(worker["sessions"]) for worker in workers),
+            "cpu_cores": sum(worker["cpu_cores"] for worker in workers),
+            "faults": sum(pipe["faults"] for worker in workers for pipe in worker["engine"].values()),
+            "respawned": self.respawned,
+            "migrated": self.migrated,
+        }
+
+    def _spawn(self, index):
+        conn, child = self._context.Pipe()
+        process = self._context.Process(target=run_worker, args=(child, index, self._policy),
+                                        name="shard-%d" % index, daemon=True)
+        process.start()
+        child.close()
+        return ShardWorker(index, process, conn)
+
+    def _call(self, worker, command, *args):
+        with worker.lock:
+            try:
+                worker.conn.send((command, args))
+                if not worker.conn.poll(self.timeout):
+                    # The late answer would be read as the answer of the
+                    # next command: the worker is dead to the pool, the
+                    # monitor replaces it
+                    worker.process.kill()
+                    raise RuntimeError("Worker {} did not answer {}".format(worker.index, command))
+                status, result = worker.conn.recv()
+            except (EOFError, OSError) as e:
+                raise RuntimeError("Worker {} is gone: {}".format(worker.index, e))
+        if status != "ok":
+            raise RuntimeError("Worker {} failed {}: {}".format(worker.index, command, result))
+        return result
+
+    def _place(self, worker, session):
+        self._call(worker, "add", session)
+        worker.sessions.append(session)
+        self._sessions[session.name] = session
+        logging.info("Session {} placed on worker {}".format(session.name, worker.index))
+
+    def _owner(self, name):
+        for worker in self.workers:
+            if any(session.name == name for session in worker.sessions):
+                return worker
+        return None
+
+    def _least_loaded(self, exclude=None):
+        candidates = [worker for worker in self.workers if worker is not exclude]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda worker: (len(worker.sessions), worker.load))
+
+    def _run_monitor(self):
+        while not self._stop.wait(self.period):
+            for worker in list(self.workers):
+                try:
+                    stats = self._call(worker, "stats")
+                except RuntimeError as e:
+                    logging.error(str(e))
+                    self._replace(worker)
+                    continue
+                if worker.cpu is not None:
+                    worker.load = (stats["cpu"] - worker.cpu) / self.period
+                worker.cpu = stats["cpu"]
+                worker.stats = stats
+            try:
+                self._rebalance()
+            except Exception:
+                logging.exception("Rebalance failed")
+
+    def _replace(self, worker):
+        if worker.process.is_alive():
+            worker.process.kill()
+        worker.process.join()
+        with self._lock:
+            orphans = worker.sessions
+            fresh = self._spawn(worker.index)
+            self.workers[self.workers.index(worker)] = fresh
+            self.respawned += 1
+            for session in orphans:
+                del self._sessions[session.name]
+                try:
+                    self._place(self._least_loaded(), session)
+                except RuntimeError as e:
+                    logging.error("Session {} lost: {}".format(session.name, e))
+
+    def _rebalance(self):
+        with self._lock:
+            for worker in self.workers:
+                worker.overloaded = worker.overloaded + 1 if worker.load > self.overload else 0
+            busiest = max(self.workers, key=lambda worker: worker.overloaded)
+            if busiest.overloaded < self.patience or len(busiest.sessions) < 2:
+                return
+            target = self._least_loaded(exclude=busiest)
+            if target is None:
+                return
+            # Only move when the session fits there
+            share = busiest.load / len(busiest.sessions)
+            if target.load + share > self.overload:
+                return
+            session = busiest.sessions[-1]
+            try:
+                self._call(busiest, "remove", session.name)
+            except RuntimeError as e:
+                logging.error(str(e))
+                return
+            busiest.sessions.remove(session)
+            del self._sessions[session.name]
+            try:
+                self._place(target, session)
+            except RuntimeError as e:
+                logging.error(str(e))
+                try:
+                    self._place(busiest, session)
+                except RuntimeError as e:
+                    logging.error("Session {} lost: {}".format(session.name, e))
+                return
+            # Let both measure their new load first
+            busiest.overloaded = 0
+            target.overloaded = 0
+            self.migrated += 1
+            logging.info("Session {} moved from worker {} to worker {}".format(
+                session.name, busiest.index, target.index))
+
+
+def run_worker(conn, index, policy=None):
+    """
+    Worker process main, answers the ShardPool commands until exit
+    """
+    import gi
+    gi.require_version('Gst', '1.0')
+    from gi.repository import Gst, GLib
+    from gst.pygst import MediaEngine
+
+    Gst.init(None)
+    loop = GLib.MainLoop()
+    engine = MediaEngine("shard-%d" % index, loop, policy)
+    thread = threading.Thread(target=loop.run, daemon=True)
+    thread.start()
+    sessions = {}
+
+    def add(session):
+        for name, desc, fallback in session.pipes:
+            engine.create_pipe(name, desc, fallback)
+        hook = None
+        if session.setup:
+            module, function = session.setup.split(":")
+            hook = getattr(importlib.import_module(module), function)(
+                engine, session.name, [pipe[0] for pipe in session.pipes])
+        for name, _, _ in session.pipes:
+            engine.play_pipe(name)
+        sessions[session.name] = (session, hook)
+
+    def remove(name):
+        session, hook = sessions.pop(name)
+        for pipe, _, _ in session.pipes:
+            engine.stop_pipe(pipe)
+            engine.delete_pipe(pipe)
+
+    def stats():
+        return {
+            "cpu": time.process_time(),
+            "engine": engine.stats(),
+            "setup": {name: hook.stats() for name, (_, hook) in sessions.items() if hasattr(hook, "stats")},
+        }
+
+    commands = {"add": add, "remove": remove, "stats": stats}
+    while True:
+        try:
+            command, args = conn.recv()
+        except EOFError:
+            break
+        if command == "exit":
+            for name in list(sessions):
+                remove(name)
+            conn.send(("ok", None))
+            break
+        try:
+            conn.send(("ok", commands[command](*args)))
+        except Exception as e:
+            logging.exception("Worker {} failed {}".format(index, command))
+            conn.send(("error", str(e)))
+    loop.quit()
+    thread.join()
@@ -0,0 +1,173 @@
+import array
+import logging
+import threading
+import time
+
+
+class TimeSeries(object):
+    """
+    Fixed size ring of (timestamp, value) samples stored in flat arrays
+    """
+    def __init__(self, size):
+        self.size = size
+        self._times = array.array('d', [0.0] * size)
+        self._values = array.array('d', [0.0] * size)
+        self._count = 0
+
+    def __len__(self):
+        return min(self._count, self.size)
+
+    def append(self, timestamp, value):
+        idx = self._count % self.size
+        self._times[idx] = timestamp
+        self._values[idx] = value
+        self._count += 1
+
+    def last(self, count=None):
+        """
+        Returns up to count (timestamp, value) samples, oldest first
+        """
+        count = len(self) if count is None else min(count, len(self))
+        return [(self._times[i % self.size], self._values[i % self.size])
+                for i in range(self._count - count, self._count)]
+
+    def mean(self, count=None):
+        samples = self.last(count)
+        if not samples:
+            return None
+        return sum(value for _, value in samples) / len(samples)
+
+
+class Stage(object):
+    """
+    A pipeline stage: a leaky queue followed by a passthrough videorate
+    whose in/out counters give the frames that made it through
+    """
+    def __init__(self, name, pipe, rate, queue=None, upstream=None):
+        self.name = name
+        self.pipe = pipe
+        self.rate = rate
+        self.queue = queue
+        self.upstream = upstream
+
+    def reads(self):
+        uri = "/pipelines/%s/elements/%s/properties/%s"
+        commands = [["read", uri % (self.pipe, self.rate, "in")]]
+        if self.queue:
+            commands.append(["read", uri % (self.pipe, self.queue, "current-level-buffers")])
+            commands.append(["read", uri % (self.pipe, self.queue, "max-size-buffers")])
+        return commands
+
+
+class HealthSampler(object):
+    """
+    Periodically samples the frame counters and queue levels of a set of
+    stages with a single batch of gstd reads, and keeps the per stage
+    FPS, drop rate and queue occupancy as fixed size time series
+
+    The drop rate of a stage is the share of its upstream stage frames
+    that never reached it, i.e. what its leaky queue discarded.
+    """
+    def __init__(self, gstd_client, stages, period=1.0, history=300):
+        self._client = gstd_client
+        self.stages = list(stages)
+        self.period = period
+        self.series = {
+            stage.name: {
+                "fps": TimeSeries(history),
+                "drop_rate": TimeSeries(history),
+                "occupancy": TimeSeries(history),
+            }
+            for stage in self.stages
+        }
+        self._frames = {}
+        self._last = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def sample(self):
+        commands = []
+        for stage in self.stages:
+            commands += stage.reads()
+        results = iter(self._client.execute_many(commands, ordered=False))
+        now = time.monotonic()
+        frames = {}
+        levels = {}
+        for stage in self.stages:
+            frames[stage.name] = value(next(results))
+            if stage.queue:
+                level, size = value(next(results)), value(next(results))
+                if level is not None and size:
+                    levels[stage.name] = level / size
+
+        if self._last is not None:
+            elapsed = now - self._last
+            deltas = {}
+            for stage in self.stages:
+                current, previous = frames[stage.name], self._frames.get(stage.name)
+                if current is not None and previous is not None:
+                    deltas[stage.name] = max(current - previous, 0)
+                    self.series[stage.name]["fps"].append(now, deltas[stage.name] / elapsed)
+            for stage in self.stages:
+                upstream = deltas.get(stage.upstream)
+                if stage.name in deltas and upstream:
+                    drops = max(upstream - deltas[stage.name], 0) / upstream
+                    self.series[stage.name]["drop_rate"].append(now, drops)
+        for name, occupancy in levels.items():
+            self.series[name]["occupancy"].append(now, occupancy)
+        self._frames = frames
+        self._last = now
+
+    def bottleneck(self, window=10):
+        """
+        Returns the name of the stage losing the most frames recently,
+        ties broken by queue occupancy, or None without data
+        """
+        def score(stage):
+            series = self.series[stage.name]
+            return (series["drop_rate"].mean(window) or 0.0, series["occupancy"].mean(window) or 0.0)
+        scored = [(score(stage), stage.name) for stage in self.stages]
+        best = max(scored, default=None)
+        if not best or best[0] == (0.0, 0.0):
+            return None
+        return best[1]
+
+    def report(self, window=10):
+        report = {}
+        for stage in self.stages:
+            series = self.series[stage.name]
+            report[stage.name] = {
+                "fps": series["fps"].mean(window),
+                "drop_rate": series["drop_rate"].mean(window),
+                "occupancy": series["occupancy"].mean(window),
+            }
+        return {"stages": report, "bottleneck": self.bottleneck(window)}
+
+    def _run(self):
+        while not self._stop.wait(self.period):
+            try:
+                self.sample()
+            except Exception:
+                logging.exception("Pipeline health sampling failed")
+                continue
+            bottleneck = self.bottleneck()
+            if bottleneck:
+                logging.debug("Pipeline bottleneck: {}".format(bottleneck))
+
+
+def value(result):
+    try:
+        return float(result["response"]["value"])
+    except (KeyError, TypeError, ValueError):
+        return None
@@ -0,0 +1,337 @@
+import collections
+import logging
+import threading
+import time
+
+import health
+
+# Names of the shared inference pipeline and its interpipe nodes
+INFERENCE_PIPE = "inference"
+INFERENCE_SOURCE = "inference_src"
+INFERENCE_OUTPUT = "inference_out"
+INFERENCE_FPS = "inference_fps"
+# Frame counter at the shared input, and queue and frame-skip stage of the net
+INFERENCE_INPUT_RATE = "source_rate"
+INFERENCE_QUEUE = "net_queue"
+INFERENCE_SKIP = "net_rate"
+
+POLICIES = ("round-robin", "fair")
+
+
+class StreamStats(object):
+    """
+    Class used to store the scheduling counters of a stream
+    """
+    def __init__(self, priority):
+        self.priority = priority
+        self.served_time = 0.0
+        self.frames = 0
+        self.slices = 0
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.ready_since = time.monotonic()
+
+
+class InferenceScheduler(object):
+    """
+    Shares a single inference pipeline between several sessions
+
+    The shared pipeline listens to one session at a time. Every time
+    slice the scheduler picks the next session, points the shared
+    interpipesrc at its frames and routes the annotated output back to
+    that session's output and snapshot sources, while the other sessions
+    fall back to their raw frames. Switching goes through gstd, so the
+    granularity is a time slice instead of a single frame.
+
+    With N sessions each one is only covered 1/N of the time: between
+    its slices a session gets no detections nor alerts, and its output
+    shows the raw frames instead of the annotated ones.
+
+    Frames of the previous session are still in the net for a while
+    after a switch: a session only gets the annotated output settle
+    seconds after the net switched to it, and detections are credited
+    with session_at(), from the switch history and the settle time, not
+    with current.
+
+    Policies
+    --------
+    round-robin : sessions take turns in order
+    fair : the session with the least served time per priority goes next
+    """
+    def __init__(self, gstd_client, sessions, names, policy="round-robin", slice_time=0.5,
+                 priorities=None, settle=0.2):
+        if policy not in POLICIES:
+            raise RuntimeError("Unknown inference scheduling policy {}".format(policy))
+        self._client = gstd_client
+        self._names = names
+        self.sessions = list(sessions)
+        self.policy = policy
+        self.slice_time = slice_time
+        self.settle = settle
+        priorities = priorities or {}
+        self._stats = {s: StreamStats(float(priorities.get(s, 1))) for s in self.sessions}
+        self._next = 0
+        self._current = None
+        self._slice_start = None
+        self._frames_start = None
+        self._started = None
+        # (time, session) of the recent switches, oldest first
+        self._history = collections.deque(maxlen=64)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def current(self):
+        return self._current
+
+    def session_at(self, timestamp):
+        """
+        Returns the session whose frames were in the net at timestamp, a
+        time.monotonic() value, or None before the first slice
+        """
+        with self._lock:
+            session = None
+            for switched, listened in self._history:
+                if switched + self.settle > timestamp:
+                    break
+                session = listened
+            # Older than the history: the oldest slice is the best guess
+            if session is None and self._history:
+                session = self._history[0][1]
+        return session
+
+    def start(self):
+        self._stop.clear()
+        self._started = time.monotonic()
+        self._switch(self._pick())
+        if len(self.sessions) > 1:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        """
+        Returns the inference FPS, queue wait and share of every stream
+        """
+        now = time.monotonic()
+        elapsed = max(now - (self._started or now), 1e-9)
+        report = {}
+        with self._lock:
+            for session, stats in self._stats.items():
+                report[session] = {
+                    "priority": stats.priority,
+                    "inference_fps": stats.frames / elapsed,
+                    "share": stats.served_time / elapsed,
+                    "slices": stats.slices,
+                    "queue_wait_avg": stats.wait_total / stats.waits if stats.waits else 0.0,
+                    "queue_wait_max": stats.wait_max,
+                }
+        return report
+
+    def _run(self):
+        while not self._stop.wait(self.slice_time):
+            self._switch(self._pick())
+
+    def _pick(self):
+        if self.policy == "round-robin":
+            session = self.sessions[self._next % len(self.sessions)]
+            self._next += 1
+            return session
+        # Fair: least served time weighted by priority, longest wait breaks ties
+        return min(self.sessions, key=lambda s: (self._stats[s].served_time / self._stats[s].priority,
+                                                 self._stats[s].ready_since))
+
+    def _frames(self):
+        value = self._client.gstd_element_get(INFERENCE_PIPE, INFERENCE_FPS, "frames-rendered")
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
+    def _switch(self, session):
+        now = time.monotonic()
+        frames = self._frames()
+        previous = self._current
+        with self._lock:
+            if previous:
+                stats = self._stats[previous]
+                stats.served_time += now - self._slice_start
+                if frames is not None and self._frames_start is not None:
+                    stats.frames += frames - self._frames_start
+                stats.ready_since = now
+            if session == previous:
+                self._slice_start = now
+                self._frames_start = frames
+                return
+            stats = self._stats[session]
+            wait = now - stats.ready_since
+            stats.waits += 1
+            stats.wait_total += wait
+            stats.wait_max = max(stats.wait_max, wait)
+            stats.slices += 1
+
+        # In order, so no session shows the frames of another: the previous
+        # session back to its raw frames, the net to the new session, and
+        # the new session to the net output once the frames of the
+        # previous one are out of the net
+        if previous:
+            self._client.execute_many(self._route(previous, self._names(previous)["frames"]), ordered=False)
+        self._client.element_set(INFERENCE_PIPE, INFERENCE_SOURCE, "listen-to", self._names(session)["frames"])
+        with self._lock:
+            self._current = session
+            self._slice_start = time.monotonic()
+            self._frames_start = frames
+            self._history.append((self._slice_start, session))
+        logging.debug("Inference scheduled for session {}".format(session))
+        self._stop.wait(self.settle)
+        self._client.execute_many(self._route(session, INFERENCE_OUTPUT), ordered=False)
+
+    def _route(self, session, node):
+        names = self._names(session)
+        return [["element_set", names["live"], names["output"], "listen-to", node],
+                ["element_set", names["snapshot"], names["jpeg"], "listen-to", node]]
+
+
+class InferenceRateController(object):
+    """
+    Closed loop control of the frames sent to the net
+
+    The videorate in front of net.sink_model is a frame-skip stage: its
+    max-rate caps the inference rate while the bypass and overlay keep
+    the full frame rate. Every period the controller measures the input,
+    inference and output FPS from the pipeline counters. While frames
+    wait in the net queue the net is saturated and its latency is
+    estimated with Little's law, (queued + 1) / inference FPS.
+
+    Frames lost in the leaky net queue, a latency over the frame budget
+    or an output falling behind the input mean the net does not keep up:
+    the rate is cut to a fraction of what it actually achieved. With
+    headroom the rate grows back step by step, up to the input rate.
+    Every change is logged with its reason.
+    """
+    def __init__(self, gstd_client, budget=0.1, min_rate=1, max_rate=30, step=1, decrease=0.8,
+                 tolerance=0.1, period=1.0):
+        """
+        Parameters
+        ----------
+        budget : float
+            Target inference latency per frame, in seconds
+        min_rate, max_rate : int
+            Limits of the inference rate, in frames per second
+        step : int
+            Frames per second added per period with headroom
+        decrease : float
+            Factor applied to the achieved rate when overloaded
+        tolerance : float
+            Share of the input frames that may be lost before acting
+        """
+        self._client = gstd_client
+        self.budget = budget
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.step = step
+        self.decrease = decrease
+        self.tolerance = tolerance
+        self.period = period
+        self.rate = None
+        self.decisions = collections.deque(maxlen=100)
+        self._last = None
+        self._counters = None
+        self._measured = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._set_rate(self.max_rate, "initial rate")
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        return {
+            "rate": self.rate,
+            "measured": dict(self._measured),
+            "decisions": list(self.decisions),
+        }
+
+    def measure(self):
+        """
+        Reads the counters, returns the rates since the previous call or
+        None on the first call and on read errors
+        """
+        uri = "/pipelines/%s/elements/%s/properties/%s"
+        commands = [["read", uri % (INFERENCE_PIPE, INFERENCE_INPUT_RATE, "out")],
+                    ["read", uri % (INFERENCE_PIPE, INFERENCE_SKIP, "in")],
+                    ["read", uri % (INFERENCE_PIPE, INFERENCE_SKIP, "out")],
+                    ["read", uri % (INFERENCE_PIPE, INFERENCE_QUEUE, "current-level-buffers")],
+                    ["read", uri % (INFERENCE_PIPE, INFERENCE_FPS, "frames-rendered")]]
+        values = [health.value(r) for r in self._client.execute_many(commands, ordered=False)]
+        now = time.monotonic()
+        if None in values:
+            return None
+        counters, level = values[:3] + values[4:], values[3]
+        previous, last = self._counters, self._last
+        self._counters, self._last = counters, now
+        if previous is None:
+            return None
+        elapsed = now - last
+        input_fps, queued_fps, inference_fps, output_fps = [
+            max(current - before, 0) / elapsed for current, before in zip(counters, previous)]
+        self._measured = {
+            "input_fps": input_fps,
+            "inference_fps": inference_fps,
+            "output_fps": output_fps,
+            # Frames the leaky queue discarded before the frame-skip stage
+            "lost": max(input_fps - queued_fps, 0) / input_fps if input_fps else 0.0,
+            "latency": (level + 1) / inference_fps if level and inference_fps else None,
+        }
+        return self._measured
+
+    def adjust(self, measured):
+        input_fps = measured["input_fps"]
+        if not input_fps:
+            return
+        latency = measured["latency"]
+        achieved = measured["inference_fps"]
+        if measured["lost"] > self.tolerance:
+            reason = "net queue lost %.0f%% of the frames" % (100 * measured["lost"])
+        elif latency is not None and latency > self.budget:
+            reason = "latency %.0f ms over the %.0f ms budget" % (1e3 * latency, 1e3 * self.budget)
+        elif measured["output_fps"] < input_fps * (1 - self.tolerance):
+            reason = "output at %.1f of %.1f fps" % (measured["output_fps"], input_fps)
+        else:
+            if self.rate < min(self.max_rate, input_fps):
+                self._set_rate(self.rate + self.step, "headroom at %.1f fps" % achieved)
+            return
+        self._set_rate(achieved * self.decrease, reason)
+
+    def _set_rate(self, rate, reason):
+        rate = int(max(self.min_rate, min(self.max_rate, rate)))
+        if rate == self.rate:
+            return
+        logging.info("Inference rate {} -> {} fps: {}".format(self.rate, rate, reason))
+        self.decisions.append({"time": time.time(), "from": self.rate, "to": rate, "reason": reason})
+        self.rate = rate
+        self._client.element_set(INFERENCE_PIPE, INFERENCE_SKIP, "max-rate", rate)
+
+    def _run(self):
+        while not self._stop.wait(self.period):
+            try:
+                measured = self.measure()
+                if measured:
+                    self.adjust(measured)
+            except Exception:
+                logging.exception("Inference rate control failed")
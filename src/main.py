@@ -1,13 +1,24 @@
 #!/usr/bin/env python3
 
+import argparse
 from gst import gstc
+from gst.dispatcher import SignalDispatcher
+from gst.metrics import MetricsServer
+from gst import description
+import inference
+import capture
+import snapshot
+import alerts
+import health
+import detections
+import rules
+import profiles
 import logging
 import gi
 import sys
 import time
 import json
 import subprocess
-import threading
 import os
 
 # Setup
@@ -18,6 +29,8 @@ logfile_name =  "gst-inference-demo.log"
 tinyyolo_labels_file = open("tinyyolov2_labels.txt", "r")
 tinyyolo_labels = tinyyolo_labels_file.read()
 tinyyolo_labels_file.close()
+label_names = tinyyolo_labels.strip().split(";")
+person_label = label_names.index("person")
 
 # Absolute Path where models are found
 models_path = os.path.dirname(os.path.realpath(__file__)) + "/"
@@ -25,24 +38,59 @@ models_path = os.path.dirname(os.path.realpath(__file__)) + "/"
 # Pipelines definitions
 
 webrtc_base_pipeline = " rrwebrtcbin start-call=true signaler=GstOwrSignaler signaler::server_url=https://webrtc.ridgerun.com:8443 "
+webrtc_pipeline = webrtc_base_pipeline + "signaler::session_id=%(session_id)s name=%(name)s "
+webrtc_sink_pad = "video_sink"
 rstp_source_pipeline = " rtspsrc debug=true async-handling=true location=rtsp://"
-camera_source_pipeline = " nvarguscamerasrc sensor-id=0 ! nvvidconv ! capsfilter caps=video/x-raw,width=752,height=480 "
-video_decode_pipeline = " rtpvp8depay ! omxvp8dec ! nvvidconv ! capsfilter caps=video/x-raw(memory:NVMM) ! nvvidconv "
+rtsp_pipeline = rstp_source_pipeline + "%(address)s:%(port)s/test "
+camera_source_pipeline = " nvarguscamerasrc sensor-id=%s ! nvvidconv ! capsfilter caps=video/x-raw,width=752,height=480 "
+video_decode_pipeline = " rtpvp8depay name=depay ! omxvp8dec ! nvvidconv ! capsfilter caps=video/x-raw(memory:NVMM) ! nvvidconv "
 interpipesink_pipeline = " interpipesink enable-last-sample=false forward-eos=true forward-events=true async=false name="
 interpipesrc_pipeline = " interpipesrc format=3 enable-sync=false name="
-video_encode_pipeline = " queue max-size-buffers=1 leaky=downstream ! omxvp8enc ! rtpvp8pay"
+video_encode_pipeline = " queue name=encode_queue max-size-buffers=1 leaky=downstream ! videorate drop-only=true name=encode_rate ! omxvp8enc ! rtpvp8pay name=pay"
 tee_pipeline = " tee name="
 jpeg_base_pipeline = " nvjpegenc name="
-multifilesink_pipeline = " multifilesink location=/tmp/output%d.jpeg sync=false"
+jpeg_encoder = "nvjpegenc"
+multifilesink_pipeline = " multifilesink location=/tmp/output%d.jpeg max-files=100 sync=false"
+shmsink_pipeline = " queue max-size-buffers=1 leaky=downstream ! capsfilter caps=video/x-raw,format=I420 ! shmsink wait-for-connection=false sync=false socket-path="
+counter_pipeline = " videorate drop-only=true name="
+fpsdisplaysink_pipeline = " fpsdisplaysink video-sink=fakesink text-overlay=false signal-fps-measurements=false sync=false name="
 
 # Inference (Tinyyolov2)
 tinyyolov2_format_pipeline = " capsfilter caps=video/x-raw,width=752,height=480 "
 tinyyolov2_base_pipeline = """ tinyyolov2 model-location=""" + models_path + \
     """graph_tinyyolov2_tensorflow.pb backend=tensorflow backend::input-layer=input/Placeholder backend::output-layer=add_8 name=net """
-tinyyolov2_net_pipeline = " queue max-size-buffers=1 leaky=downstream ! nvvidconv ! capsfilter caps=video/x-raw(memory:NVMM) ! nvvidconv ! net.sink_model "
-tinyyolov2_bypass_pipeline = " queue max-size-buffers=1 leaky=downstream ! net.sink_bypass "
+tinyyolov2_net_pipeline = " queue name=net_queue max-size-buffers=1 leaky=downstream ! videorate drop-only=true name=net_rate ! nvvidconv ! capsfilter caps=video/x-raw(memory:NVMM) ! nvvidconv ! net.sink_model "
+tinyyolov2_bypass_pipeline = " queue name=bypass_queue max-size-buffers=1 leaky=downstream ! videorate drop-only=true name=bypass_rate ! net.sink_bypass "
 tinyyolov2_overlay_pipeline = """ net.src_bypass ! nvvidconv ! capsfilter caps=video/x-raw(memory:NVMM) ! nvvidconv ! detectionoverlay labels=\"""" + tinyyolo_labels + \
-    """\" ! inferencealert name=person-alert label-index=14 ! queue max-size-buffers=1 leaky=downstream ! nvvidconv ! capsfilter caps=video/x-raw(memory:NVMM)  ! nvvidconv ! capsfilter caps=video/x-raw """
+    """\" ! inferencealert name=person-alert label-index=""" + str(person_label) + """ ! queue name=overlay_queue max-size-buffers=1 leaky=downstream ! videorate drop-only=true name=overlay_rate ! nvvidconv ! capsfilter caps=video/x-raw(memory:NVMM)  ! nvvidconv ! capsfilter caps=video/x-raw """
+
+
+def profile_fragments(profile, delay=0.03):
+    # The fragments above, with the hardware specific ones swapped for the platform ones
+    fragments = {
+        "webrtc_pipeline": webrtc_pipeline,
+        "webrtc_sink_pad": webrtc_sink_pad,
+        "rtsp_pipeline": rtsp_pipeline,
+        "camera_source_pipeline": camera_source_pipeline,
+        "video_decode_pipeline": video_decode_pipeline,
+        "interpipesink_pipeline": interpipesink_pipeline,
+        "interpipesrc_pipeline": interpipesrc_pipeline,
+        "video_encode_pipeline": video_encode_pipeline,
+        "tee_pipeline": tee_pipeline,
+        "jpeg_base_pipeline": jpeg_base_pipeline,
+        "jpeg_encoder": jpeg_encoder,
+        "multifilesink_pipeline": multifilesink_pipeline,
+        "shmsink_pipeline": shmsink_pipeline,
+        "counter_pipeline": counter_pipeline,
+        "fpsdisplaysink_pipeline": fpsdisplaysink_pipeline,
+        "tinyyolov2_format_pipeline": tinyyolov2_format_pipeline,
+        "tinyyolov2_base_pipeline": tinyyolov2_base_pipeline,
+        "tinyyolov2_net_pipeline": tinyyolov2_net_pipeline,
+        "tinyyolov2_bypass_pipeline": tinyyolov2_bypass_pipeline,
+        "tinyyolov2_overlay_pipeline": tinyyolov2_overlay_pipeline,
+    }
+    fragments.update(profiles.fragments(profile, delay))
+    return fragments
 
 
 def gstd(arg1="", arg2=""):
@@ -50,12 +98,32 @@ def gstd(arg1="", arg2=""):
         gstd_bin = subprocess.check_output(['which',GSTD_PROCNAME])
         gstd_bin = gstd_bin.rstrip()
         subprocess.Popen([gstd_bin, arg1, arg2])
-        time.sleep(3)
+        return True
     except subprocess.CalledProcessError:
         logging.error("GStreamer Daemon running error.")
         return False
 
 
+class StartupReport(object):
+    # Time spent in every startup phase
+    def __init__(self):
+        self.phases = []
+        self._start = time.monotonic()
+        self._last = self._start
+
+    def mark(self, phase):
+        now = time.monotonic()
+        self.phases.append((phase, now - self._last))
+        logging.info(" Startup phase %s took %.3f s" % (phase, now - self._last))
+        self._last = now
+
+    def show(self):
+        print("\n Startup report:")
+        for phase, seconds in self.phases:
+            print("  %-22s %8.3f s" % (phase, seconds))
+        print("  %-22s %8.3f s" % ("total", self._last - self._start))
+
+
 def logger_setup():
     logging.basicConfig(filename=logfile_name,
                         format='%(asctime)s,%(msecs)d %(name)s %(levelname)s %(message)s',
@@ -63,146 +131,357 @@ def logger_setup():
                         level=logging.DEBUG)
 
 
-def take_snapshot (gstd_client):
-    gstd_client.pipeline_play("p1")
-    gstd_client.bus_read ("p1")
-    gstd_client.pipeline_stop("p1")
-
-
-def person_alert_handler (name, gstd_client):
-    while 1:
-        ret = gstd_client.signal_connect("p0", "person-alert", "alert")
-        if (ret["response"] == None):
-            logging.info (" Closing GStreamer Daemon...")
-            gstd ("-k")
-            time.sleep(2)
-            break
-        if (ret["code"] == 0):
-            logging.info ("Person Detected")
-            take_snapshot (gstd_client)
-            print ("--> Person detected, snapshot has been taken")
-        else:
-            break
-
-
-def build_test(gstd_client, test_name, default_data):
+def session_names(test_name):
+    # Every session gets its own pipelines and interpipe nodes
+    return {
+        "live": test_name + "_p0",
+        "snapshot": test_name + "_p1",
+        "camera": test_name + "_camera",
+        "decodesink": test_name + "_decodesink",
+        "frames": test_name + "_frames",
+        "source": test_name + "_src0",
+        "output": test_name + "_src1",
+        "jpeg": test_name + "_src2",
+    }
+
+
+def take_snapshot (gstd_client, test_name):
+    snapshot_pipe = session_names(test_name)["snapshot"]
+    with gstd_client.batch() as snapshot:
+        snapshot.pipeline_play(snapshot_pipe)
+        snapshot.bus_read(snapshot_pipe)
+        snapshot.pipeline_stop(snapshot_pipe)
+
+
+def alert_snapshot_action (frame_capture, snapshots):
+    count = [0]
+    def on_alert(test_name, events):
+        # Frames around the first detection of the coalesced alert
+        label, ret = events[0]
+        frames = frame_capture.frames_around(ret["timestamp"])
+        snapshots.submit(frames, "%s_alert%d" % (test_name, count[0]))
+        count[0] += 1
+        print ("--> " + label + " detected in " + test_name + ", snapshot has been taken")
+    return on_alert
+
+
+def person_alert_handler (alert_scheduler, scheduler, detection_ring, rule_engine=None):
+    def on_alert(key, ret):
+        # The shared net only runs on one session at a time, the one
+        # whose frames it was fed when the signal came
+        test_name = scheduler.session_at(ret["timestamp"])
+        if test_name is None:
+            return
+        logging.info ("Person Detected in " + test_name)
+        # The signal carries neither confidence nor box
+        detection_ring.append(test_name, [person_label], [float("nan")], [[float("nan")] * 4])
+        # With rules, the engine raises the alerts from the detections
+        if rule_engine is None:
+            alert_scheduler.submit(test_name, "person", ret, ret["timestamp"])
+    return on_alert
+
+
+def rule_alert_action (alert_scheduler):
+    def on_rule(test_name, rule_name, event):
+        # Detections are stamped with time.time(), the alert actions use time.monotonic()
+        event["timestamp"] = time.monotonic() - (time.time() - event["timestamp"])
+        alert_scheduler.submit(test_name, rule_name, event, event["timestamp"])
+    return on_rule
+
+
+def load_rules(path):
+    with open(path) as json_file:
+        return [rules.Rule.from_dict(config) for config in json.load(json_file)]
+
+
+def alerts_closed_handler (key):
+    logging.info (" Closing GStreamer Daemon...")
+    gstd ("-k")
+
+
+def build_test(test_name, default_data, fragments):
     session_id = default_data[test_name]["session_id"]
     rtsp_ip_address = default_data[test_name]["rtsp_ip_address"]
     rtsp_port = default_data[test_name]["rtsp_port"]
+    sensor_id = default_data[test_name].get("sensor_id", "0")
+    names = session_names(test_name)
 
     # Create Pipelines
-    webrtc_name = test_name + ".video_sink"
-    webrtc = webrtc_base_pipeline + "signaler::session_id=" + session_id
-    webrtc += " name=" + test_name
+    webrtc_name = test_name + "." + fragments["webrtc_sink_pad"]
+    webrtc = fragments["webrtc_pipeline"] % {"session_id": session_id, "name": test_name}
 
-    rtsp = rstp_source_pipeline + rtsp_ip_address + ":" + rtsp_port + "/test"
+    rtsp = fragments["rtsp_pipeline"] % {"address": rtsp_ip_address, "port": rtsp_port}
 
-    interpipesink0_name = test_name + "_camera"
-    interpipesink1_name = test_name + "_decodesink"
-    interpipesink2_name = test_name + "_inferencesink"
+    camera = fragments["camera_source_pipeline"] % sensor_id
+    video_receive0 = fragments["interpipesink_pipeline"] + names["camera"]
 
-    video_receive0 = interpipesink_pipeline + interpipesink0_name
+    video_receive1 = fragments["video_decode_pipeline"] + \
+        " ! " + fragments["tinyyolov2_format_pipeline"] + " ! "
+    video_receive1 += fragments["interpipesink_pipeline"] + names["decodesink"]
 
-    video_receive1 = video_decode_pipeline + \
-        " ! " + tinyyolov2_format_pipeline + " ! "
-    video_receive1 += interpipesink_pipeline + interpipesink1_name
+    select = fragments["interpipesrc_pipeline"] + names["source"] + " listen-to=" + names["decodesink"]
+    select += " ! " + fragments["interpipesink_pipeline"] + names["frames"]
 
-    inference = tinyyolov2_base_pipeline
-    inference += interpipesrc_pipeline + "src0" + " listen-to=" + interpipesink1_name
-    inference += " ! " + tee_pipeline + "t0"
-    inference += " t0. ! " + tinyyolov2_net_pipeline
-    inference += " t0. ! " + tinyyolov2_bypass_pipeline
-    inference += tinyyolov2_overlay_pipeline
+    video_send = fragments["interpipesrc_pipeline"] + names["output"] + " listen-to=" + names["frames"]
+    # Frames offered to the encode queue, to count what it drops
+    video_send += " ! " + fragments["counter_pipeline"] + "send_rate"
+    video_send += " ! " + fragments["video_encode_pipeline"]
 
-    video_send = inference + " ! " + interpipesink_pipeline + interpipesink2_name
-    video_send += interpipesrc_pipeline + "src1" + " listen-to=" + interpipesink2_name
-    video_send += " ! " + video_encode_pipeline
-    
-    full_pipe = webrtc + "  " + camera_source_pipeline + " ! " + video_receive0 + \
-        rtsp + " ! " + video_receive1 + video_send + " ! " + webrtc_name
+    full_pipe = webrtc + "  " + camera + " ! " + video_receive0 + \
+        rtsp + " ! " + video_receive1 + select + video_send + " ! " + webrtc_name
 
     logging.info(" Test name: " + test_name)
     logging.info(
-        " Description: RTSP + GstInterpipe + GstInference Detection + GstWebRTC on GStreamer Daemon")
+        " Description: RTSP + GstInterpipe + GstWebRTC on GStreamer Daemon, shared GstInference Detection")
     logging.debug(" Pipeline: " + full_pipe)
-    gstd_client.pipeline_create("p0", full_pipe)
 
-    jpeg_pipe = interpipesrc_pipeline + "src2" + " listen-to=" + interpipesink2_name \
+    jpeg_pipe = fragments["interpipesrc_pipeline"] + names["jpeg"] + " listen-to=" + names["frames"] \
         + " num-buffers=1"
-    jpeg_pipe += " ! " + jpeg_base_pipeline + test_name + "_jpeg_sink"
-    jpeg_pipe += " ! " + multifilesink_pipeline
-
-    gstd_client.pipeline_create("p1", jpeg_pipe)
-
-
-def app_menu (gstd_client):
-
-    # Bus Filter definition
-    gstd_client.bus_filter ("p1", "eos")
+    jpeg_pipe += " ! " + fragments["jpeg_base_pipeline"] + test_name + "_jpeg_sink"
+    jpeg_pipe += " ! " + fragments["multifilesink_pipeline"]
+
+    return [(names["live"], full_pipe), (names["snapshot"], jpeg_pipe)]
+
+
+def build_inference(sessions, fragments):
+    # Single net shared by every session, the scheduler picks its input
+    shared = fragments["tinyyolov2_base_pipeline"]
+    shared += fragments["interpipesrc_pipeline"] + inference.INFERENCE_SOURCE + " listen-to=" + session_names(sessions[0])["frames"]
+    shared += " ! " + fragments["counter_pipeline"] + "source_rate"
+    shared += " ! " + fragments["tee_pipeline"] + "t0"
+    shared += " t0. ! " + fragments["tinyyolov2_net_pipeline"]
+    shared += " t0. ! " + fragments["tinyyolov2_bypass_pipeline"]
+    shared += fragments["tinyyolov2_overlay_pipeline"]
+    shared += " ! " + fragments["tee_pipeline"] + "t1"
+    shared += " t1. ! " + fragments["interpipesink_pipeline"] + inference.INFERENCE_OUTPUT
+    shared += " t1. ! queue max-size-buffers=1 leaky=downstream ! " + fragments["fpsdisplaysink_pipeline"] + inference.INFERENCE_FPS
+    shared += " t1. ! " + fragments["shmsink_pipeline"] + capture.CAPTURE_SOCKET
+
+    logging.debug(" Shared inference pipeline: " + shared)
+    return (inference.INFERENCE_PIPE, shared)
+
+
+def health_stages(sessions):
+    # Counters and leaky queues named in the pipeline fragments
+    stages = [
+        health.Stage("source", inference.INFERENCE_PIPE, "source_rate"),
+        health.Stage("net", inference.INFERENCE_PIPE, "net_rate", "net_queue", "source"),
+        health.Stage("bypass", inference.INFERENCE_PIPE, "bypass_rate", "bypass_queue", "source"),
+        health.Stage("overlay", inference.INFERENCE_PIPE, "overlay_rate", "overlay_queue", "bypass"),
+    ]
+    for test_name in sessions:
+        live = session_names(test_name)["live"]
+        stages.append(health.Stage(test_name + "_send", live, "send_rate"))
+        stages.append(health.Stage(test_name + "_encode", live, "encode_rate", "encode_queue", test_name + "_send"))
+    return stages
+
+
+def optimize_pipes(pipes):
+    # Collapse the conversion chains the fragments leave back to back
+    report = description.OptimizeReport()
+    pipes = [(name, description.optimize(desc, report)) for name, desc in pipes]
+    logging.info(" Conversions removed per frame: " + json.dumps(report.as_dict()))
+    return pipes
+
+
+def bring_up(gstd_client, default_params, fragments, optimize=False):
+    # Sessions are independent, so every step runs for all of them at once
+    sessions = list(default_params)
+    pipes = [build_inference(sessions, fragments)]
+    for test_name in sessions:
+        pipes += build_test(test_name, default_params, fragments)
+    if optimize:
+        pipes = optimize_pipes(pipes)
+    gstd_client.execute_many(
+        [["pipeline_create", name, desc] for name, desc in pipes], ordered=False)
+    gstd_client.execute_many(
+        [["bus_filter", session_names(test_name)["snapshot"], "eos"] for test_name in sessions] +
+        [["pipeline_play", session_names(test_name)["live"]] for test_name in sessions] +
+        [["pipeline_play", inference.INFERENCE_PIPE]],
+        ordered=False)
+    return sessions
+
+
+def tear_down(gstd_client, sessions):
+    gstd_client.execute_many(
+        [["pipeline_stop", session_names(test_name)["live"]] for test_name in sessions] +
+        [["pipeline_stop", inference.INFERENCE_PIPE]], ordered=False)
+    gstd_client.execute_many(
+        [["pipeline_delete", session_names(test_name)[pipe]]
+         for test_name in sessions for pipe in ("live", "snapshot")] +
+        [["pipeline_delete", inference.INFERENCE_PIPE]], ordered=False)
+
+
+def app_menu (gstd_client, sessions, sampler):
+    test_name = sessions[0]
 
     while True:
+        names = session_names(test_name)
         choice = input(
-                "\n    ** Menu **\n 1) Camera source\n 2) RTSP source\n 3) Take snapshot\n 4) Exit\n > ")
+                "\n    ** Menu (" + test_name + ") **\n 1) Camera source\n 2) RTSP source\n 3) Take snapshot"
+                "\n 4) Select session\n 5) Pipeline health\n 6) Exit\n > ")
         choice = choice.lower()  # Convert input to "lowercase"
 
         if choice == '1':
             gstd_client.element_set(
-                "p0",
-                "src0",
+                names["live"],
+                names["source"],
                 "listen-to",
-                "Test0_camera")
+                names["camera"])
             print("--> Camera source selected\n")
         if choice == '2':
             gstd_client.element_set(
-                "p0",
-                "src0",
+                names["live"],
+                names["source"],
                 "listen-to",
-                "Test0_decodesink")
+                names["decodesink"])
             print("--> RTSP source selected\n")
         if choice == '3':
-            take_snapshot (gstd_client)
+            take_snapshot (gstd_client, test_name)
             print("--> Snapshot has been taken\n")
         if choice == '4':
-            gstd_client.pipeline_stop("p0")
+            selected = input(" Sessions: " + ", ".join(sessions) + "\n > ")
+            if selected in sessions:
+                test_name = selected
+                print("--> Session " + test_name + " selected\n")
+        if choice == '5':
+            print(json.dumps(sampler.report(), indent=2))
+        if choice == '6':
             print("--> Exit\n")
             break
 
 
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description="GstInference demo")
+    parser.add_argument("--startup-report", action="store_true",
+                        help="print the time spent in each startup phase")
+    parser.add_argument("--startup-timeout", type=float, default=30.0,
+                        help="seconds to wait for gstd and the pipelines to be ready")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="serve the gstd client metrics on this local HTTP port")
+    parser.add_argument("--profile", choices=profiles.PROFILES, default="jetson",
+                        help="platform the pipeline elements are picked for")
+    parser.add_argument("--inference-budget", type=float, default=0.1,
+                        help="target inference latency per frame, in seconds")
+    parser.add_argument("--inference-delay", type=float, default=0.03,
+                        help="seconds per frame of the inference stand-in, software profile only")
+    parser.add_argument("--detections-spill", default=None,
+                        help="memory mapped file keeping the detections history")
+    parser.add_argument("--rules", default=None,
+                        help="JSON file of alert rules evaluated over the detections, see rules.json")
+    parser.add_argument("--optimize", action="store_true",
+                        help="collapse redundant conversions before creating the pipelines")
+    return parser.parse_args(args)
+
+
 def main(args=None):
+    args = parse_args(args)
     print ("\n Starting GstInference Application...")
+    report = StartupReport()
 
     # Logger Setup
     logger_setup()
+    fragments = profile_fragments(args.profile, args.inference_delay)
 
     # Start GSTD
     logging.info(" Startin GStreamer Daemon... ")
     gstd("-n", "2")
-
-    gstd_client = gstc.client()
-    gstd_client2 = gstc.client(port=5001)
+    for port in (5000, 5001):
+        if not gstc.wait_for_gstd(port=port, timeout=args.startup_timeout):
+            logging.error(" GStreamer Daemon is not answering on port %d" % port)
+    report.mark("gstd ready")
 
     # Load the JSON default parameters as a dictionary
     with open('./pipe_config.json') as json_file:
         default_params = json.load(json_file)
 
-    # Build pipelines
-    build_test(gstd_client, "Test0", default_params)
-
-    # Play pipeline P0
-    gstd_client.pipeline_play("p0")
-    time.sleep (15)
-
-    # Person Alert Thread
-    x = threading.Thread(target=person_alert_handler, args=(1,gstd_client2))
-    x.daemon = True
-    x.start()
+    gstd_client = gstc.client(pool_size=max(4, 2 * len(default_params)))
+    dispatcher = SignalDispatcher(port=5001, max_watches=max(32, len(default_params)))
+    report.mark("clients")
+
+    # Build and play the pipelines of every session
+    sessions = bring_up(gstd_client, default_params, fragments, args.optimize)
+    report.mark("pipelines created")
+    for pipe in [session_names(s)["live"] for s in sessions] + [inference.INFERENCE_PIPE]:
+        gstd_client.wait_pipeline_state(pipe, "PLAYING", args.startup_timeout)
+    report.mark("pipelines playing")
+
+    # Share the inference between sessions
+    scheduler = inference.InferenceScheduler(
+        gstd_client, sessions, session_names, policy="fair",
+        priorities={s: default_params[s].get("priority", 1) for s in sessions})
+    scheduler.start()
+
+    # Skip frames before the net when it does not keep up
+    rate_controller = inference.InferenceRateController(gstd_client, args.inference_budget)
+    rate_controller.start()
+
+    # Keep the latest inference frames for the alerts
+    frame_capture = capture.FrameCapture()
+    frame_capture.start()
+    snapshots = snapshot.SnapshotService(encoder=fragments["jpeg_encoder"])
+    snapshots.start()
+
+    # Detections history
+    detection_ring = detections.DetectionRing(spill=args.detections_spill)
+
+    # Person Alerts
+    alert_scheduler = alerts.AlertScheduler(
+        alert_snapshot_action(frame_capture, snapshots),
+        {s: default_params[s].get("alerts", {}) for s in sessions})
+    rule_engine = None
+    if args.rules:
+        rule_engine = rules.RuleEngine(load_rules(args.rules), label_names,
+                                       rule_alert_action(alert_scheduler))
+        rule_engine.start(detection_ring)
+    if args.profile in profiles.ALERT_PROFILES:
+        dispatcher.watch(inference.INFERENCE_PIPE, "person-alert", "alert",
+                         person_alert_handler(alert_scheduler, scheduler, detection_ring, rule_engine),
+                         alerts_closed_handler)
+    else:
+        logging.warning(" The {} profile has no alert element, person alerts are off".format(args.profile))
+    dispatcher.start()
+    report.mark("alerts")
+    metrics_server = None
+    if args.metrics_port:
+        metrics_server = MetricsServer([gstd_client.metrics, dispatcher.metrics], args.metrics_port)
+        metrics_server.start()
+    if args.startup_report:
+        report.show()
+
+    # Pipeline health
+    sampler = health.HealthSampler(gstd_client, health_stages(sessions))
+    sampler.start()
 
     # Run Menu
     try:
-        app_menu (gstd_client)
-    except:
-        gstd_client.pipeline_stop("p0")
+        app_menu (gstd_client, sessions, sampler)
+    except (EOFError, KeyboardInterrupt):
+        pass
+    except Exception:
+        logging.exception("Menu failed")
+    # First, so deleting the pipelines does not look like gstd closing the alerts
+    dispatcher.stop()
+    sampler.stop()
+    logging.info(" Pipeline health: " + json.dumps(sampler.report()))
+    scheduler.stop()
+    logging.info(" Inference stats: " + json.dumps(scheduler.stats()))
+    rate_controller.stop()
+    logging.info(" Inference rate control: " + json.dumps(rate_controller.stats()))
+    if rule_engine:
+        rule_engine.stop()
+        logging.info(" Rule stats: " + json.dumps(rule_engine.stats()))
+    alert_scheduler.flush()
+    logging.info(" Alert stats: " + json.dumps(alert_scheduler.stats()))
+    detection_ring.flush()
+    logging.info(" Detection stats: " + json.dumps(detection_ring.stats()))
+    frame_capture.stop()
+    snapshots.stop()
+    logging.info(" Snapshot stats: " + json.dumps(snapshots.stats()))
+    tear_down(gstd_client, sessions)
+    if metrics_server:
+        metrics_server.stop()
 
 
 if __name__ == "__main__":
-    main(None)
+    main()
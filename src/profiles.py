@@ -0,0 +1,80 @@
+"""
+Platform profiles of the pipeline fragments
+
+The fragments in main.py target the Jetson: Argus camera, NVMM
+conversions, OMX codecs, nvjpegenc, WebRTC and the TinyYolo net. A
+profile maps the hardware specific fragments to the elements available
+on another platform, keeping the element names the rest of the
+application relies on (queues, rate counters, interpipe nodes, the net
+and the alert element), so the same topology can run anywhere.
+"""
+
+PROFILES = ("jetson", "software")
+# Profiles whose overlay is an inferencealert, the only element emitting
+# the person alert signal
+ALERT_PROFILES = ("jetson",)
+
+# Software equivalent of the Jetson capture format
+SOFTWARE_CAPS = "video/x-raw,width=752,height=480,framerate=30/1"
+# Stand-in for the NVMM hops: a real conversion of the I420 frames to
+# RGBA and back, which description.optimize() collapses
+SOFTWARE_HOP_CAPS = "video/x-raw,format=RGBA,width=752,height=480"
+
+
+def fragments(profile="jetson", delay=0.03):
+    """
+    Returns the fragment overrides of a profile, by main.py name
+    Parameters
+    ----------
+    profile : str
+        One of PROFILES, jetson keeps the main.py fragments
+    delay : float
+        Seconds the inference stand-in holds every frame, software only
+    Raises
+    ------
+    RuntimeError:
+        In case the profile is unknown
+    """
+    if profile == "jetson":
+        return {}
+    if profile == "software":
+        return software(delay)
+    raise RuntimeError("Unknown platform profile {}".format(profile))
+
+
+def software(delay=0.03):
+    # identity sleep-time is in microseconds
+    sleep = int(delay * 1e6)
+    return {
+        # WebRTC and RTSP endpoints become a fake sink and a local VP8 RTP stream
+        "webrtc_pipeline": " fakesink sync=false async=false name=%(name)s ",
+        "webrtc_sink_pad": "sink",
+        "rtsp_pipeline": " videotestsrc is-live=true pattern=ball ! capsfilter caps=" + SOFTWARE_CAPS +
+                         " ! vp8enc deadline=1 ! rtpvp8pay ",
+        "camera_source_pipeline": " videotestsrc is-live=true pattern=smpte name=camera%s ! capsfilter caps=" +
+                                  SOFTWARE_CAPS + " ",
+        # Conversion chains mirror the Jetson ones, an RGBA round trip standing in for NVMM
+        "video_decode_pipeline": " rtpvp8depay name=depay ! vp8dec ! videoconvert ! capsfilter caps=" +
+                                 SOFTWARE_HOP_CAPS + " ! videoconvert ",
+        "video_encode_pipeline": " queue name=encode_queue max-size-buffers=1 leaky=downstream ! "
+                                 "videorate drop-only=true name=encode_rate ! vp8enc deadline=1 ! rtpvp8pay name=pay",
+        "jpeg_base_pipeline": " jpegenc name=",
+        "jpeg_encoder": "jpegenc",
+        # The net is split in two identity stand-ins holding each frame for the
+        # inference time: the model branch ends in a fakesink and the bypass
+        # branch feeds the overlay, as net.src_bypass does. The person-alert
+        # identity only keeps the element name, it emits no alert signal
+        "tinyyolov2_base_pipeline": "",
+        "tinyyolov2_net_pipeline": " queue name=net_queue max-size-buffers=1 leaky=downstream ! "
+                                   "videorate drop-only=true name=net_rate ! "
+                                   "videoconvert ! capsfilter caps=" + SOFTWARE_HOP_CAPS + " ! videoconvert ! "
+                                   "identity name=net sleep-time=%d ! fakesink sync=false async=false " % sleep,
+        "tinyyolov2_bypass_pipeline": " queue name=bypass_queue max-size-buffers=1 leaky=downstream ! "
+                                      "videorate drop-only=true name=bypass_rate ! "
+                                      "identity name=net_bypass sleep-time=%d " % sleep,
+        "tinyyolov2_overlay_pipeline": " ! videoconvert ! capsfilter caps=" + SOFTWARE_HOP_CAPS + " ! videoconvert ! "
+                                       "identity name=person-alert ! "
+                                       "queue name=overlay_queue max-size-buffers=1 leaky=downstream ! "
+                                       "videorate drop-only=true name=overlay_rate ! videoconvert ! "
+                                       "capsfilter caps=" + SOFTWARE_HOP_CAPS + " ! videoconvert ! capsfilter caps=video/x-raw ",
+    }
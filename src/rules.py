@@ -0,0 +1,252 @@
+import logging
+import threading
+import time
+
+import numpy as np
+
+
+
+class Rule(object):
+    """
+    Class used to store an alert rule
+
+    A detection matches when its label is in labels, its confidence is
+    at least min_confidence or unknown and, given a zone, the center of
+    its box is inside the zone polygon, in pixels. The rule is hit on the frames of a session
+    with at least min_count matches, and fires once the hits have lasted
+    dwell seconds; it fires again only after a frame without a hit, or no
+    hit for gap seconds, since frames without detections are not stored.
+    """
+    def __init__(self, name, labels, min_confidence=0.0, zone=None, min_count=1, dwell=0.0,
+                 sessions=None, gap=1.0):
+        self.name = name
+        self.labels = list(labels)
+        self.min_confidence = min_confidence
+        self.zone = [tuple(point) for point in zone] if zone else None
+        self.min_count = min_count
+        self.dwell = dwell
+        self.sessions = list(sessions) if sessions else None
+        self.gap = gap
+
+    @classmethod
+    def from_dict(cls, config):
+        return cls(config["name"], config["labels"], config.get("min_confidence", 0.0),
+                   config.get("zone"), config.get("min_count", 1), config.get("dwell", 0.0),
+                   config.get("sessions"), config.get("gap", 1.0))
+
+
+def inside(points, polygon):
+    """
+    Returns which (D, 2) points are inside a polygon, by ray casting
+    against all its edges at once
+    """
+    polygon = np.asarray(polygon, dtype=float)
+    xi, yi = polygon[:, 0], polygon[:, 1]
+    xj, yj = np.roll(xi, 1), np.roll(yi, 1)
+    px, py = points[:, 0:1], points[:, 1:2]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        crossing = ((yi > py) != (yj > py)) & (px < (xj - xi) * (py - yi) / (yj - yi) + xi)
+    return crossing.sum(axis=1) % 2 == 1
+
+
+class RuleEngine(object):
+    """
+    Evaluates every alert rule over batches of detections at once
+
+    The rules are compiled into arrays: a rule by label matrix, the
+    confidence thresholds, counts and dwell times, and a rule by session
+    matrix. A batch of DETECTION_DTYPE records is evaluated with a few
+    array operations for all the rules, sessions and frames in it; the
+    point in polygon test runs once per distinct zone. Frames are the
+    (session, timestamp) groups of the batch; the dwell state moves one
+    frame per session at a time, for all the sessions together.
+
+    Per rule metrics count the frames hit and the alerts fired, and
+    split the evaluation cost: the shared steps evenly between the
+    rules, each zone test between the rules using it.
+    """
+    def __init__(self, rules, labels, action=None):
+        """
+        Parameters
+        ----------
+        rules : list
+            Rule objects
+        labels : list
+            Label names by index, as given to the net
+        action : callable
+            Called as action(session, rule_name, event) for every alert
+        """
+        self.rules = list(rules)
+        self.labels = list(labels)
+        self._action = action
+        count = len(self.rules)
+        self._label_mask = np.zeros((count, len(self.labels)), dtype=bool)
+        for r, rule in enumerate(self.rules):
+            for label in rule.labels:
+                self._label_mask[r, label if isinstance(label, int) else self.labels.index(label)] = True
+        self._min_confidence = np.array([rule.min_confidence for rule in self.rules], dtype=np.float32)
+        self._min_count = np.array([rule.min_count for rule in self.rules])
+        self._dwell = np.array([rule.dwell for rule in self.rules], dtype=float)
+        self._gap = np.array([rule.gap for rule in self.rules], dtype=float)
+        zones = sorted({tuple(rule.zone) for rule in self.rules if rule.zone})
+        self._zones = [list(zone) for zone in zones]
+        # Zone index per rule, -1 without zone
+        self._rule_zone = np.array([zones.index(tuple(rule.zone)) if rule.zone else -1
+                                    for rule in self.rules], dtype=int)
+        self._session_mask = np.zeros((count, 0), dtype=bool)
+        # Dwell state by rule and session: start and last frame of the hits
+        self._since = np.zeros((count, 0))
+        self._last = np.zeros((count, 0))
+        self._fired = np.zeros((count, 0), dtype=bool)
+        self.evaluations = 0
+        self.hits = np.zeros(count, dtype=int)
+        self.fires = np.zeros(count, dtype=int)
+        self.cost = np.zeros(count)
+        self._cursor = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, ring, period=0.2):
+        """
+        Evaluates the detections added to a DetectionRing every period
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(ring, period), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def evaluate(self, batch, session_names=None):
+        """
+        Evaluates a batch of detections, returns the alerts fired
+        Parameters
+        ----------
+        batch : array
+            DETECTION_DTYPE records, as views or copies
+        session_names : dict
+            Session name by session id, as numbered by the DetectionRing
+        Returns
+        -------
+        list
+            (session, rule name, event) tuples
+        """
+        if not len(batch) or not self.rules:
+            return []
+        with self._lock:
+            return self._evaluate(batch, session_names or {})
+
+    def stats(self):
+        with self._lock:
+            return {
+                rule.name: {
+                    "hits": int(self.hits[r]),
+                    "fires": int(self.fires[r]),
+                    "cost": float(self.cost[r]),
+                    "cost_per_evaluation": float(self.cost[r]) / self.evaluations if self.evaluations else None,
+                }
+                for r, rule in enumerate(self.rules)
+            }
+
+    def _evaluate(self, batch, session_names):
+        start = time.perf_counter()
+        count = len(self.rules)
+        sessions = batch["session"].astype(int)
+        self._grow(sessions.max() + 1, session_names)
+
+        # Rules by detections: labels, confidence and sessions
+        match = self._label_mask[:, batch["label"]]
+        # NaN confidences come from sources that only report the label
+        match &= ~(batch["confidence"][None, :] < self._min_confidence[:, None])
+        match &= self._session_mask[:, sessions]
+        shared = time.perf_counter() - start
+
+        # Zones, one point in polygon test per distinct zone
+        boxes = batch["box"]
+        centers = boxes[:, :2] + boxes[:, 2:] / 2
+        for z, zone in enumerate(self._zones):
+            zone_start = time.perf_counter()
+            users = self._rule_zone == z
+            match[users] &= inside(centers, zone)[None, :]
+            self.cost[users] += (time.perf_counter() - zone_start) / users.sum()
+
+        # Matches per frame, frames in time order
+        step = time.perf_counter()
+        frames, frame_of = np.unique(np.stack([batch["timestamp"], sessions]), axis=1, return_inverse=True)
+        frame_of = frame_of.reshape(-1)
+        order = np.argsort(frame_of, kind="stable")
+        starts = np.searchsorted(frame_of[order], np.arange(frames.shape[1]))
+        counts = np.add.reduceat(match[:, order], starts, axis=1, dtype=int)
+        hit = counts >= self._min_count[:, None]
+        self.hits += hit.sum(axis=1)
+
+        # The dwell state of a session depends on its previous frame, the
+        # n-th frames of all the sessions are updated together
+        timestamps, frame_sessions = frames[0], frames[1].astype(int)
+        order = np.lexsort((timestamps, frame_sessions))
+        first = np.searchsorted(frame_sessions[order], frame_sessions[order], "left")
+        rank = np.empty(len(order), dtype=int)
+        rank[order] = np.arange(len(order)) - first
+        alerts = []
+        for n in range(rank.max() + 1):
+            f = np.nonzero(rank == n)[0]
+            timestamp, session = timestamps[f], frame_sessions[f]
+            hits = hit[:, f]
+            since, last, fired = self._since[:, session], self._last[:, session], self._fired[:, session]
+            ended = ~hits | (timestamp - last > self._gap[:, None])
+            since[ended] = np.nan
+            fired[ended] = False
+            started = hits & np.isnan(since)
+            since = np.where(started, timestamp, since)
+            last = np.where(hits, timestamp, last)
+            fire = hits & ~fired & (timestamp - since >= self._dwell[:, None])
+            fired |= fire
+            self._since[:, session], self._last[:, session], self._fired[:, session] = since, last, fired
+            self.fires += fire.sum(axis=1)
+            for r, i in zip(*np.nonzero(fire)):
+                alerts.append((session_names.get(session[i], int(session[i])), self.rules[r].name, {
+                    "timestamp": float(timestamp[i]),
+                    "count": int(counts[r, f[i]]),
+                    "dwell": float(timestamp[i] - since[r, i]),
+                }))
+        alerts.sort(key=lambda alert: alert[2]["timestamp"])
+
+        shared += time.perf_counter() - step
+        self.cost += shared / count
+        self.evaluations += 1
+        return alerts
+
+    def _grow(self, size, session_names):
+        # New sessions get their column in the session mask and dwell state
+        known = self._session_mask.shape[1]
+        if size <= known:
+            return
+        column = np.zeros((len(self.rules), size - known), dtype=bool)
+        for s in range(known, size):
+            name = session_names.get(s, s)
+            for r, rule in enumerate(self.rules):
+                column[r, s - known] = rule.sessions is None or name in rule.sessions
+        self._session_mask = np.concatenate([self._session_mask, column], axis=1)
+        self._since = np.concatenate([self._since, np.full(column.shape, np.nan)], axis=1)
+        self._last = np.concatenate([self._last, np.full(column.shape, np.nan)], axis=1)
+        self._fired = np.concatenate([self._fired, np.zeros(column.shape, dtype=bool)], axis=1)
+
+    def _run(self, ring, period):
+        while not self._stop.wait(period):
+            batch, self._cursor = ring.since(self._cursor)
+            if not len(batch):
+                continue
+            names = {session_id: name for name, session_id in list(ring.sessions.items())}
+            try:
+                alerts = self.evaluate(batch, names)
+            except Exception:
+                logging.exception("Alert rule evaluation failed")
+                continue
+            for session, rule, event in alerts:
+                logging.info("Rule {} fired in session {}".format(rule, session))
+                if self._action:
+                    self._action(session, rule, event)
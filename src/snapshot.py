@@ -0,0 +1,285 @@
+import collections
+import glob
+import logging
+import os
+import queue
+import threading
+import time
+
+import gi
+gi.require_version('Gst', '1.0')
+gi.require_version('GstVideo', '1.0')
+from gi.repository import Gst, GstVideo, GLib
+
+from gst.pygst import MediaEngine
+import capture
+
+SNAPSHOT_PIPE = "snapshot"
+SNAPSHOT_SRC = "snapshot_src"
+SNAPSHOT_SINK = "snapshot_sink"
+
+
+class RetentionPolicy(object):
+    """
+    Limits on the snapshots kept on disk, None disables a limit
+    """
+    def __init__(self, max_files=1000, max_bytes=512 * 1024 * 1024, max_age=24 * 3600):
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+
+class SnapshotService(object):
+    """
+    Encodes captured frames to JPEG through an always running pipeline
+
+    The appsrc ! encoder ! appsink pipeline stays in PLAYING and is warmed
+    up with a blank frame, so a snapshot only pushes buffers. Every
+    pushed buffer gets a PTS of its own, which the encoder keeps, and the
+    encoded image is matched to its file by that PTS, so a frame the
+    encoder drops or a pipeline restart does not shift the file names of
+    the next ones. Encoded images are written by a bounded pool of
+    writer threads which fsync each batch of files together, and a
+    retention policy prunes the oldest snapshots by count, size and age.
+    """
+    def __init__(self, directory="/tmp", prefix="snapshot", caps=capture.CAPTURE_CAPS,
+                 encoder="nvjpegenc", writers=2, queue_size=64, fsync_batch=8,
+                 retention=None):
+        Gst.init(None)
+        self.directory = directory
+        self.prefix = prefix
+        self.caps = caps
+        self.encoder = encoder
+        self.fsync_batch = fsync_batch
+        self.retention = retention or RetentionPolicy()
+        self.written = 0
+        self.dropped = 0
+        self.pruned = 0
+        self._writers = writers
+        self._queue = queue.Queue(queue_size)
+        # PTS of the pushed buffers to (submit time, path), in push order
+        self._pending = collections.OrderedDict()
+        self._sequence = 0
+        self._push_lock = threading.Lock()
+        self._files = collections.deque()
+        self._files_bytes = 0
+        self._files_lock = threading.Lock()
+        self._latencies = collections.deque(maxlen=1024)
+        self._completed = collections.deque(maxlen=1024)
+        self._counter = 0
+        self._loop = GLib.MainLoop()
+        self._engine = MediaEngine(SNAPSHOT_PIPE, self._loop)
+        self._threads = []
+
+    def start(self):
+        self._scan_existing()
+        desc = "appsrc name={} caps={} format=time is-live=true ! {} ! " \
+               "appsink name={} emit-signals=true sync=false".format(
+                   SNAPSHOT_SRC, self.caps, self.encoder, SNAPSHOT_SINK)
+        self._engine.create_pipe(SNAPSHOT_PIPE, desc)
+        self._src = self._engine.get_element(SNAPSHOT_PIPE, SNAPSHOT_SRC)
+        sink = self._engine.get_element(SNAPSHOT_PIPE, SNAPSHOT_SINK)
+        sink.connect("new-sample", self._on_sample)
+        self._engine.play_pipe(SNAPSHOT_PIPE)
+        self._threads = [threading.Thread(target=self._loop.run, daemon=True)]
+        for _ in range(self._writers):
+            self._threads.append(threading.Thread(target=self._run_writer, daemon=True))
+        for thread in self._threads:
+            thread.start()
+        self._warmup()
+
+    def stop(self):
+        self._engine.stop_pipe(SNAPSHOT_PIPE)
+        self._loop.quit()
+        for _ in range(self._writers):
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def submit(self, frames, name=None):
+        """
+        Queues frames for encoding
+        Parameters
+        ----------
+        frames : list
+            (timestamp, Gst.Buffer) tuples, as returned by FrameRing.around
+        name : str
+            Snapshot name, a counter is used by default
+        Returns
+        -------
+        list
+            Paths the JPEG files will be written to
+        """
+        start = time.monotonic()
+        paths = []
+        with self._push_lock:
+            if name is None:
+                name = str(self._counter)
+                self._counter += 1
+            for i, (_, buffer) in enumerate(frames):
+                path = os.path.join(self.directory, "%s_%s_%d.jpeg" % (self.prefix, name, i))
+                if self._push(buffer.copy(), start, path) != Gst.FlowReturn.OK:
+                    logging.error("Snapshot encoder refused frame {}".format(path))
+                    continue
+                paths.append(path)
+        return paths
+
+    def stats(self):
+        """
+        Returns latency percentiles, throughput and file counters
+        """
+        latencies = sorted(self._latencies)
+        completed = list(self._completed)
+        throughput = 0.0
+        if len(completed) > 1 and completed[-1] > completed[0]:
+            throughput = (len(completed) - 1) / (completed[-1] - completed[0])
+        return {
+            "latency_p50": percentile(latencies, 50),
+            "latency_p90": percentile(latencies, 90),
+            "latency_p99": percentile(latencies, 99),
+            "throughput": throughput,
+            "written": self.written,
+            "dropped": self.dropped,
+            "pruned": self.pruned,
+            "queue_depth": self._queue.qsize(),
+            "files": len(self._files),
+            "bytes": self._files_bytes,
+        }
+
+    def _warmup(self):
+        # A blank frame negotiates and allocates the encoder ahead of time
+        size = blank_frame_size(self.caps)
+        if not size:
+            return
+        with self._push_lock:
+            self._push(Gst.Buffer.new_wrapped(bytes(size)), time.monotonic(), None)
+
+    def _push(self, buffer, start, path):
+        # Called with _push_lock held, buffer must be writable
+        pts = self._sequence * Gst.MSECOND
+        self._sequence += 1
+        buffer.pts = pts
+        buffer.dts = Gst.CLOCK_TIME_NONE
+        self._pending[pts] = (start, path)
+        ret = self._src.emit("push-buffer", buffer)
+        if ret != Gst.FlowReturn.OK:
+            del self._pending[pts]
+        return ret
+
+    def _on_sample(self, sink):
+        sample = sink.emit("pull-sample")
+        if not sample:
+            return Gst.FlowReturn.OK
+        buffer = sample.get_buffer()
+        with self._push_lock:
+            if buffer.pts not in self._pending:
+                logging.warning("Snapshot encoder output with unknown PTS {}".format(buffer.pts))
+                return Gst.FlowReturn.OK
+            # Frames pushed before this one and still pending were lost
+            while True:
+                pts, (start, path) = self._pending.popitem(last=False)
+                if pts == buffer.pts:
+                    break
+                if path is not None:
+                    self.dropped += 1
+                    logging.warning("Snapshot {} lost in the encoder".format(path))
+        if path is None:
+            return Gst.FlowReturn.OK
+        data = buffer.extract_dup(0, buffer.get_size())
+        try:
+            self._queue.put_nowait((start, path, data))
+        except queue.Full:
+            self.dropped += 1
+            logging.warning("Snapshot {} dropped, writers are behind".format(path))
+        return Gst.FlowReturn.OK
+
+    def _run_writer(self):
+        while True:
+            batch = [self._queue.get()]
+            while batch[-1] is not None and len(batch) < self.fsync_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            done = batch[-1] is None
+            self._write_batch([item for item in batch if item is not None])
+            if done:
+                return
+
+    def _write_batch(self, batch):
+        if not batch:
+            return
+        written = []
+        for start, path, data in batch:
+            try:
+                snapshot_file = open(path, "wb")
+                snapshot_file.write(data)
+                snapshot_file.flush()
+            except OSError as e:
+                logging.error("Could not write snapshot {}: {}".format(path, e))
+                continue
+            written.append((start, path, len(data), snapshot_file))
+        # One fsync pass for the whole batch, then the directory entries
+        for _, path, _, snapshot_file in written:
+            try:
+                os.fsync(snapshot_file.fileno())
+            except OSError as e:
+                logging.error("Could not sync snapshot {}: {}".format(path, e))
+            finally:
+                snapshot_file.close()
+        try:
+            dir_fd = os.open(self.directory, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+        except OSError as e:
+            logging.error("Could not sync snapshot directory {}: {}".format(self.directory, e))
+
+        now = time.monotonic()
+        with self._files_lock:
+            for start, path, size, _ in written:
+                self._files.append((time.time(), path, size))
+                self._files_bytes += size
+                self._latencies.append(now - start)
+                self._completed.append(now)
+                self.written += 1
+            self._prune()
+
+    def _scan_existing(self):
+        pattern = os.path.join(self.directory, "%s_*.jpeg" % self.prefix)
+        files = []
+        for path in glob.glob(pattern):
+            stat = os.stat(path)
+            files.append((stat.st_mtime, path, stat.st_size))
+        with self._files_lock:
+            self._files = collections.deque(sorted(files))
+            self._files_bytes = sum(size for _, _, size in files)
+            self._prune()
+
+    def _prune(self):
+        policy = self.retention
+        oldest = time.time() - policy.max_age if policy.max_age is not None else None
+        while self._files and (
+                (policy.max_files is not None and len(self._files) > policy.max_files) or
+                (policy.max_bytes is not None and self._files_bytes > policy.max_bytes) or
+                (oldest is not None and self._files[0][0] < oldest)):
+            _, path, size = self._files.popleft()
+            self._files_bytes -= size
+            self.pruned += 1
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def blank_frame_size(caps):
+    info = GstVideo.VideoInfo.new_from_caps(Gst.Caps.from_string(caps))
+    return info.size if info else None
@@ -0,0 +1,237 @@
+import logging
+import time
+
+import numpy as np
+
+# Constant velocity model over (cx, cy, w, h) and their velocities, one frame per step
+STATE_SIZE = 8
+TRANSITION = np.eye(STATE_SIZE)
+TRANSITION[:4, 4:] = np.eye(4)
+MEASUREMENT = np.eye(4, STATE_SIZE)
+
+# Noise, relative to the box height
+STD_POSITION = 1.0 / 20
+STD_VELOCITY = 1.0 / 160
+
+
+def iou(boxes, others):
+    """
+    Returns the IoU matrix of two sets of (x, y, width, height) boxes
+    """
+    x1 = np.maximum(boxes[:, None, 0], others[None, :, 0])
+    y1 = np.maximum(boxes[:, None, 1], others[None, :, 1])
+    x2 = np.minimum(boxes[:, None, 0] + boxes[:, None, 2], others[None, :, 0] + others[None, :, 2])
+    y2 = np.minimum(boxes[:, None, 1] + boxes[:, None, 3], others[None, :, 1] + others[None, :, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    areas = boxes[:, 2] * boxes[:, 3]
+    other_areas = others[:, 2] * others[:, 3]
+    union = areas[:, None] + other_areas[None, :] - intersection
+    return np.where(union > 0, intersection / np.maximum(union, 1e-9), 0.0)
+
+
+def greedy_match(scores, threshold):
+    """
+    Matches rows to columns by descending score, ignoring the pairs
+    below threshold. Returns the matched row and column indices.
+    """
+    rows, cols = np.nonzero(scores >= threshold)
+    order = np.argsort(-scores[rows, cols], kind="stable")
+    used_rows, used_cols = set(), set()
+    matched_rows, matched_cols = [], []
+    for row, col in zip(rows[order], cols[order]):
+        if row in used_rows or col in used_cols:
+            continue
+        used_rows.add(row)
+        used_cols.add(col)
+        matched_rows.append(row)
+        matched_cols.append(col)
+    return np.array(matched_rows, dtype=int), np.array(matched_cols, dtype=int)
+
+
+class Tracker(object):
+    """
+    IoU and Kalman filter tracker of the net detections
+
+    Every track is a constant velocity Kalman filter on its box, and all
+    the tracks are predicted and updated at once as stacked NumPy arrays.
+    On inference frames the predicted boxes are matched to the
+    detections of the same label by IoU; on the frames the net skipped
+    the tracks are only predicted, so the boxes keep moving smoothly
+    between inferences. A track is reported after min_hits matches and
+    dropped after max_misses inference frames without one.
+    """
+    def __init__(self, iou_threshold=0.3, min_hits=2, max_misses=3):
+        self.iou_threshold = iou_threshold
+        self.min_hits = min_hits
+        self.max_misses = max_misses
+        self._mean = np.zeros((0, STATE_SIZE))
+        self._covariance = np.zeros((0, STATE_SIZE, STATE_SIZE))
+        self._ids = np.zeros(0, dtype=int)
+        self._labels = np.zeros(0, dtype=int)
+        self._hits = np.zeros(0, dtype=int)
+        self._misses = np.zeros(0, dtype=int)
+        self._next_id = 0
+
+    def __len__(self):
+        return len(self._ids)
+
+    def step(self, boxes=None, labels=None):
+        """
+        Advances the tracks one frame
+        Parameters
+        ----------
+        boxes : array
+            (M, 4) detected (x, y, width, height) boxes of an inference
+            frame, None on the frames the net skipped
+        labels : array
+            (M,) label indices of the detections, all 0 by default
+        Returns
+        -------
+        tuple
+            ids, (N, 4) boxes and labels of the reported tracks
+        """
+        self._predict()
+        if boxes is not None:
+            boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+            labels = np.zeros(len(boxes), dtype=int) if labels is None else np.asarray(labels, dtype=int)
+            self._update(boxes, labels)
+        return self.tracks()
+
+    def tracks(self):
+        reported = self._hits >= self.min_hits
+        return self._ids[reported], to_boxes(self._mean[reported, :4]), self._labels[reported]
+
+    def _predict(self):
+        if not len(self):
+            return
+        self._mean = self._mean @ TRANSITION.T
+        self._covariance = TRANSITION @ self._covariance @ TRANSITION.T + \
+            self._noise(STD_POSITION, STD_VELOCITY)
+
+    def _noise(self, std_position, std_velocity, size=STATE_SIZE):
+        heights = self._mean[:, 3]
+        std = np.stack([std_position * heights] * 4 + [std_velocity * heights] * 4, axis=1)[:, :size]
+        noise = np.zeros((len(heights), size, size))
+        idx = np.arange(size)
+        noise[:, idx, idx] = std ** 2
+        return noise
+
+    def _update(self, boxes, labels):
+        scores = iou(to_boxes(self._mean[:, :4]), boxes)
+        # Only detections of the same label continue a track
+        scores[self._labels[:, None] != labels[None, :]] = 0.0
+        rows, cols = greedy_match(scores, self.iou_threshold)
+
+        if len(rows):
+            mean, covariance = self._mean[rows], self._covariance[rows]
+            projected = covariance[:, :4, :4] + self._noise(STD_POSITION, 0, 4)[rows]
+            # Kalman gain K = P H^T S^-1, solved for all the matches at once
+            gain = np.linalg.solve(projected, covariance[:, :4, :]).transpose(0, 2, 1)
+            innovation = to_state(boxes[cols]) - mean[:, :4]
+            self._mean[rows] = mean + np.einsum("nij,nj->ni", gain, innovation)
+            self._covariance[rows] = covariance - gain @ covariance[:, :4, :]
+            self._hits[rows] += 1
+            self._misses[rows] = 0
+
+        unmatched = np.ones(len(self), dtype=bool)
+        unmatched[rows] = False
+        self._misses[unmatched] += 1
+
+        new = np.ones(len(boxes), dtype=bool)
+        new[cols] = False
+        self._add(boxes[new], labels[new])
+        self._remove(self._misses > self.max_misses)
+
+    def _add(self, boxes, labels):
+        if not len(boxes):
+            return
+        mean = np.zeros((len(boxes), STATE_SIZE))
+        mean[:, :4] = to_state(boxes)
+        heights = mean[:, 3:4]
+        std = np.concatenate([2 * STD_POSITION * heights.repeat(4, 1),
+                              10 * STD_VELOCITY * heights.repeat(4, 1)], axis=1)
+        covariance = np.zeros((len(boxes), STATE_SIZE, STATE_SIZE))
+        idx = np.arange(STATE_SIZE)
+        covariance[:, idx, idx] = std ** 2
+        count = len(boxes)
+        self._mean = np.concatenate([self._mean, mean])
+        self._covariance = np.concatenate([self._covariance, covariance])
+        self._ids = np.concatenate([self._ids, np.arange(self._next_id, self._next_id + count)])
+        self._labels = np.concatenate([self._labels, labels])
+        self._hits = np.concatenate([self._hits, np.ones(count, dtype=int)])
+        self._misses = np.concatenate([self._misses, np.zeros(count, dtype=int)])
+        self._next_id += count
+
+    def _remove(self, removed):
+        if not removed.any():
+            return
+        kept = ~removed
+        self._mean = self._mean[kept]
+        self._covariance = self._covariance[kept]
+        self._ids = self._ids[kept]
+        self._labels = self._labels[kept]
+        self._hits = self._hits[kept]
+        self._misses = self._misses[kept]
+
+
+def to_state(boxes):
+    # (x, y, width, height) to (cx, cy, width, height)
+    state = boxes.copy()
+    state[:, :2] += boxes[:, 2:] / 2
+    return state
+
+
+def to_boxes(state):
+    boxes = state.copy()
+    boxes[:, :2] -= state[:, 2:] / 2
+    return boxes
+
+
+class TrackerStage(object):
+    """
+    Runs a Tracker on the frames crossing a pad of a MediaEngine pipeline
+
+    The stage is placed after the net, where every frame passes but only
+    some carry detections. detections(buffer) returns the (boxes, labels)
+    of the frames the net processed and None for the skipped ones, and
+    on_tracks(buffer, ids, boxes, labels) receives the tracked boxes of
+    every frame, to draw or forward them.
+    """
+    def __init__(self, engine, pipe_name, element_name, detections, on_tracks=None, tracker=None,
+                 pad_name="src"):
+        self.tracker = tracker or Tracker()
+        self.frames = 0
+        self.cost = 0.0
+        self._engine = engine
+        self._pad = (pipe_name, element_name, pad_name)
+        self._detections = detections
+        self._on_tracks = on_tracks
+        self._probe = None
+
+    def start(self):
+        self._probe = self._engine.add_probe(*self._pad, self._on_buffer)
+
+    def stop(self):
+        if self._probe is not None:
+            self._engine.remove_probe(*self._pad, self._probe)
+            self._probe = None
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "tracks": len(self.tracker),
+            "cost_per_frame": self.cost / self.frames if self.frames else None,
+        }
+
+    def _on_buffer(self, buffer):
+        start = time.perf_counter()
+        try:
+            found = self._detections(buffer)
+            ids, boxes, labels = self.tracker.step(*(found or (None, None)))
+        except Exception:
+            logging.exception("Tracker failed on frame {}".format(buffer.pts))
+            return
+        self.cost += time.perf_counter() - start
+        self.frames += 1
+        if self._on_tracks:
+            self._on_tracks(buffer, ids, boxes, labels)